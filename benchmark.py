@@ -0,0 +1,390 @@
+#benchmarks for the physics and the rendering. Run with: python benchmark.py [--output results.json] [--compare old.json]
+#everything runs headless (pygame's dummy video driver, no monitor lookup) so it works on a server too
+import argparse, json, os, platform, subprocess, sys, tempfile, time, timeit
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy") #has to be set before pygame opens a display
+
+import numpy as np
+
+import engine
+
+#result names ending in this are rates (higher is better), everything else is seconds per call (lower is better)
+RATE = "/s"
+
+def _legacy_acceleration(x, y, z, xVel, yVel, zVel, l, width=1280, height=800):
+    """
+    Sim's own three acceleration methods (_calc_d2dx, _calc_d2dy and _calc_d2dz) on a Sim
+    holding the given state (floats or arrays). The Sim is only made, never opened, so there
+    is no window. Returns a function that runs all three
+
+    """
+
+    import main
+
+    main.Sim.windowWidth = width #skips looking up the monitor
+    main.Sim.windowHeight = height
+
+    sim = main.Sim(x, y, z, xVel, yVel, zVel, l=l)
+
+    def calc():
+        sim._calc_d2dx()
+        sim._calc_d2dy()
+        sim._calc_d2dz()
+
+    return calc
+
+def _best(func, number, repeat=5):
+    """
+    Best time per call in seconds over a few repeats
+
+    """
+
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+def _best_fresh(make, func, repeat=3):
+    """
+    Best time of func(make()) in seconds, with a new object from make() for every repeat (so
+    a run doesn't start where the last one left off) and only func timed
+
+    """
+
+    times = []
+    for i in range(repeat):
+        thing = make()
+        start = time.perf_counter()
+        func(thing)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+def bench_acceleration(sizes=(1000, 100000), number=20000):
+    """
+    Time the fused acceleration kernel against Sim's three separate methods, for one body
+    (floats) and for arrays of bodies. Returns a dict of seconds per call
+
+    """
+
+    results = {}
+
+    #one body, plain floats
+    state = (0.27, 0.1, 0.05, 0.01, -0.02, 0.0, 0.7)
+    legacy = _legacy_acceleration(*state)
+    engine.acceleration(*state) #compile first if numba is being used
+
+    results["scalar legacy"] = _best(legacy, number)
+    results["scalar fused"] = _best(lambda: engine.acceleration(*state), number)
+
+    #arrays of bodies
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        arrays = [rng.uniform(-1.5, 1.5, n) for i in range(6)] + [0.7]
+        legacy = _legacy_acceleration(*arrays)
+        engine.acceleration(*arrays)
+
+        calls = max(1, number * 10 // n)
+        results["array {} legacy".format(n)] = _best(legacy, calls)
+        results["array {} fused".format(n)] = _best(lambda: engine.acceleration(*arrays), calls)
+
+    return results
+
+def bench_step(number=20000, engineSteps=2000):
+    """
+    Time one "together" step on plain floats (what the worker thread runs), how many steps a
+    second the worker gets through with nothing holding it back, and one Engine step per
+    integrator for a single body
+
+    """
+
+    results = {}
+
+    state = (0.27, 0.1, 0.05, 0.01, -0.02, 0.0, 0.7)
+    engine.together_step(*state, 0.00001)
+    results["together_step"] = _best(lambda: engine.together_step(*state, 0.00001), number)
+
+    from worker import SimulationWorker
+    worker = SimulationWorker(*state, stepsPerSecond=None)
+    worker.start()
+    time.sleep(0.5) #let it get going
+    startSteps, startTime = worker.snapshot.steps, time.perf_counter()
+    time.sleep(1.0)
+    endSteps, endTime = worker.snapshot.steps, time.perf_counter()
+    worker.stop()
+    results["worker steps/s"] = (endSteps - startSteps) / (endTime - startTime)
+
+    from integrators import INTEGRATORS
+    for name in INTEGRATORS:
+        results["engine {}".format(name)] = _best_fresh(lambda: engine.Engine.from_initial(0.27, 0.1, 0.05, l=0.7, integrator=name), lambda sim: sim.step(engineSteps)) / engineSteps
+
+    return results
+
+def bench_sim(frames=120, width=1280, height=800):
+    """
+    Run the real Sim headless without the background thread and time each part of a frame:
+    on_loop (the physics, tPerFrame steps), on_render and the display update. Returns median
+    and 95th percentile seconds per frame and the physics steps per second on_loop keeps up.
+    With the dummy driver the display update is only the cost of the call, not of the screen
+
+    """
+
+    import pygame
+    import main
+
+    main.Sim.windowWidth = width #skips looking up the monitor
+    main.Sim.windowHeight = height
+
+    sim = main.Sim()
+    sim.threaded = False #time the physics in on_loop itself
+    sim.checkpointPath = None #don't leave a checkpoint behind (or time saving one)
+    sim.on_init()
+
+    times = {"on_loop" : [], "on_render" : [], "update_display" : []}
+    try:
+        for i in range(frames):
+            pygame.event.pump()
+            for name, func in (("on_loop", sim.on_loop), ("on_render", sim.on_render), ("update_display", sim.update_display)):
+                start = time.perf_counter()
+                func()
+                times[name].append(time.perf_counter() - start)
+    finally:
+        sim.on_quit()
+
+    results = {}
+    for name, values in times.items():
+        results["{} median".format(name)] = float(np.median(values))
+        results["{} p95".format(name)] = float(np.percentile(values, 95))
+    results["frame median"] = float(np.median(np.sum(list(times.values()), axis=0)))
+    results["on_loop steps/s"] = sim.tPerFrame / results["on_loop median"]
+
+    return results
+
+def bench_trail(sizes=(1200, 20000, 100000), width=1280, height=800):
+    """
+    Time drawing trails of different lengths (a looping path like a real orbit)
+
+    """
+
+    import pygame
+    from trail import Trail
+
+    surface = pygame.Surface((width, height))
+    results = {}
+    for n in sizes:
+        t = np.linspace(0, 60, n)
+        trail = Trail(n)
+        trail.extend(np.stack((0.5*np.cos(t) + 0.2*np.cos(7.3*t), 0.5*np.sin(t) + 0.2*np.sin(7.3*t)), axis=-1))
+
+        calls = max(3, 200000 // n)
+        results["draw {}".format(n)] = _best(lambda: trail.draw(surface, width//2, height//2, 800, 3), calls, repeat=3)
+
+    return results
+
+def bench_cloud(sizes=(1000, 5000, 20000), frameTime=0.01, width=1280, height=800):
+    """
+    Time one frame of the cloud mode for clouds of different sizes: moving it as far as one
+    body moves per frame, drawing it into the pixels, and (for comparison) drawing the same
+    particles as one pygame.draw.circle each
+
+    """
+
+    import pygame
+    from cloud import Cloud
+
+    surface = pygame.Surface((width, height))
+    results = {}
+    for n in sizes:
+        cloud = Cloud.around((0.27, 0, 0, 0, 0, 0), 0.7, count=n, spread=(0.05, 0.05, 0.0))
+        cloud.advance(1.0) #spread out a bit first
+
+        results["advance {}".format(n)] = _best(lambda: cloud.advance(frameTime), 3, repeat=3)
+        results["draw {}".format(n)] = _best(lambda: cloud.draw(surface, width//2, height//2, 800), 10, repeat=3)
+
+        points = np.stack((cloud.ensemble.state[0]*800 + width//2, cloud.ensemble.state[1]*-800 + height//2), axis=-1).tolist()
+        results["circles {}".format(n)] = _best(lambda: [pygame.draw.circle(surface, (80, 160, 255), point, 1) for point in points], 3, repeat=3)
+
+    return results
+
+def bench_hud(number=2000):
+    """
+    Time the HUD text: a cached label, a value that hasn't changed, a value that changes
+    every call, and rendering the same text with the font directly
+
+    """
+
+    import pygame
+    from hud import Hud
+
+    pygame.font.init()
+    font = pygame.font.Font(None, 20)
+    surface = pygame.Surface((400, 100))
+    hud = Hud(font)
+
+    counter = iter(range(10**9))
+    results = {
+        "label" : _best(lambda: hud.label(surface, "initial x velocity value: ", (0, 0)), number),
+        "value unchanged" : _best(lambda: hud.value(surface, "x", " x: 0.2700000000", (0, 0)), number),
+        "value changing" : _best(lambda: hud.value(surface, "x", " x: {:.10f}".format(next(counter)), (0, 0)), number),
+        "font.render" : _best(lambda: surface.blit(font.render(" x: 0.2700000000", True, (255, 255, 255)), (0, 0)), number),
+    }
+
+    return results
+
+def bench_ensemble(sizes=(1, 100, 1000, 10000), integrator="rk4", particleSteps=200000):
+    """
+    Particle steps per second for Ensembles of different sizes (on one core)
+
+    """
+
+    from ensemble import Ensemble
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for n in sizes:
+        #start at rest far enough out that nothing reaches a body (and stops) during the run
+        angle = rng.uniform(0, 2*np.pi, n)
+        radius = rng.uniform(1.5, 2, n)
+        steps = min(max(5, particleSteps // n), 1000)
+
+        seconds = _best_fresh(lambda: Ensemble.from_initial(radius*np.cos(angle), radius*np.sin(angle), 0, l=0.7, integrator=integrator), lambda ensemble: ensemble.step(steps))
+        results["{} particles steps/s".format(n)] = n * steps / seconds
+
+    return results
+
+def bench_scaling(resolution=32, duration=0.5, workers=None):
+    """
+    Chaos map cells per second with 1, 2, 4, ... processes up to the number of cores (or the
+    counts given in workers)
+
+    """
+
+    from chaos_map import compute_map
+
+    if workers is None:
+        cores = os.cpu_count() or 1
+        workers = sorted({min(2**i, cores) for i in range(cores.bit_length() + 1)})
+
+    results = {}
+    for count in workers:
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            compute_map(folder, resolution=resolution, duration=duration, rowsPerChunk=max(1, resolution // (4*count)), workers=count, progress=False)
+            results["{} workers cells/s".format(count)] = resolution**2 / (time.perf_counter() - start)
+
+    return results
+
+BENCHMARKS = {
+    "acceleration" : bench_acceleration,
+    "step" : bench_step,
+    "sim" : bench_sim,
+    "trail" : bench_trail,
+    "cloud" : bench_cloud,
+    "hud" : bench_hud,
+    "ensemble" : bench_ensemble,
+    "scaling" : bench_scaling,
+}
+
+#smaller settings for a quick check
+QUICK = {
+    "acceleration" : {"sizes" : (1000,), "number" : 2000},
+    "step" : {"number" : 2000, "engineSteps" : 200},
+    "sim" : {"frames" : 20},
+    "trail" : {"sizes" : (1200, 20000)},
+    "cloud" : {"sizes" : (1000, 5000)},
+    "hud" : {"number" : 200},
+    "ensemble" : {"sizes" : (1, 1000), "particleSteps" : 20000},
+    "scaling" : {"resolution" : 16, "duration" : 0.2},
+}
+
+def environment():
+    """
+    What the benchmarks were run on: commit, versions and machine
+
+    """
+
+    def git(*args):
+        try:
+            return subprocess.run(("git",) + args, cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    try:
+        import pygame
+        pygameVersion = pygame.version.ver
+    except ImportError:
+        pygameVersion = None
+
+    commit = git("rev-parse", "HEAD")
+    return {
+        "commit" : commit,
+        "dirty" : bool(git("status", "--porcelain", "--untracked-files=no")) if commit else None,
+        "time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python" : platform.python_version(),
+        "numpy" : np.__version__,
+        "pygame" : pygameVersion,
+        "jit" : engine.JIT,
+        "platform" : platform.platform(),
+        "processor" : platform.processor(),
+        "cpus" : os.cpu_count(),
+    }
+
+def run(names=None, quick=False):
+    """
+    Run the benchmarks in names (all of them if None). Returns a dict with the environment and
+    the results of each benchmark, ready to be saved as json
+
+    """
+
+    results = {}
+    for name in names or BENCHMARKS:
+        print("running {}...".format(name), file=sys.stderr)
+        results[name] = BENCHMARKS[name](**(QUICK[name] if quick else {}))
+
+    return {"environment" : environment(), "results" : results}
+
+def compare(old, new):
+    """
+    Ratio of new to old for every result in both, flipped for times so above 1 is always faster
+
+    """
+
+    ratios = {}
+    for group, results in new["results"].items():
+        for name, value in results.items():
+            oldValue = old["results"].get(group, {}).get(name)
+            if oldValue:
+                ratios["{} {}".format(group, name)] = value/oldValue if name.endswith(RATE) else oldValue/value
+
+    return ratios
+
+def _format(name, value):
+    if name.endswith(RATE):
+        return "{:14,.0f} /s".format(value)
+    return "{:14.3f} us".format(value * 1e6)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the physics, the rendering and the parallel maps (headless)")
+    parser.add_argument("--only", choices=BENCHMARKS, nargs="+", default=None, help="benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and fewer repeats")
+    parser.add_argument("--output", default=None, help="save the results to this json file")
+    parser.add_argument("--compare", default=None, help="json file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    report = run(args.only, args.quick)
+
+    for group, results in report["results"].items():
+        print(group)
+        for name, value in results.items():
+            print("  {:>32}: {}".format(name, _format(name, value)))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("compared to {} (above 1 is faster)".format(old["environment"].get("commit")))
+        for name, ratio in compare(old, report).items():
+            print("  {:>40}: {:6.2f}x".format(name, ratio))
+
+if __name__ == "__main__":
+    main()
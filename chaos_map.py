@@ -0,0 +1,256 @@
+#maps of what happens to the third body over a grid of initial conditions
+#run with: python chaos_map.py OUTPUT_FOLDER --resolution 512 --l 0.7 --time 5
+import argparse, json, os, sys, time
+from multiprocessing import Pool
+
+import numpy as np
+
+from engine import make_state
+from ensemble import Ensemble
+from checkpoint import run_checkpointed, save_npz, save_json
+
+#what can be varied over the grid: (first axis, second axis)
+PLANES = {
+    "x-y" : ("x", "y"), #start at rest at (x, y)
+    "x-yvel" : ("x", "yVel"), #start on the x axis at x with y velocity yVel
+}
+
+METRICS = ("collision", "escape", "bound")
+
+def bound_to(state, l):
+    """
+    Which body each third body is gravitationally bound to: 1 or 2 if its two body energy
+    relative to that body is negative (the more negative one if both are), 0 if neither.
+    state is a (6, N) array in the rotating frame
+
+    """
+
+    x, y, z, xVel, yVel, zVel = state
+    energies = []
+    for centerX, mass in ((l, 1 - l), (l - 1, l)):
+        dx = x - centerX
+        #velocity relative to the body in the non rotating frame (add the frame's rotation back in)
+        speed2 = (xVel - y)**2 + (yVel + dx)**2 + zVel**2
+        energies.append(speed2/2 - mass/np.sqrt(dx**2 + y**2 + z**2))
+
+    e1, e2 = energies
+    bound = np.zeros(state.shape[1], dtype=np.int8)
+    bound[(e1 < 0) & ((e1 <= e2) | (e2 >= 0))] = 1
+    bound[(e2 < 0) & (e2 < e1)] = 2
+
+    return bound
+
+def cell_states(first, second, plane="x-y"):
+    """
+    (6, N) state array with one third body per pair of values in first and second (1D arrays,
+    what they are depends on plane)
+
+    """
+
+    n = len(first)
+    initial = {"x" : first, "y" : np.zeros(n), "yVel" : np.zeros(n)}
+    initial[PLANES[plane][1]] = second
+
+    return make_state(initial["x"], initial["y"], 0, yVel=initial["yVel"])
+
+def integrate_cells(first, second, plane="x-y", l=0.7, duration=5.0, integrator="rk4", deltaT=0.001, escapeRadius=10.0, segment=None, checkpoint=None):
+    """
+    Integrate one third body per pair of values in first and second (1D arrays, what they are
+    depends on plane) and return what happened to each one. With segment, the integration is
+    done segment at a time and checkpointed to checkpoint after each, carrying on from there if
+    it is already there (see checkpoint.run_checkpointed)
+
+    """
+
+    make = lambda: Ensemble(cell_states(first, second, plane), l=l, deltaT=deltaT, integrator=integrator, escapeRadius=escapeRadius)
+    if segment is None:
+        ensemble = make()
+        ensemble.run(duration)
+    else:
+        ensemble = run_checkpointed(make, duration, checkpoint, segment)
+
+    return {
+        "collisionTime" : ensemble.collisionTime,
+        "collidedWith" : ensemble.collidedWith,
+        "escapeTime" : ensemble.escapeTime,
+        "boundTo" : np.where(ensemble.active, bound_to(ensemble.state, l), 0).astype(np.int8),
+    }
+
+def _run_chunk(task):
+    """
+    Work for one pool process: integrate a block of rows of the grid and save it
+
+    """
+
+    index, path, function, first, second, settings = task
+    checkpoint = path + ".checkpoint.npz"
+    if "segment" in settings: #checkpointed partway through the chunk, so a long one isn't started over
+        results = function(first, second, checkpoint=checkpoint, **settings)
+    else:
+        results = function(first, second, **settings)
+
+    save_npz(path, **results) #only appears once it is completely written, so a half written chunk is never picked up on resume
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    return index
+
+def check_settings(folder, settings):
+    """
+    Make sure anything already in folder was made with the same settings (saved in
+    folder/settings.json the first time), so resuming never mixes two different runs
+
+    """
+
+    settingsPath = os.path.join(folder, "settings.json")
+    settings = json.loads(json.dumps(settings)) #tuples become lists, like they will be when read back
+    if os.path.exists(settingsPath):
+        with open(settingsPath) as f:
+            saved = json.load(f)
+        if saved != settings:
+            raise ValueError("{} has results with different settings in it, use a new folder".format(folder))
+    else: #written whole, a half written settings file would stop every resume
+        save_json(settingsPath, settings, indent=4)
+
+def compute_map(folder, plane="x-y", firstRange=(-1.5, 1.5), secondRange=(-1.5, 1.5), resolution=512, l=0.7, duration=5.0, integrator="rk4", deltaT=0.001, escapeRadius=10.0, rowsPerChunk=8, workers=None, progress=True,
+                segment=None):
+    """
+    Integrate a resolution x resolution grid of initial conditions spread over a process pool.
+    Each block of rowsPerChunk rows is saved to folder/chunks as soon as it is done, so running
+    again with the same settings picks up where it left off. With segment, each chunk is also
+    checkpointed every segment of simulated time, so long runs lose at most one segment per
+    chunk if they are stopped. Returns a dict with the axes and a (resolution, resolution) array
+    per result, which is also saved to folder/map.npz
+
+    """
+
+    settings = {"plane" : plane, "l" : l, "duration" : duration, "integrator" : integrator, "deltaT" : deltaT, "escapeRadius" : escapeRadius}
+    if segment is not None: #only in the settings when used, so folders from before still resume
+        settings["segment"] = segment
+
+    return compute_grid(folder, integrate_cells, settings, firstRange, secondRange, resolution, rowsPerChunk, workers, progress)
+
+def compute_grid(folder, function, settings, firstRange=(-1.5, 1.5), secondRange=(-1.5, 1.5), resolution=512, rowsPerChunk=8, workers=None, progress=True):
+    """
+    Run function(first, second, **settings) over a grid of initial conditions in a process
+    pool (function has to be defined at the top level of a module so it can be pickled, and
+    return a dict of 1D arrays, one value per cell). settings must have "plane" in it. This is
+    what compute_map uses, and what other per cell calculations (like ftle.compute_ftle) use
+    to get the same chunking and resuming
+
+    """
+
+    plane = settings["plane"]
+    grid = {"firstRange" : list(firstRange), "secondRange" : list(secondRange), "resolution" : resolution, "rowsPerChunk" : rowsPerChunk}
+
+    chunkFolder = os.path.join(folder, "chunks")
+    os.makedirs(chunkFolder, exist_ok=True)
+    check_settings(folder, dict(settings, **grid))
+
+    first = np.linspace(firstRange[0], firstRange[1], resolution)
+    second = np.linspace(secondRange[0], secondRange[1], resolution)
+
+    #rows of the image go along the second axis (top row is the largest value)
+    tasks = []
+    chunkPaths = []
+    for index, start in enumerate(range(0, resolution, rowsPerChunk)):
+        rows = second[::-1][start:start + rowsPerChunk]
+        path = os.path.join(chunkFolder, "chunk_{:05d}.npz".format(index))
+        chunkPaths.append(path)
+
+        if not os.path.exists(path):
+            cellsFirst, cellsSecond = np.meshgrid(first, rows)
+            tasks.append((index, path, function, cellsFirst.ravel(), cellsSecond.ravel(), settings))
+
+    if tasks:
+        started = time.perf_counter()
+        with Pool(workers) as pool:
+            for done, index in enumerate(pool.imap_unordered(_run_chunk, tasks), 1):
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    print("chunk {}/{} done, {:.0f}s elapsed, ~{:.0f}s left".format(done, len(tasks), elapsed, elapsed/done*(len(tasks) - done)), file=sys.stderr)
+
+    #put the chunks back together
+    results = {}
+    for path in chunkPaths:
+        with np.load(path) as chunk:
+            for name in chunk.files:
+                results.setdefault(name, []).append(chunk[name])
+    results = {name : np.concatenate(parts).reshape(resolution, resolution) for name, parts in results.items()}
+
+    results[PLANES[plane][0]] = first
+    results[PLANES[plane][1]] = second[::-1]
+    save_npz(os.path.join(folder, "map.npz"), **results)
+
+    return results
+
+def map_colors(results, metric="collision", duration=None):
+    """
+    (rows, columns, 3) array of colors for a map. collision: red for body 1 and blue for body 2,
+    brighter the sooner it hit. escape: white, brighter the sooner it escaped. bound: red or blue
+    for the body it ended bound to. Black for anything that didn't happen
+
+    """
+
+    shape = results["collidedWith"].shape
+    colors = np.zeros(shape + (3,), dtype=np.uint8)
+
+    if metric == "collision":
+        times = results["collisionTime"]
+        scale = duration if duration is not None else np.nanmax(times) if np.isfinite(times).any() else 1
+        brightness = np.where(np.isfinite(times), 255 * (1 - 0.8*np.nan_to_num(times)/scale), 0).astype(np.uint8)
+        colors[..., 0] = np.where(results["collidedWith"] == 1, brightness, 0)
+        colors[..., 2] = np.where(results["collidedWith"] == 2, brightness, 0)
+
+    elif metric == "escape":
+        times = results["escapeTime"]
+        scale = duration if duration is not None else np.nanmax(times) if np.isfinite(times).any() else 1
+        colors[:] = np.where(np.isfinite(times), 255 * (1 - 0.8*np.nan_to_num(times)/scale), 0).astype(np.uint8)[..., None]
+
+    elif metric == "bound":
+        colors[..., 0] = np.where(results["boundTo"] == 1, 255, 0)
+        colors[..., 2] = np.where(results["boundTo"] == 2, 255, 0)
+
+    else:
+        raise ValueError("metric must be one of: {}".format(", ".join(METRICS)))
+
+    return colors
+
+def save_image(path, colors):
+    """
+    Save a (rows, columns, 3) color array as an image (png, bmp, ... from the extension)
+
+    """
+
+    import pygame #only needed for writing the image, works without a display
+
+    pygame.image.save(pygame.surfarray.make_surface(colors.swapaxes(0, 1)), path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Integrate a grid of initial conditions in parallel and map when/where each one collides or escapes")
+    parser.add_argument("folder", help="folder for the results (chunks, map.npz and the image). Running again on the same folder resumes")
+    parser.add_argument("--plane", choices=PLANES, default="x-y", help="initial conditions to vary: x-y starts at rest at (x, y), x-yvel starts on the x axis with a y velocity")
+    parser.add_argument("--first", type=float, nargs=2, default=(-1.5, 1.5), metavar=("MIN", "MAX"), help="range of the first axis (x)")
+    parser.add_argument("--second", type=float, nargs=2, default=(-1.5, 1.5), metavar=("MIN", "MAX"), help="range of the second axis (y or y velocity)")
+    parser.add_argument("--resolution", type=int, default=512, help="grid is resolution x resolution")
+    parser.add_argument("--l", type=float, default=0.7, help="lambda (0 < lambda < 1)")
+    parser.add_argument("--time", type=float, default=5.0, help="how long to integrate each point for")
+    parser.add_argument("--integrator", default="rk4", help="integrator name (see integrators.py)")
+    parser.add_argument("--deltaT", type=float, default=0.001, help="time step (starting step for adaptive integrators)")
+    parser.add_argument("--escape-radius", type=float, default=10.0, help="distance from the center that counts as escaping")
+    parser.add_argument("--metric", choices=METRICS, default="collision", help="what the image shows")
+    parser.add_argument("--rows-per-chunk", type=int, default=8, help="rows of the grid per saved chunk")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+    parser.add_argument("--segment", type=float, default=None, help="checkpoint every chunk after this much simulated time, so a stopped run carries on partway through its chunks")
+    args = parser.parse_args(argv)
+
+    results = compute_map(args.folder, plane=args.plane, firstRange=args.first, secondRange=args.second, resolution=args.resolution,
+                          l=args.l, duration=args.time, integrator=args.integrator, deltaT=args.deltaT, escapeRadius=args.escape_radius,
+                          rowsPerChunk=args.rows_per_chunk, workers=args.workers, segment=args.segment)
+
+    imagePath = os.path.join(args.folder, "map_{}.png".format(args.metric))
+    save_image(imagePath, map_colors(results, args.metric, duration=args.time))
+    print("saved {} and {}".format(os.path.join(args.folder, "map.npz"), imagePath))
+
+if __name__ == "__main__":
+    main()
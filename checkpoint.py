@@ -0,0 +1,123 @@
+#saving the whole state of a run to disk so it can carry on exactly where it stopped (after a crash, quitting, or the machine being taken away)
+import json, os
+
+import numpy as np
+
+from engine import Engine
+from ensemble import Ensemble
+
+FORMAT_VERSION = 1
+
+#engines that can be saved (see Engine.checkpoint)
+ENGINE_TYPES = {cls.__name__ : cls for cls in (Engine, Ensemble)}
+
+def write_atomic(path, write, mode="wb"):
+    """
+    Call write(f) on a temporary file next to path (named by process, so several processes can
+    write the same path), flush it to disk and then rename it over path. path always holds a
+    complete file (the old one until the new one is done) even if the program is killed partway
+    through
+
+    """
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    temp = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp, mode) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+def save_npz(path, **arrays):
+    """
+    np.savez written with write_atomic
+
+    """
+
+    write_atomic(path, lambda f: np.savez(f, **arrays))
+
+def save_json(path, value, **options):
+    """
+    json.dump (with options, like indent) written with write_atomic
+
+    """
+
+    write_atomic(path, lambda f: json.dump(value, f, **options), mode="w")
+
+def save_checkpoint(path, info, arrays):
+    """
+    Write a checkpoint: info (anything json can hold) and a dict of numpy arrays, all in one
+    npz file written with save_npz
+
+    """
+
+    save_npz(path, info=np.array(json.dumps(dict(info, version=FORMAT_VERSION))), **arrays)
+
+def load_checkpoint(path):
+    """
+    (info, arrays) from save_checkpoint
+
+    """
+
+    with np.load(path) as data:
+        info = json.loads(str(data["info"]))
+        arrays = {name : data[name] for name in data.files if name != "info"}
+
+    if info.get("version") != FORMAT_VERSION:
+        raise ValueError("{} is a version {} checkpoint, this can only read version {}".format(path, info.get("version"), FORMAT_VERSION))
+
+    return info, arrays
+
+def save_engine(path, engine, extra=None):
+    """
+    Checkpoint an Engine or Ensemble. extra is anything else (json friendly) the caller needs
+    to carry on, like how far through a run it was
+
+    """
+
+    info, arrays = engine.checkpoint()
+    save_checkpoint(path, {"engine" : info, "extra" : extra}, arrays)
+
+def load_engine(path):
+    """
+    (engine, extra) from save_engine. The engine steps on bit for bit the same as the one that
+    was saved
+
+    """
+
+    info, arrays = load_checkpoint(path)
+    if "engine" not in info:
+        raise ValueError("{} isn't an engine checkpoint (checkpoints from the simulation window are resumed with python main.py --resume)".format(path))
+    engineType = info["engine"]["type"]
+    if engineType not in ENGINE_TYPES:
+        raise ValueError("{} has a {} in it, only {} can be loaded".format(path, engineType, ", ".join(ENGINE_TYPES)))
+
+    return ENGINE_TYPES[engineType].from_checkpoint(info["engine"], arrays), info["extra"]
+
+def run_checkpointed(make, duration, path, segment):
+    """
+    Run the Ensemble from make() for duration in pieces of segment, saving it to path after
+    each one. If path is already there (the last run was stopped partway) it carries on from
+    that instead of calling make. Cutting the run into segments changes the steps an adaptive
+    integrator takes, so segment has to stay the same between a run and its resume. Returns the
+    ensemble (path is left for the caller to remove once the results are safe)
+
+    """
+
+    if os.path.exists(path):
+        ensemble, extra = load_engine(path)
+        done = extra["segments"]
+    else:
+        ensemble, done = make(), 0
+
+    starts = np.arange(0, duration, segment)
+    for index in range(done, len(starts)):
+        if not ensemble.active.any():
+            break
+        ensemble.run(min(segment, duration - starts[index]))
+        save_engine(path, ensemble, {"segments" : index + 1})
+
+    return ensemble
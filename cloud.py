@@ -0,0 +1,108 @@
+#a cloud of third bodies started close together and integrated as arrays, drawn a pixel at a time so thousands stay interactive
+import numpy as np
+
+from engine import make_state
+from ensemble import Ensemble
+
+def seed_cloud(center, count, spread=(0.01, 0.01, 0.0), velocitySpread=(0.0, 0.0, 0.0), seed=0):
+    """
+    (6, count) state array of third bodies scattered around center (x, y, z, xVel, yVel, zVel)
+    with normal distributions of the given standard deviations for each position and velocity
+    component. The first one is exactly at center. seed makes it the same cloud every time
+
+    """
+
+    rng = np.random.default_rng(seed)
+    sigma = np.concatenate((np.asarray(spread, dtype=float), np.asarray(velocitySpread, dtype=float)))
+
+    state = np.asarray(center, dtype=float)[:, None] + sigma[:, None] * rng.standard_normal((6, count))
+    state[:, 0] = center
+
+    return make_state(*state)
+
+class Cloud:
+    """
+    Lots of third bodies for the live view: an Ensemble stepped a bit every frame, drawn by
+    writing each particle straight into the surface's pixels (one numpy assignment for the
+    whole cloud instead of a pygame.draw.circle each). Particles that hit a body stay where
+    they touched it in collidedColor, ones that escape aren't drawn
+
+    """
+
+    def __init__(self, state, l, integrator="yoshida4", deltaT=0.001, bodyRadius=0.02, thirdRadius=0.01, escapeRadius=10.0,
+                 color=(80, 160, 255), collidedColor=(110, 110, 110), dotSize=2, ensemble=None):
+        if ensemble is None:
+            ensemble = Ensemble(state, l=l, deltaT=deltaT, integrator=integrator, bodyRadius=bodyRadius, thirdRadius=thirdRadius, escapeRadius=escapeRadius)
+        self.ensemble = ensemble #can be passed in to carry on with one (from a checkpoint), then state and the settings aren't used
+        self.color = color
+        self.collidedColor = collidedColor
+        self.dotSize = dotSize #width and height of each particle in pixels
+        self._mapped = None #(surface masks, mapped colors) so colors are only converted to the pixel format once
+
+    @classmethod
+    def around(cls, center, l, count=5000, spread=(0.01, 0.01, 0.0), velocitySpread=(0.0, 0.0, 0.0), seed=0, **kwargs):
+        """
+        A cloud of count particles scattered around one set of initial conditions (see seed_cloud)
+
+        """
+
+        return cls(seed_cloud(center, count, spread, velocitySpread, seed), l, **kwargs)
+
+    def __len__(self):
+        return len(self.ensemble)
+
+    @property
+    def t(self):
+        return self.ensemble.t
+
+    def advance(self, duration):
+        """
+        Move the whole cloud forward by duration of simulated time
+
+        """
+
+        if self.ensemble.active.any():
+            self.ensemble.run(duration)
+
+    def summary(self):
+        return self.ensemble.summary()
+
+    def draw(self, surface, centerX, centerY, scale):
+        """
+        Draw every particle still on screen. Returns the Rect that was drawn to (None if nothing
+        was)
+
+        """
+
+        import pygame #only needed for drawing
+
+        ensemble = self.ensemble
+        shown = ~ensemble.escaped
+        x = np.clip(ensemble.state[0, shown]*scale + centerX, -1e6, 1e6).astype(np.int32) #keep far away points from overflowing
+        y = np.clip(ensemble.state[1, shown]*-scale + centerY, -1e6, 1e6).astype(np.int32)
+        collided = ensemble.collided[shown]
+
+        width, height = surface.get_size()
+        size = self.dotSize
+        inside = (x >= 0) & (x <= width - size) & (y >= 0) & (y <= height - size)
+        if not inside.any():
+            return None
+        x, y, collided = x[inside], y[inside], collided[inside]
+
+        if surface.get_bytesize() == 3: #no 2d pixel array for 24 bit surfaces, write the color channels instead
+            pixels = pygame.surfarray.pixels3d(surface)
+            colors = np.where(collided[:, None], np.array(self.collidedColor, dtype=np.uint8), np.array(self.color, dtype=np.uint8))
+        else:
+            key = surface.get_masks()
+            if self._mapped is None or self._mapped[0] != key:
+                self._mapped = (key, np.array([surface.map_rgb(self.color), surface.map_rgb(self.collidedColor)], dtype=np.uint32))
+            pixels = pygame.surfarray.pixels2d(surface) #locks the surface until it is deleted
+            colors = self._mapped[1][collided.astype(np.intp)]
+
+        for dx in range(size):
+            for dy in range(size):
+                pixels[x + dx, y + dy] = colors
+        del pixels
+
+        left, top = int(x.min()), int(y.min())
+        return pygame.Rect(left, top, int(x.max()) - left + size, int(y.max()) - top + size)
@@ -0,0 +1,379 @@
+#headless physics engine for the third body. Nothing in here touches pygame or screeninfo so it can be run without a display
+import numpy as np
+
+try:
+    import numba #optional, only used to compile the acceleration kernel
+except ImportError:
+    numba = None
+
+#rows of a state array
+X, Y, Z, XVEL, YVEL, ZVEL = range(6)
+
+def make_state(x, y, z, xVel=0, yVel=0, zVel=0):
+    """
+    Build a state array out of initial conditions. Each argument can be a float or an
+    array (all arrays need to broadcast together). The result has shape (6, ...) with
+    rows x, y, z, x velocity, y velocity, z velocity
+
+    """
+
+    x, y, z, xVel, yVel, zVel = np.broadcast_arrays(*[np.asarray(i, dtype=float) for i in (x, y, z, xVel, yVel, zVel)])
+
+    return np.stack((x, y, z, xVel, yVel, zVel)) #stack copies so the state doesn't share memory with the inputs
+
+def _acceleration_kernel(x, y, z, xVel, yVel, zVel, l):
+    """
+    x, y, and z accelerations with the distance to each body only calculated once (Sim has
+    _calc_d2dx, _calc_d2dy and _calc_d2dz each recalculate both distances)
+
+    """
+
+    dx1 = x - l
+    dx2 = x + 1 - l
+    yz2 = y*y + z*z
+
+    #mass over distance cubed for each body, shared by all three accelerations (r*r**0.5 turns into a sqrt, which is a lot cheaper than **1.5 on arrays)
+    r1 = dx1*dx1 + yz2
+    r2 = dx2*dx2 + yz2
+    m1 = (1-l) / (r1 * r1**0.5)
+    m2 = l / (r2 * r2**0.5)
+    m = m1 + m2
+
+    return (2*yVel + x - m1*dx1 - m2*dx2, y - 2*xVel - m*y, -m*z)
+
+def _acceleration_jacobi_kernel(x, y, z, xVel, yVel, zVel, l):
+    """
+    Same as _acceleration_kernel but also returns the Jacobi constant
+    (x^2 + y^2 + 2(1-l)/r1 + 2l/r2 - speed^2) from the same distances to the bodies
+
+    """
+
+    dx1 = x - l
+    dx2 = x + 1 - l
+    yz2 = y*y + z*z
+
+    r1 = dx1*dx1 + yz2
+    r2 = dx2*dx2 + yz2
+    p1 = (1-l) / r1**0.5 #mass over distance, reused for the accelerations
+    p2 = l / r2**0.5
+    m1 = p1 / r1
+    m2 = p2 / r2
+    m = m1 + m2
+
+    jacobi = x*x + y*y + 2*(p1 + p2) - (xVel*xVel + yVel*yVel + zVel*zVel)
+
+    return (2*yVel + x - m1*dx1 - m2*dx2, y - 2*xVel - m*y, -m*z, jacobi)
+
+if numba is not None: #compile the kernel if numba is installed, otherwise plain numpy/python is used
+    _kernel = numba.njit(cache=True)(_acceleration_kernel)
+    _jacobi_kernel = numba.njit(cache=True)(_acceleration_jacobi_kernel)
+
+    @numba.njit(cache=True)
+    def _array_kernel(x, y, z, xVel, yVel, zVel, l, out):
+        for i in range(x.shape[0]):
+            out[0, i], out[1, i], out[2, i] = _kernel(x[i], y[i], z[i], xVel[i], yVel[i], zVel[i], l[i])
+
+    @numba.njit(cache=True)
+    def _array_kernel_shared_l(x, y, z, xVel, yVel, zVel, l, out):
+        for i in range(x.shape[0]):
+            out[0, i], out[1, i], out[2, i] = _kernel(x[i], y[i], z[i], xVel[i], yVel[i], zVel[i], l)
+
+else:
+    _kernel = _acceleration_kernel
+    _jacobi_kernel = _acceleration_jacobi_kernel
+    _array_kernel = None
+
+JIT = _array_kernel is not None #True if the kernel is compiled with numba
+
+def acceleration(x, y, z, xVel, yVel, zVel, l):
+    """
+    Full acceleration of the third body from one fused kernel. Works on floats (returns a
+    tuple of three floats) or on arrays that broadcast together (returns something that
+    unpacks into three arrays)
+
+    """
+
+    if _array_kernel is None or not isinstance(x, np.ndarray):
+        return _kernel(x, y, z, xVel, yVel, zVel, l)
+
+    sharedL = np.ndim(l) == 0 #one lambda for everything (the usual case) doesn't need to be broadcast
+    args = np.broadcast_arrays(x, y, z, xVel, yVel, zVel) if sharedL else np.broadcast_arrays(x, y, z, xVel, yVel, zVel, l)
+    shape = args[0].shape
+    flat = [np.ascontiguousarray(i, dtype=float).ravel() for i in args]
+
+    out = np.empty((3, flat[0].size))
+    if sharedL:
+        _array_kernel_shared_l(*flat, float(l), out)
+    else:
+        _array_kernel(*flat, out)
+
+    return out.reshape((3,) + shape)
+
+def acceleration_and_jacobi(x, y, z, xVel, yVel, zVel, l):
+    """
+    Accelerations and the Jacobi constant together for about the cost of the accelerations
+    alone. Floats or arrays, returns x, y, z acceleration and the Jacobi constant
+
+    """
+
+    if isinstance(x, np.ndarray): #arrays always go through numpy
+        return _acceleration_jacobi_kernel(x, y, z, xVel, yVel, zVel, l)
+
+    return _jacobi_kernel(x, y, z, xVel, yVel, zVel, l)
+
+def calc_jacobi(state, l):
+    """
+    Jacobi constant of a state array. This is conserved by the real motion, so how much it
+    changes over a run shows how much error the integration has built up
+
+    """
+
+    x, y, z, xVel, yVel, zVel = state
+
+    return np.asarray(_acceleration_jacobi_kernel(x, y, z, xVel, yVel, zVel, l)[3], dtype=float)
+
+def calc_potential_acceleration(position, l):
+    """
+    Calculate the part of the acceleration that only depends on position (gravity from both
+    bodies plus the centrifugal term). position is an array with rows x, y, z
+
+    """
+
+    x, y, z = position
+
+    return np.asarray(acceleration(x, y, z, 0.0, 0.0, 0.0, l), dtype=float)
+
+def calc_potential_jacobian(position, l):
+    """
+    Derivatives of the potential acceleration (calc_potential_acceleration) with respect to
+    x, y and z, as a (3, 3, ...) array (row is the acceleration, column is the coordinate).
+    It is symmetric. Together with the Coriolis terms this is what the variational equations
+    need to evolve the state transition matrix
+
+    """
+
+    x, y, z = np.asarray(position, dtype=float)
+
+    dx1 = x - l
+    dx2 = x + 1 - l
+    yz2 = y*y + z*z
+
+    r1 = dx1*dx1 + yz2
+    r2 = dx2*dx2 + yz2
+    m1 = (1-l) / (r1 * r1**0.5) #mass over distance cubed
+    m2 = l / (r2 * r2**0.5)
+    m = m1 + m2
+    n1 = 3*m1 / r1 #3 * mass over distance to the fifth
+    n2 = 3*m2 / r2
+    n = n1 + n2
+
+    #gradient of -mass*d/r^3 for each body is -mass*(I/r^3 - 3 d d^T/r^5), plus the centrifugal term for x and y
+    xy = (n1*dx1 + n2*dx2) * y
+    xz = (n1*dx1 + n2*dx2) * z
+    yz = n * y*z
+
+    return np.array((
+        (1 - m + n1*dx1*dx1 + n2*dx2*dx2, xy, xz),
+        (xy, 1 - m + n*y*y, yz),
+        (xz, yz, -m + n*z*z),
+    ))
+
+def add_coriolis(acc, velocity):
+    """
+    Add the Coriolis terms (2*yVel for x and -2*xVel for y) to a potential acceleration in place
+
+    """
+
+    acc[0] += 2*velocity[1]
+    acc[1] -= 2*velocity[0]
+
+    return acc
+
+def calc_acceleration(state, l):
+    """
+    Calculate x, y, and z accelerations for a state array. These are the same equations as
+    Sim._calc_d2dx, Sim._calc_d2dy and Sim._calc_d2dz, just on whole arrays at once. l can
+    be a float or an array that broadcasts with the particles
+
+    """
+
+    x, y, z, xVel, yVel, zVel = state
+
+    return np.asarray(acceleration(x, y, z, xVel, yVel, zVel, l), dtype=float)
+
+def step(state, l, deltaT, acc=None):
+    """
+    Advance a state array by one deltaT in place. All three accelerations are calculated from
+    the same state and then positions and velocities are updated with the same kinematics as
+    Sim._updateX (this is the "together" update order). Returns the accelerations used
+
+    """
+
+    if acc is None:
+        acc = calc_acceleration(state, l)
+
+    state[:3] += state[3:]*deltaT + (acc/2)*(deltaT**2) #new positions after deltaT (uses old velocities)
+    state[3:] += acc*deltaT #new velocities
+
+    return acc
+
+def together_step(x, y, z, xVel, yVel, zVel, l, deltaT, withJacobi=False):
+    """
+    One "together" step with everything written out. All three accelerations come from the
+    same state through the fused kernel, then positions and velocities are updated with the
+    Sim._updateX kinematics. Meant for plain floats (where numpy overhead would dominate) but
+    works on arrays too. Returns the new x, y, z, velocities and the accelerations that were
+    used. With withJacobi the Jacobi constant of the state before the step is added on the end
+    (it shares the distance calculations with the accelerations)
+
+    """
+
+    if withJacobi:
+        xAcc, yAcc, zAcc, jacobi = acceleration_and_jacobi(x, y, z, xVel, yVel, zVel, l)
+    else:
+        xAcc, yAcc, zAcc = acceleration(x, y, z, xVel, yVel, zVel, l)
+
+    half = deltaT*deltaT/2
+    new = (
+        x + xVel*deltaT + xAcc*half,
+        y + yVel*deltaT + yAcc*half,
+        z + zVel*deltaT + zAcc*half,
+        xVel + xAcc*deltaT,
+        yVel + yAcc*deltaT,
+        zVel + zAcc*deltaT,
+        xAcc, yAcc, zAcc,
+    )
+
+    return new + (jacobi,) if withJacobi else new
+
+def propagate(state, l, deltaT, nSteps):
+    """
+    Advance a state array nSteps times in place. Returns the accelerations from the last step
+    (None if no steps were taken)
+
+    """
+
+    acc = None
+    for i in range(nSteps):
+        acc = step(state, l, deltaT)
+
+    return acc
+
+class Engine:
+    """
+    Holds the state of one or more third bodies and steps them forward. This is the physics
+    from Sim without any of the rendering so it can be used on its own
+
+    """
+
+    def __init__(self, state, l=0.7, deltaT=None, integrator="kinematic", **integratorOptions):
+        from integrators import make_integrator #integrators imports this module
+
+        self.state = np.array(state, dtype=float) #copy so the caller's array isn't changed underneath them
+        self.l = np.asarray(l, dtype=float) #lambda for the equations. 0 < lambda < 1 (can be an array, one per particle)
+        self.t = 0.0 #simulated time since start
+
+        #integrator used to step the state (name from integrators.INTEGRATORS or an Integrator object). Defaults to the original kinematic update
+        if deltaT is not None:
+            integratorOptions["deltaT"] = deltaT
+        self.integrator = make_integrator(integrator, **integratorOptions)
+
+        self.acc = calc_acceleration(self.state, self.l) #accelerations at the current state
+        self.jacobi0 = calc_jacobi(self.state, self.l) #Jacobi constant at the start, to measure drift against
+
+    @property
+    def deltaT(self):
+        return self.integrator.deltaT
+
+    @deltaT.setter
+    def deltaT(self, value):
+        self.integrator.deltaT = value
+
+    @classmethod
+    def from_initial(cls, x, y, z, xVel=0, yVel=0, zVel=0, **kwargs):
+        """
+        Make an engine straight from initial conditions (floats or arrays). Any other keyword
+        arguments (l, deltaT, ...) are passed on to the constructor
+
+        """
+
+        return cls(make_state(x, y, z, xVel, yVel, zVel), **kwargs)
+
+    def step(self, nSteps=1):
+        """
+        Advance every particle nSteps times (with an adaptive integrator each step can be a
+        different length)
+
+        """
+
+        for i in range(nSteps):
+            taken, self.acc = self.integrator.step(self.state, self.l, acc=self.acc) #acc is kept for the next step (and for display)
+            self.t += taken
+
+    def advance(self, duration):
+        """
+        Advance every particle by exactly duration of simulated time
+
+        """
+
+        self.acc, nSteps = self.integrator.integrate(self.state, self.l, duration, acc=self.acc)
+        self.t += duration
+
+        return nSteps
+
+    def checkpoint(self):
+        """
+        Everything needed to carry on from exactly this point as (info, arrays): info is json
+        friendly (time, the integrator and its internals), arrays are the numpy state. Save it
+        with checkpoint.save_engine
+
+        """
+
+        info = {"type" : type(self).__name__, "t" : float(self.t), "integrator" : self.integrator.checkpoint()}
+        arrays = {"state" : self.state, "l" : self.l, "acc" : self.acc, "jacobi0" : self.jacobi0}
+
+        return info, arrays
+
+    @classmethod
+    def from_checkpoint(cls, info, arrays):
+        """
+        Make an engine again from checkpoint(). Stepping it gives bit for bit the same results
+        as the one that was saved would have
+
+        """
+
+        engine = cls.__new__(cls)
+        engine._restore(info, arrays)
+
+        return engine
+
+    def _restore(self, info, arrays):
+        from integrators import restore_integrator
+
+        self.state = np.array(arrays["state"], dtype=float)
+        self.l = np.asarray(arrays["l"], dtype=float)
+        self.t = info["t"]
+        self.integrator = restore_integrator(info["integrator"])
+        self.acc = np.array(arrays["acc"], dtype=float)
+        self.jacobi0 = np.array(arrays["jacobi0"], dtype=float)
+
+    @property
+    def jacobi(self):
+        return calc_jacobi(self.state, self.l)
+
+    def jacobi_drift(self):
+        """
+        How far the Jacobi constant of each particle has moved from where it started (it should
+        stay constant, so this is the integration error)
+
+        """
+
+        return np.abs(self.jacobi - self.jacobi0)
+
+    @property
+    def position(self):
+        return self.state[:3]
+
+    @property
+    def velocity(self):
+        return self.state[3:]
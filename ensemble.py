@@ -0,0 +1,217 @@
+#many third bodies integrated in lockstep with one shared lambda
+import numpy as np
+
+from engine import Engine, calc_acceleration
+from events import EventDetector, Impact, Step, restore_event
+
+class Ensemble(Engine):
+    """
+    N third bodies stepped together as arrays. Every particle shares the same lambda (so the
+    primaries are in the same place for all of them). Particles that hit a primary or fly
+    off past escapeRadius are frozen and the time it happened is recorded per particle
+
+    Hitting a primary is an events.Impact (in 3D, located exactly inside the step, including
+    passes that go in and out within one step). Any other events.Event objects passed in events
+    are checked every step too and logged to eventLog (their index in events is the event
+    number in the log)
+
+    """
+
+    def __init__(self, state, l=0.7, deltaT=None, bodyRadius=0.02, thirdRadius=0.01, escapeRadius=10.0, events=(), **kwargs):
+        state = np.asarray(state, dtype=float).reshape(6, -1) #always (6, N), even for one particle
+        super().__init__(state, l=l, deltaT=deltaT, **kwargs)
+
+        if self.l.ndim != 0:
+            raise ValueError("an ensemble shares one lambda between all particles")
+
+        self.body1X = float(self.l)
+        self.body2X = float(self.l) - 1
+
+        self.bodyRadius = bodyRadius
+        self.thirdRadius = thirdRadius
+        self.escapeRadius = escapeRadius
+
+        n = self.state.shape[1]
+        self.collided = np.zeros(n, dtype=bool)
+        self.escaped = np.zeros(n, dtype=bool)
+        self.collidedWith = np.zeros(n, dtype=np.int8) #0 if it hasn't collided, otherwise 1 or 2 for the body it hit
+        self.collisionTime = np.full(n, np.nan)
+        self.escapeTime = np.full(n, np.nan)
+
+        #impacts go after the caller's events so their event numbers are the same as their index in events
+        self.events = list(events)
+        self._detector = EventDetector(self.events + [Impact(1, bodyRadius + thirdRadius), Impact(2, bodyRadius + thirdRadius)], float(self.l))
+
+        self._activeIndex = None #indices of particles still moving (None means all of them)
+        self._check_start() #particles can start inside a body
+
+    @property
+    def eventLog(self):
+        return self._detector.log
+
+    def __len__(self):
+        return self.state.shape[1]
+
+    @property
+    def active(self):
+        return ~(self.collided | self.escaped)
+
+    def step(self, nSteps=1):
+        """
+        Advance every particle that hasn't collided or escaped nSteps times. Events (including
+        collisions) are located inside each step, escapes are checked at the end of it
+
+        """
+
+        for i in range(nSteps):
+            index = self._activeIndex
+
+            if index is None: #everything still moving, step the arrays directly
+                before, accBefore = self.state.copy(), self.acc
+                taken, self.acc = self.integrator.step(self.state, self.l, acc=self.acc)
+                self._check(Step(before, accBefore, self.state, self.acc, taken), None)
+
+            else:
+                if len(index) == 0: #nothing left to move
+                    self.t += (nSteps - i) * self.deltaT
+                    return
+
+                sub = self.state[:, index] #only integrate what is still moving
+                before, accBefore = sub.copy(), self.acc[:, index]
+                taken, self.acc[:, index] = self.integrator.step(sub, self.l, acc=accBefore)
+                self.state[:, index] = sub
+                self._check(Step(before, accBefore, sub, self.acc[:, index], taken), index)
+
+            self.t += taken
+
+    def run(self, duration):
+        """
+        Integrate for duration of simulated time, stopping early if every particle has collided
+        or escaped
+
+        """
+
+        end = self.t + duration
+
+        if not self.integrator.adaptive:
+            self.step(int(round(duration / self.deltaT)))
+            return
+
+        while end - self.t > 1e-12 and (self._activeIndex is None or len(self._activeIndex)):
+            self.deltaT = min(self.deltaT, end - self.t) #don't step past the end
+            self.step()
+
+    def checkpoint(self):
+        """
+        Engine.checkpoint plus what has happened to every particle, the events and the event log
+
+        """
+
+        info, arrays = super().checkpoint()
+        info.update({
+            "bodyRadius" : self.bodyRadius,
+            "thirdRadius" : self.thirdRadius,
+            "escapeRadius" : self.escapeRadius,
+            "events" : [event.checkpoint() for event in self.events],
+        })
+        arrays.update({
+            "collided" : self.collided,
+            "escaped" : self.escaped,
+            "collidedWith" : self.collidedWith,
+            "collisionTime" : self.collisionTime,
+            "escapeTime" : self.escapeTime,
+            "eventLog" : self.eventLog.records,
+        })
+
+        return info, arrays
+
+    def _restore(self, info, arrays):
+        super()._restore(info, arrays)
+
+        self.body1X = float(self.l)
+        self.body2X = float(self.l) - 1
+
+        self.bodyRadius = info["bodyRadius"]
+        self.thirdRadius = info["thirdRadius"]
+        self.escapeRadius = info["escapeRadius"]
+
+        self.collided = np.array(arrays["collided"], dtype=bool)
+        self.escaped = np.array(arrays["escaped"], dtype=bool)
+        self.collidedWith = np.array(arrays["collidedWith"], dtype=np.int8)
+        self.collisionTime = np.array(arrays["collisionTime"], dtype=float)
+        self.escapeTime = np.array(arrays["escapeTime"], dtype=float)
+
+        self.events = [restore_event(saved) for saved in info["events"]]
+        self._detector = EventDetector(self.events + [Impact(1, self.bodyRadius + self.thirdRadius), Impact(2, self.bodyRadius + self.thirdRadius)], float(self.l))
+        self._detector.log.load(arrays["eventLog"])
+
+        self._activeIndex = None if self.active.all() else np.flatnonzero(self.active) #nothing has been frozen exactly when everything is active
+
+    def _check_start(self):
+        """
+        Freeze particles that start inside a body
+
+        """
+
+        total_radius = self.bodyRadius + self.thirdRadius
+        yz2 = self.state[1]**2 + self.state[2]**2
+        hit1 = (self.state[0] - self.body1X)**2 + yz2 < total_radius**2
+        hit2 = (self.state[0] - self.body2X)**2 + yz2 < total_radius**2
+
+        self.collidedWith[hit2] = 2
+        self.collidedWith[hit1] = 1
+        self._freeze(np.flatnonzero(hit1 | hit2), self.collided, self.collisionTime, self.t)
+
+    def _check(self, step, index):
+        """
+        Look for events during step (the particles at index, or every particle if index is None),
+        freeze anything that hit a body at the point it touched, then freeze anything past
+        escapeRadius
+
+        """
+
+        if index is None:
+            index = np.arange(len(self))
+
+        nEvents = len(self.events)
+        columns, event, theta, states = self._detector.check(self.t, step, index)
+        if len(columns):
+            where = index[columns]
+            self.state[:, where] = states
+            self.collidedWith[where] = event - nEvents + 1 #the impacts are the last two events
+            self._freeze(where, self.collided, self.collisionTime, self.t + theta*step.h)
+
+        sub = self.state[:, index]
+        out = (sub[0]**2 + sub[1]**2 + sub[2]**2 > self.escapeRadius**2) & ~self.collided[index]
+        if out.any():
+            self._freeze(index[out], self.escaped, self.escapeTime, self.t + step.h)
+
+    def _freeze(self, where, flag, times, t):
+        """
+        Stop the particles at where (like the single body sim does) and record when
+
+        """
+
+        if len(where) == 0:
+            return
+
+        flag[where] = True
+        times[where] = t
+        self.state[3:, where] = 0
+        self.acc[:, where] = calc_acceleration(self.state[:, where], self.l)
+        self._activeIndex = np.flatnonzero(self.active)
+
+    def summary(self):
+        """
+        Counts of what happened to the particles so far
+
+        """
+
+        return {
+            "particles" : len(self),
+            "t" : self.t,
+            "active" : int(self.active.sum()),
+            "collided body 1" : int((self.collidedWith == 1).sum()),
+            "collided body 2" : int((self.collidedWith == 2).sum()),
+            "escaped" : int(self.escaped.sum()),
+        }
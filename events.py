@@ -0,0 +1,401 @@
+#finding exactly when things happen between steps: hitting a body, crossing a plane, closest approach
+import numpy as np
+
+from engine import acceleration
+
+#one row per event found: which event, which particle, when, and the state at that moment
+EVENT_DTYPE = np.dtype([("event", "<i2"), ("particle", "<i4"), ("t", "<f8")] + [(name, "<f8") for name in ("x", "y", "z", "xVel", "yVel", "zVel")])
+
+class Event:
+    """
+    Something that happens when value(state) crosses zero. value() is evaluated once per step
+    for every particle (it should be cheap), and only particles where the sign changed get the
+    crossing located exactly. direction is +1 to only count crossings where value goes up, -1
+    for going down, 0 for both. A terminal event stops the particle
+
+    """
+
+    name = None
+    direction = 0
+    terminal = False
+
+    def value(self, state, l):
+        raise NotImplementedError
+
+    def _crossed(self, before, after):
+        if self.direction > 0:
+            return (before < 0) & (after >= 0)
+        if self.direction < 0:
+            return (before > 0) & (after <= 0)
+        return ((before < 0) & (after >= 0)) | ((before > 0) & (after <= 0))
+
+    def find(self, step, l):
+        """
+        Indices (into the step's particles) of the particles where this event happened during
+        the step, and the fraction of the step it happened at for each
+
+        """
+
+        before = self.value(step.before, l)
+        after = self.value(step.after, l)
+        found = np.flatnonzero(self._crossed(before, after))
+
+        return found, step.root(lambda state: self.value(state, l), found, before[found], after[found])
+
+    def checkpoint(self):
+        """
+        Type and attributes as json friendly values (restore_event makes it again)
+
+        """
+
+        return {"type" : type(self).__name__, "attributes" : dict(vars(self))}
+
+class Impact(Event):
+    """
+    The third body touching a primary (body is 1 or 2), measured in 3D. Besides ending a step
+    inside the body, a pass that goes in and back out within one step is caught too: whenever
+    the distance to the body starts growing again during a step, the closest point is located
+    and checked
+
+    """
+
+    terminal = True
+    direction = -1
+
+    def __init__(self, body, radius):
+        self.body = body
+        self.radius = radius
+        self.name = "impact {}".format(body)
+
+    def _center(self, l):
+        return l if self.body == 1 else l - 1
+
+    def value(self, state, l):
+        dx = state[0] - self._center(l)
+        return dx*dx + state[1]*state[1] + state[2]*state[2] - self.radius*self.radius
+
+    def _radial(self, state, l):
+        return (state[0] - self._center(l))*state[3] + state[1]*state[4] + state[2]*state[5]
+
+    def find(self, step, l):
+        #only particles that ended up close enough to have touched during the step need a closer look. The speed can't get higher
+        #than sqrt(speed^2 + 2/radius + ~1) near a body (total mass is 1), so that times the step is as far as it can have gone
+        after = self.value(step.after, l)
+        reach = self.radius + abs(step.h)*(step.speedAfter + (2/self.radius)**0.5 + 2)
+        candidates = np.flatnonzero(after < reach*reach - self.radius*self.radius)
+        if len(candidates) == 0:
+            return candidates, np.zeros(0)
+
+        startStates = step.before[:, candidates]
+        before = self.value(startStates, l)
+        after = after[candidates]
+        crossed = self._crossed(before, after)
+        found = candidates[crossed]
+        theta = step.root(lambda state: self.value(state, l), found, before[crossed], after[crossed])
+
+        #closest approach inside the step (radial velocity going from negative to positive) while both ends are outside
+        radialBefore = self._radial(startStates, l)
+        radialAfter = self._radial(step.after[:, candidates], l)
+        passing = (radialBefore < 0) & (radialAfter >= 0) & (before > 0) & (after > 0)
+        passes = candidates[passing]
+        if len(passes):
+            closest = step.root(lambda state: self._radial(state, l), passes, radialBefore[passing], radialAfter[passing])
+            inside = self.value(step.state_at(closest, passes), l)
+            hit = inside < 0
+            if hit.any():
+                #first touch is between the start and the closest point
+                touch = step.root(lambda state: self.value(state, l), passes[hit], before[passing][hit], inside[hit], high=closest[hit])
+                found = np.concatenate((found, passes[hit]))
+                theta = np.concatenate((theta, touch))
+
+        return found, theta
+
+class PlaneCrossing(Event):
+    """
+    Crossing coordinate axis (0 to 5 for x, y, z, x velocity, y velocity, z velocity) = value,
+    for Poincaré sections. direction=+1 keeps only upward crossings (one side of the section)
+
+    """
+
+    def __init__(self, axis=1, value=0.0, direction=1, name=None):
+        self.axis = axis
+        self.level = value
+        self.direction = direction
+        self.name = name or "plane {}={}".format(("x", "y", "z", "xVel", "yVel", "zVel")[axis], value)
+
+    def value(self, state, l):
+        return state[self.axis] - self.level
+
+class Periapsis(Event):
+    """
+    Closest approach to a primary (body is 1 or 2): the radial velocity relative to it going
+    from negative to positive
+
+    """
+
+    direction = 1
+
+    def __init__(self, body):
+        self.body = body
+        self.name = "periapsis {}".format(body)
+
+    def value(self, state, l):
+        centerX = l if self.body == 1 else l - 1
+        return (state[0] - centerX)*state[3] + state[1]*state[4] + state[2]*state[5]
+
+class Step:
+    """
+    One step of a set of particles: the (6, N) states and (3, N) accelerations at both ends and
+    the step length h. States inside the step come from cubic Hermite interpolation (positions
+    from positions and velocities, velocities from velocities and accelerations), which is
+    4th order accurate without evaluating the equations of motion again
+
+    """
+
+    def __init__(self, before, accBefore, after, accAfter, h):
+        self.before = before
+        self.accBefore = accBefore
+        self.after = after
+        self.accAfter = accAfter
+        self.h = h
+        self._speedAfter = None
+
+    @property
+    def speedAfter(self):
+        if self._speedAfter is None: #shared by every event that needs it
+            self._speedAfter = np.sqrt(self.after[3]**2 + self.after[4]**2 + self.after[5]**2)
+        return self._speedAfter
+
+    def state_at(self, theta, index):
+        """
+        Interpolated (6, len(index)) states at fraction theta (one per particle) of the step
+
+        """
+
+        theta = np.asarray(theta, dtype=float)
+        t2 = theta*theta
+        t3 = t2*theta
+        h00 = 2*t3 - 3*t2 + 1
+        h10 = t3 - 2*t2 + theta
+        h01 = -2*t3 + 3*t2
+        h11 = t3 - t2
+
+        before = self.before[:, index]
+        after = self.after[:, index]
+        slopeBefore = np.concatenate((before[3:], self.accBefore[:, index])) * self.h #derivative of every row times h
+        slopeAfter = np.concatenate((after[3:], self.accAfter[:, index])) * self.h
+
+        return h00*before + h10*slopeBefore + h01*after + h11*slopeAfter
+
+    def root(self, func, index, valueLow, valueHigh, high=None, tolerance=1e-12, maxIterations=60):
+        """
+        Fraction of the step (between 0 and high, 1 if not given, one per particle) where
+        func(interpolated state) crosses zero, for the particles at index. valueLow and valueHigh
+        are func at the two ends and must have different signs. Uses the Illinois method (false
+        position that halves the stuck end), all the particles at once
+
+        """
+
+        a = np.zeros(len(index))
+        b = np.ones(len(index)) if high is None else np.array(high, dtype=float)
+        fa = np.array(valueLow, dtype=float)
+        fb = np.array(valueHigh, dtype=float)
+        if len(index) == 0:
+            return a
+
+        for i in range(maxIterations):
+            denominator = fb - fa
+            c = np.where(denominator != 0, b - fb*(b - a)/np.where(denominator != 0, denominator, 1), (a + b)/2)
+            c = np.clip(c, np.minimum(a, b), np.maximum(a, b))
+            fc = func(self.state_at(c, index))
+
+            switch = fc*fb < 0 #root is between b and c, so b becomes the other end
+            a = np.where(switch, b, a)
+            fa = np.where(switch, fb, fa/2) #otherwise halve the end that stayed (the Illinois step)
+            moved = np.abs(c - b)
+            b = c
+            fb = fc
+
+            if np.all((moved <= tolerance) | (fc == 0)):
+                break
+
+        return b
+
+class EventLog:
+    """
+    Growing array of EVENT_DTYPE rows. records is a view of the rows found so far
+
+    """
+
+    def __init__(self, capacity=1024):
+        self._rows = np.empty(capacity, dtype=EVENT_DTYPE)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def records(self):
+        return self._rows[:self.count]
+
+    def add(self, event, particle, t, states):
+        n = len(particle)
+        if self.count + n > len(self._rows): #double the storage
+            rows = np.empty(max(2*len(self._rows), self.count + n), dtype=EVENT_DTYPE)
+            rows[:self.count] = self.records
+            self._rows = rows
+
+        rows = self._rows[self.count:self.count + n]
+        rows["event"] = event
+        rows["particle"] = particle
+        rows["t"] = t
+        for i, name in enumerate(("x", "y", "z", "xVel", "yVel", "zVel")):
+            rows[name] = states[i]
+        self.count += n
+
+    def of(self, event):
+        """
+        Rows for one event (by its index in the detector's list)
+
+        """
+
+        records = self.records
+        return records[records["event"] == event]
+
+    def clear(self):
+        self.count = 0
+
+    def load(self, records):
+        """
+        Replace the log with an array of EVENT_DTYPE rows (from a checkpoint)
+
+        """
+
+        records = np.asarray(records, dtype=EVENT_DTYPE)
+        self._rows = np.empty(max(1024, len(records)), dtype=EVENT_DTYPE)
+        self._rows[:len(records)] = records
+        self.count = len(records)
+
+class EventDetector:
+    """
+    Checks a list of events on every step and logs where and when each one happened. Terminal
+    events stop a particle, and anything after the first terminal event of a particle in the
+    same step is ignored
+
+    """
+
+    def __init__(self, events, l):
+        self.events = list(events)
+        self.l = l
+        self.log = EventLog()
+
+    def check(self, t, step, particles=None):
+        """
+        Look for events during step (which started at time t). particles are the particle
+        numbers of the step's columns for the log (defaults to 0, 1, 2, ...). Returns
+        (columns, event index, fraction of the step, states) for the particles a terminal event
+        stopped, each as an array
+
+        """
+
+        n = step.before.shape[1]
+        if particles is None:
+            particles = np.arange(n)
+
+        found = []
+        stopAt = np.full(n, np.inf) #fraction of the step each particle stops at
+        stopEvent = np.full(n, -1)
+        for number, event in enumerate(self.events):
+            index, theta = event.find(step, self.l)
+            if len(index) == 0:
+                continue
+            found.append((number, index, theta))
+
+            if event.terminal:
+                #a particle can cross more than once (both ends of a fast pass), keep the earliest
+                order = np.argsort(-theta)
+                index, theta = index[order], theta[order]
+                earlier = theta < stopAt[index]
+                stopAt[index[earlier]] = theta[earlier]
+                stopEvent[index[earlier]] = number
+
+        for number, index, theta in found:
+            keep = theta <= stopAt[index]
+            if self.events[number].terminal:
+                keep &= stopEvent[index] == number
+            index, theta = index[keep], theta[keep]
+
+            if len(index):
+                order = np.argsort(theta, kind="stable")
+                index, theta = index[order], theta[order]
+                self.log.add(number, particles[index], t + theta*step.h, step.state_at(theta, index))
+
+        stopped = np.flatnonzero(stopEvent >= 0)
+        theta = stopAt[stopped]
+        states = step.state_at(theta, stopped) if len(stopped) else np.empty((6, 0))
+
+        return stopped, stopEvent[stopped], theta, states
+
+#events that can be saved in a checkpoint and made again (see restore_event)
+EVENT_TYPES = {cls.__name__ : cls for cls in (Impact, PlaneCrossing, Periapsis)}
+
+def restore_event(saved):
+    """
+    Event from Event.checkpoint(). Only works for the event types in this module
+
+    """
+
+    cls = EVENT_TYPES.get(saved["type"])
+    if cls is None:
+        raise ValueError("can't restore a {} event, only: {}".format(saved["type"], ", ".join(EVENT_TYPES)))
+
+    event = cls.__new__(cls)
+    event.__dict__.update(saved["attributes"])
+
+    return event
+
+class ImpactWatcher:
+    """
+    Surface impact checks for a single third body stepped with plain floats (Sim and the
+    worker thread). Each step costs two squared distances and two radial velocities; only when
+    the body ends up inside a primary or passes its closest point to one does the step go
+    through the exact location with Impact events
+
+    """
+
+    def __init__(self, l, radius):
+        self.l = l
+        self.radius2 = radius*radius
+        self.centers = (l, l - 1)
+        self.detector = EventDetector([Impact(1, radius), Impact(2, radius)], l)
+
+    def check(self, before, after, accBefore, h):
+        """
+        before and after are (x, y, z, xVel, yVel, zVel) at the two ends of a step of length h
+        and accBefore the accelerations at the start. Returns None, or (body hit, fraction of
+        the step it hit at, state at the moment it touched)
+
+        """
+
+        x, y, z, xVel, yVel, zVel = after
+        x0, y0, z0, xVel0, yVel0, zVel0 = before
+
+        for centerX in self.centers:
+            dx = x - centerX
+            if dx*dx + y*y + z*z < self.radius2:
+                break
+            if dx*xVel + y*yVel + z*zVel >= 0 and (x0 - centerX)*xVel0 + y0*yVel0 + z0*zVel0 < 0: #closest approach was during the step
+                break
+        else:
+            return None
+
+        accAfter = acceleration(x, y, z, xVel, yVel, zVel, self.l)
+        step = Step(np.array(before, dtype=float).reshape(6, 1), np.array(accBefore, dtype=float).reshape(3, 1),
+                    np.array(after, dtype=float).reshape(6, 1), np.array(accAfter, dtype=float).reshape(3, 1), h)
+
+        stopped, event, theta, states = self.detector.check(0.0, step)
+        self.detector.log.clear() #only the answer is needed
+        if len(stopped) == 0:
+            return None
+
+        return int(event[0]) + 1, float(theta[0]), tuple(float(i) for i in states[:, 0])
@@ -0,0 +1,243 @@
+#finite time lyapunov exponents: how fast third bodies that start close together pull apart
+#run with: python ftle.py OUTPUT_FOLDER --resolution 256 --l 0.7 --time 3 (a negative time gives the backward field)
+import argparse, math, os
+
+import numpy as np
+
+from engine import make_state, calc_potential_acceleration, calc_potential_jacobian, add_coriolis
+from chaos_map import PLANES, cell_states, compute_grid, save_image
+from lagrange import lagrange_point
+
+class VariationalEngine:
+    """
+    Steps N third bodies together with their 6x6 state transition matrices (how a tiny change
+    to the initial state has grown into a change of the current state). The matrices follow
+    the variational equations d(stm)/dt = A stm, where A is made of the Jacobian of the
+    accelerations (engine.calc_potential_jacobian) and the Coriolis terms, so one run gives
+    the sensitivity in every direction instead of needing a run per perturbation
+
+    Everything is stepped together as arrays with fixed step RK4 (deltaT can be negative to go
+    backwards in time). Particles that come within bodyRadius + thirdRadius of a body (in 3D)
+    are frozen like in an Ensemble and don't get an exponent
+
+    """
+
+    def __init__(self, state, l=0.7, deltaT=0.001, bodyRadius=0.02, thirdRadius=0.01):
+        self.state = np.array(state, dtype=float).reshape(6, -1) #always (6, N), copied so the caller's array isn't changed
+        self.l = float(l)
+        self.deltaT = deltaT
+        self.t = 0.0
+
+        n = self.state.shape[1]
+        self.stm = np.repeat(np.eye(6)[..., None], n, axis=2) #(6, 6, N), starts as the identity
+
+        self.body1X = self.l
+        self.body2X = self.l - 1
+        self.total_radius = bodyRadius + thirdRadius
+
+        self.collided = np.zeros(n, dtype=bool)
+        self.collidedWith = np.zeros(n, dtype=np.int8) #0 if it hasn't collided, otherwise 1 or 2 for the body it hit
+        self.collisionTime = np.full(n, np.nan)
+
+        self._activeIndex = np.arange(n)
+        self._check(self.state, self._activeIndex) #particles can start inside a body
+
+    @classmethod
+    def from_initial(cls, x, y, z, xVel=0, yVel=0, zVel=0, **kwargs):
+        return cls(make_state(x, y, z, xVel, yVel, zVel), **kwargs)
+
+    def __len__(self):
+        return self.state.shape[1]
+
+    def step(self, nSteps=1, deltaT=None):
+        """
+        Advance every particle that hasn't collided (and its matrix) nSteps times
+
+        """
+
+        h = self.deltaT if deltaT is None else deltaT
+
+        for i in range(nSteps):
+            index = self._activeIndex
+            if len(index) == 0: #nothing left to move
+                self.t += (nSteps - i) * h
+                return
+
+            if len(index) == len(self): #everything still moving, no need to pull out a subset
+                self.state, self.stm = _rk4(self.state, self.stm, self.l, h)
+                sub = self.state
+            else:
+                sub, self.stm[..., index] = _rk4(self.state[:, index], self.stm[..., index], self.l, h)
+                self.state[:, index] = sub
+
+            self.t += h
+            self._check(sub, index)
+
+    def advance(self, duration):
+        """
+        Advance by exactly duration (negative to go backwards) in equal steps of at most
+        |deltaT|. Returns the number of steps
+
+        """
+
+        nSteps = int(math.ceil(abs(duration) / abs(self.deltaT) - 1e-9))
+        if nSteps:
+            self.step(nSteps, duration / nSteps)
+
+        return nSteps
+
+    def ftle(self):
+        """
+        Finite time lyapunov exponent of every particle: log of the largest singular value of its
+        state transition matrix (the most any small change to the start has been stretched) over
+        the time integrated. nan for particles that collided
+
+        """
+
+        stretch = np.linalg.norm(np.moveaxis(self.stm, -1, 0), 2, axis=(1, 2))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exponent = np.log(stretch) / abs(self.t)
+
+        exponent[self.collided] = np.nan
+
+        return exponent
+
+    def _check(self, sub, index):
+        """
+        Freeze the particles in sub (the ones at index) that are inside a body
+
+        """
+
+        x, y, z = sub[0], sub[1], sub[2]
+        yz2 = y*y + z*z
+        hit1 = (x - self.body1X)**2 + yz2 < self.total_radius**2
+        hit2 = (x - self.body2X)**2 + yz2 < self.total_radius**2
+
+        hit = hit1 | hit2
+        if not hit.any():
+            return
+
+        self.collided[index[hit]] = True
+        self.collidedWith[index[hit1]] = 1
+        self.collidedWith[index[hit2 & ~hit1]] = 2
+        self.collisionTime[index[hit]] = self.t
+
+        self.state[3:, index[hit]] = 0
+        self._activeIndex = np.flatnonzero(~self.collided)
+
+def _derivative(state, stm, l):
+    """
+    Time derivatives of a (6, N) state and its (6, 6, N) state transition matrices
+
+    """
+
+    acc = add_coriolis(calc_potential_acceleration(state[:3], l), state[3:])
+    jacobian = calc_potential_jacobian(state[:3], l)
+
+    #A = [[0, I], [jacobian, coriolis]] times the matrices, written out so the zero blocks aren't multiplied
+    dstm = np.empty_like(stm)
+    dstm[:3] = stm[3:]
+    for i in range(3):
+        dstm[3 + i] = jacobian[i, 0]*stm[0] + jacobian[i, 1]*stm[1] + jacobian[i, 2]*stm[2]
+    dstm[3] += 2*stm[4]
+    dstm[4] -= 2*stm[3]
+
+    return np.concatenate((state[3:], acc)), dstm
+
+def _rk4(state, stm, l, h):
+    k1 = _derivative(state, stm, l)
+    k2 = _derivative(state + (h/2)*k1[0], stm + (h/2)*k1[1], l)
+    k3 = _derivative(state + (h/2)*k2[0], stm + (h/2)*k2[1], l)
+    k4 = _derivative(state + h*k3[0], stm + h*k3[1], l)
+
+    return (state + (h/6)*(k1[0] + 2*k2[0] + 2*k3[0] + k4[0]),
+            stm + (h/6)*(k1[1] + 2*k2[1] + 2*k3[1] + k4[1]))
+
+def ftle_cells(first, second, plane="x-y", l=0.7, duration=5.0, deltaT=0.001, bodyRadius=0.02, thirdRadius=0.01, batchSize=1024):
+    """
+    Finite time lyapunov exponent for one third body per pair of values in first and second
+    (same grid planes as chaos_map). Cells are integrated batchSize at a time, which keeps the
+    matrices small enough to stay in cache (bigger batches are slower per cell)
+
+    """
+
+    states = cell_states(first, second, plane)
+    results = {"ftle" : [], "collisionTime" : [], "collidedWith" : []}
+
+    for start in range(0, states.shape[1], batchSize):
+        engine = VariationalEngine(states[:, start:start + batchSize], l=l, deltaT=deltaT, bodyRadius=bodyRadius, thirdRadius=thirdRadius)
+        engine.advance(duration)
+
+        results["ftle"].append(engine.ftle())
+        results["collisionTime"].append(engine.collisionTime)
+        results["collidedWith"].append(engine.collidedWith)
+
+    return {name : np.concatenate(parts) for name, parts in results.items()}
+
+def compute_ftle(folder, plane="x-y", firstRange=(-1.5, 1.5), secondRange=(-1.5, 1.5), resolution=256, l=0.7, duration=5.0, deltaT=0.001, bodyRadius=0.02, thirdRadius=0.01, rowsPerChunk=8, workers=None, progress=True):
+    """
+    FTLE field over a resolution x resolution grid, split into chunks over a process pool and
+    resumable like chaos_map.compute_map. Returns a dict with the axes and (resolution,
+    resolution) arrays of ftle, collisionTime and collidedWith (also saved to folder/map.npz)
+
+    """
+
+    settings = {"plane" : plane, "l" : l, "duration" : duration, "deltaT" : deltaT, "bodyRadius" : bodyRadius, "thirdRadius" : thirdRadius}
+
+    return compute_grid(folder, ftle_cells, settings, firstRange, secondRange, resolution, rowsPerChunk, workers, progress)
+
+def ftle_colors(results, maximum=None):
+    """
+    (rows, columns, 3) array of colors for an FTLE field: black for no stretching going through
+    red and yellow to white at maximum (defaults to the 99th percentile). Cells that collided
+    are dark blue
+
+    """
+
+    exponent = results["ftle"]
+    finite = np.isfinite(exponent)
+    if maximum is None:
+        maximum = np.percentile(exponent[finite], 99) if finite.any() else 1
+    level = np.clip(np.nan_to_num(exponent) / max(maximum, 1e-12), 0, 1)
+
+    colors = np.zeros(exponent.shape + (3,), dtype=np.uint8)
+    colors[..., 0] = 255 * np.clip(3*level, 0, 1)
+    colors[..., 1] = 255 * np.clip(3*level - 1, 0, 1)
+    colors[..., 2] = 255 * np.clip(3*level - 2, 0, 1)
+    colors[~finite] = (0, 0, 80)
+
+    return colors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute a finite time lyapunov exponent field over a grid of initial conditions in parallel")
+    parser.add_argument("folder", help="folder for the results (chunks, map.npz and ftle.png). Running again on the same folder resumes")
+    parser.add_argument("--plane", choices=PLANES, default="x-y", help="initial conditions to vary: x-y starts at rest at (x, y), x-yvel starts on the x axis with a y velocity")
+    parser.add_argument("--first", type=float, nargs=2, default=(-1.5, 1.5), metavar=("MIN", "MAX"), help="range of the first axis (x)")
+    parser.add_argument("--second", type=float, nargs=2, default=(-1.5, 1.5), metavar=("MIN", "MAX"), help="range of the second axis (y or y velocity)")
+    parser.add_argument("--around", type=int, choices=(1, 2, 3, 4, 5), default=None, help="center the grid on this lagrange point instead (overrides --first and --second)")
+    parser.add_argument("--size", type=float, default=0.1, help="half width of the grid when using --around")
+    parser.add_argument("--resolution", type=int, default=256, help="grid is resolution x resolution")
+    parser.add_argument("--l", type=float, default=0.7, help="lambda (0 < lambda < 1)")
+    parser.add_argument("--time", type=float, default=5.0, help="how long to integrate each point for (negative for the backward field)")
+    parser.add_argument("--deltaT", type=float, default=0.001, help="RK4 time step")
+    parser.add_argument("--max", type=float, default=None, help="exponent shown as white (default: 99th percentile)")
+    parser.add_argument("--rows-per-chunk", type=int, default=8, help="rows of the grid per saved chunk")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    first, second = args.first, args.second
+    if args.around is not None:
+        x, y, z = lagrange_point(args.around, args.l)
+        centerSecond = y if args.plane == "x-y" else 0.0 #lagrange points are at rest in the rotating frame
+        first = (x - args.size, x + args.size)
+        second = (centerSecond - args.size, centerSecond + args.size)
+
+    results = compute_ftle(args.folder, plane=args.plane, firstRange=first, secondRange=second, resolution=args.resolution,
+                           l=args.l, duration=args.time, deltaT=args.deltaT, rowsPerChunk=args.rows_per_chunk, workers=args.workers)
+
+    imagePath = os.path.join(args.folder, "ftle.png")
+    save_image(imagePath, ftle_colors(results, args.max))
+    print("saved {} and {}".format(os.path.join(args.folder, "map.npz"), imagePath))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#text on screen with the rendered surfaces cached between frames
+
+class Hud:
+    """
+    Draws text with a pygame font, only rasterizing it again when it changes. label() is for
+    text that never changes (it is rendered once and reused forever) and value() is for text
+    like the readouts that change, where the last rendered surface is kept per key and reused
+    until the text is different. Both return the Rect that was drawn to (for dirty rect updates)
+
+    """
+
+    def __init__(self, font, color=(255, 255, 255)):
+        self.font = font
+        self.color = color
+
+        self._labels = {} #text -> rendered surface
+        self._values = {} #key -> (text, rendered surface)
+        self.renders = 0 #number of times text was actually rendered (to see the cache working)
+
+    def _render(self, text):
+        self.renders += 1
+        return self.font.render(text, True, self.color)
+
+    def label(self, surface, text, pos):
+        """
+        Draw text that doesn't change
+
+        """
+
+        rendered = self._labels.get(text)
+        if rendered is None:
+            rendered = self._labels[text] = self._render(text)
+
+        return surface.blit(rendered, pos)
+
+    def value(self, surface, key, text, pos):
+        """
+        Draw text that can change between frames, re-rendering only if it is different from
+        the last time this key was drawn
+
+        """
+
+        last = self._values.get(key)
+        if last is None or last[0] != text:
+            last = self._values[key] = (text, self._render(text))
+
+        return surface.blit(last[1], pos)
+
+    def clear(self):
+        """
+        Forget everything that was rendered (if the font or color changes)
+
+        """
+
+        self._labels.clear()
+        self._values.clear()
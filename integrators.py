@@ -0,0 +1,320 @@
+#integrators that can be swapped in for the fixed kinematic update
+import math
+
+import numpy as np
+
+from engine import calc_acceleration, calc_potential_acceleration, add_coriolis, step as kinematic_step
+
+class Integrator:
+    """
+    Base class for integrators. An integrator advances a state array (rows x, y, z, x velocity,
+    y velocity, z velocity) in place. step() takes the accelerations at the current state if
+    the caller has them (they are returned by the previous step) so they aren't recalculated
+
+    """
+
+    name = None
+    adaptive = False #adaptive integrators change deltaT themselves to keep the error under tolerance
+
+    def __init__(self, deltaT=0.00001):
+        self.deltaT = deltaT
+        self.nEvaluations = 0 #number of times the equations of motion have been evaluated
+        self.nRejected = 0 #steps thrown out for being too inaccurate (adaptive only)
+
+    def _acceleration(self, state, l):
+        self.nEvaluations += 1
+        return calc_acceleration(state, l)
+
+    def step(self, state, l, acc=None, deltaT=None):
+        """
+        Take one step. Returns the time step that was actually taken and the accelerations at
+        the new state
+
+        """
+
+        raise NotImplementedError
+
+    def checkpoint(self):
+        """
+        Name and every attribute (deltaT as it is right now for adaptive ones, the tolerances,
+        counters, ...) as plain json friendly values. restore_integrator makes it again
+
+        """
+
+        return {"name" : self.name, "attributes" : {key : _plain(value) for key, value in vars(self).items()}}
+
+    def integrate(self, state, l, duration, acc=None):
+        """
+        Step until duration has passed, shortening the last step so it lands exactly on the end.
+        Returns the accelerations at the final state and the number of steps taken
+
+        """
+
+        t = 0.0
+        nSteps = 0
+        while duration - t > 1e-12 * max(duration, 1):
+            deltaT = min(self.deltaT, duration - t)
+            suggested = self.deltaT
+
+            taken, acc = self.step(state, l, acc=acc, deltaT=deltaT)
+            t += taken
+            nSteps += 1
+
+            if deltaT < suggested and not self.adaptive:
+                self.deltaT = suggested #put back the step that was cut short to finish
+
+        return acc, nSteps
+
+class Kinematic(Integrator):
+    """
+    The original fixed step update from Sim._updateX: constant acceleration over each step.
+    Only first order, but it is kept as the baseline everything else is compared against
+
+    """
+
+    name = "kinematic"
+
+    def step(self, state, l, acc=None, deltaT=None):
+        deltaT = self.deltaT if deltaT is None else deltaT
+
+        if acc is None:
+            acc = self._acceleration(state, l)
+
+        kinematic_step(state, l, deltaT, acc=acc)
+
+        return deltaT, self._acceleration(state, l)
+
+class RK4(Integrator):
+    """
+    Classic fixed step 4th order Runge-Kutta
+
+    """
+
+    name = "rk4"
+
+    def __init__(self, deltaT=0.001):
+        super().__init__(deltaT)
+
+    def step(self, state, l, acc=None, deltaT=None):
+        h = self.deltaT if deltaT is None else deltaT
+
+        if acc is None:
+            acc = self._acceleration(state, l)
+
+        k1 = np.concatenate((state[3:], acc))
+        k2 = _derivative(self, state + (h/2)*k1, l)
+        k3 = _derivative(self, state + (h/2)*k2, l)
+        k4 = _derivative(self, state + h*k3, l)
+
+        state += (h/6) * (k1 + 2*k2 + 2*k3 + k4)
+
+        return h, self._acceleration(state, l)
+
+class RK45(Integrator):
+    """
+    Dormand-Prince 5(4) embedded Runge-Kutta with adaptive step size. The 4th order solution is
+    only used to estimate the error of the 5th order one, and the step is shrunk or grown so
+    that error stays around rtol/atol. With an ensemble every particle shares the step, so it
+    is set by whichever particle has the largest error
+
+    """
+
+    name = "rk45"
+    adaptive = True
+
+    #Butcher tableau
+    C = (0, 1/5, 3/10, 4/5, 8/9, 1, 1)
+    A = (
+        (),
+        (1/5,),
+        (3/40, 9/40),
+        (44/45, -56/15, 32/9),
+        (19372/6561, -25360/2187, 64448/6561, -212/729),
+        (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+        (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+    )
+    B = (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0)
+    B_LOW = (5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40)
+    E = tuple(b - bLow for b, bLow in zip(B, B_LOW))
+
+    def __init__(self, deltaT=0.001, rtol=1e-9, atol=1e-12, minDeltaT=1e-12, maxDeltaT=0.1):
+        super().__init__(deltaT)
+        self.rtol = rtol
+        self.atol = atol
+        self.minDeltaT = minDeltaT
+        self.maxDeltaT = maxDeltaT
+
+    def step(self, state, l, acc=None, deltaT=None):
+        h = self.deltaT if deltaT is None else deltaT
+
+        if acc is None:
+            acc = self._acceleration(state, l)
+        k1 = np.concatenate((state[3:], acc))
+
+        while True:
+            k = [k1]
+            for a in self.A[1:]:
+                k.append(_derivative(self, state + h*_combine(a, k), l))
+            #the last stage is evaluated at the 5th order solution (first same as last), so it is the new state
+            new = state + h*_combine(self.A[-1], k)
+
+            error = h*_combine(self.E, k)
+            scale = self.atol + self.rtol * np.maximum(np.abs(state), np.abs(new))
+            err = np.sqrt(np.mean((error/scale)**2, axis=0)).max() #rms over the state, worst particle
+
+            if err <= 1 or h <= self.minDeltaT:
+                break
+
+            self.nRejected += 1
+            h = max(h * max(0.2, 0.9 * err**(-1/5)), self.minDeltaT) #try again with a smaller step
+
+        state[...] = new
+
+        #next step size from the error of this one
+        factor = 5 if err == 0 else min(5, max(0.2, 0.9 * err**(-1/5)))
+        self.deltaT = min(h * factor, self.maxDeltaT)
+
+        return h, k[-1][3:].copy()
+
+class Splitting(Integrator):
+    """
+    Symplectic splitting integrator adapted to the rotating frame. The motion is split into a
+    "kick" where the velocity changes from gravity and the centrifugal term, and a "drift" where
+    the body moves under only the Coriolis force. Both of those can be solved exactly (the drift
+    just rotates the velocity at rate 2 in the x-y plane), so alternating them keeps the Jacobi
+    constant from drifting off over long runs. order=2 is Strang splitting (a leapfrog with the
+    Coriolis rotation built in) and order=4 composes three of those (Yoshida)
+
+    """
+
+    name = "leapfrog"
+
+    def __init__(self, deltaT=0.001, order=2):
+        super().__init__(deltaT)
+
+        if order == 2:
+            drifts = [1.0]
+        elif order == 4:
+            w1 = 1 / (2 - 2**(1/3))
+            w0 = 1 - 2*w1
+            drifts = [w1, w0, w1]
+        else:
+            raise ValueError("order must be 2 or 4")
+
+        self.order = order
+        self.drifts = drifts
+        #a half kick on either side of every drift, with neighbouring halves merged together
+        self.kicks = [drifts[0]/2] + [(a + b)/2 for a, b in zip(drifts, drifts[1:])] + [drifts[-1]/2]
+
+    def step(self, state, l, acc=None, deltaT=None):
+        h = self.deltaT if deltaT is None else deltaT
+
+        if acc is None:
+            acc = self._acceleration(state, l)
+        force = acc - add_coriolis(np.zeros_like(acc), state[3:]) #take the Coriolis part back out of acc
+
+        for kick, drift in zip(self.kicks, self.drifts):
+            state[3:] += kick*h*force
+            _coriolis_drift(state, drift*h)
+
+            self.nEvaluations += 1
+            force = calc_potential_acceleration(state[:3], l)
+
+        state[3:] += self.kicks[-1]*h*force
+
+        return h, add_coriolis(force, state[3:])
+
+class Yoshida4(Splitting):
+    """
+    4th order version of the splitting integrator
+
+    """
+
+    name = "yoshida4"
+
+    def __init__(self, deltaT=0.005):
+        super().__init__(deltaT, order=4)
+
+def _coriolis_drift(state, h):
+    """
+    Move a state for time h under only the Coriolis force. The x-y velocity rotates clockwise
+    at rate 2 and the position follows it exactly
+
+    """
+
+    c = math.cos(2*h)
+    s = math.sin(2*h)
+
+    xVel = state[3].copy()
+    yVel = state[4].copy()
+
+    #integral of the rotating velocity over the step
+    state[0] += (s*xVel + (1 - c)*yVel) / 2
+    state[1] += (s*yVel - (1 - c)*xVel) / 2
+    state[2] += h*state[5]
+
+    state[3] = c*xVel + s*yVel
+    state[4] = c*yVel - s*xVel
+
+def _derivative(integrator, state, l):
+    """
+    Time derivative of a state array (velocities then accelerations)
+
+    """
+
+    return np.concatenate((state[3:], integrator._acceleration(state, l)))
+
+def _combine(weights, k):
+    """
+    Weighted sum of stages, skipping the zero weights
+
+    """
+
+    total = 0
+    for w, stage in zip(weights, k):
+        if w != 0:
+            total = total + w*stage
+
+    return total
+
+INTEGRATORS = {i.name: i for i in (Kinematic, RK4, RK45, Splitting, Yoshida4)}
+
+def make_integrator(integrator="kinematic", **kwargs):
+    """
+    Get an integrator by name (or pass an integrator object straight through). Keyword
+    arguments go to the integrator's constructor
+
+    """
+
+    if isinstance(integrator, Integrator):
+        return integrator
+
+    try:
+        return INTEGRATORS[integrator](**kwargs)
+    except KeyError:
+        raise ValueError("unknown integrator {!r}, options are: {}".format(integrator, ", ".join(INTEGRATORS)))
+
+def restore_integrator(saved):
+    """
+    Integrator from Integrator.checkpoint(), in exactly the same state it was saved in
+
+    """
+
+    integrator = make_integrator(saved["name"])
+    integrator.__dict__.update(saved["attributes"])
+
+    return integrator
+
+def _plain(value):
+    """
+    numpy scalars (and lists/tuples of them) as python ones so they can go in json. Floats
+    keep every bit (json writes them with repr)
+
+    """
+
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_plain(i) for i in value]
+
+    return value
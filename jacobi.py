@@ -0,0 +1,114 @@
+#keeping track of how well the Jacobi constant is conserved during a run
+import math, threading
+
+class JacobiMonitor:
+    """
+    Collects samples of the Jacobi constant over a run and keeps drift statistics: drift is
+    the sample minus the first sample (the real motion keeps it constant, so any drift is
+    integration error). Stats are kept for the whole run and for a "window" that can be read
+    and reset (the render loop uses one window per frame). Samples can come from one thread
+    while another reads the stats
+
+    If threshold is set, exceeded becomes True once the drift since the reference passes it.
+    rebase() moves the reference to the latest sample (after the step is made smaller, so the
+    next check measures only new error)
+
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.initial = None #first sample
+            self.reference = None #value drift is checked against for the threshold
+            self.latest = None
+            self.samples = 0
+            self.maxDrift = 0.0 #largest |drift| from the first sample over the run
+            self._sumSquares = 0.0
+            self._windowMax = 0.0
+            self.exceeded = False
+
+    def update(self, value):
+        """
+        Add a sample. Returns True if the drift since the reference is over the threshold
+
+        """
+
+        value = float(value)
+        with self._lock:
+            if self.initial is None:
+                self.initial = value
+                self.reference = value
+
+            drift = abs(value - self.initial)
+            self.latest = value
+            self.samples += 1
+            self.maxDrift = max(self.maxDrift, drift)
+            self._sumSquares += drift*drift
+            self._windowMax = max(self._windowMax, drift)
+
+            if self.threshold is not None and abs(value - self.reference) > self.threshold:
+                self.exceeded = True
+
+            return self.exceeded
+
+    def rebase(self):
+        """
+        Check the threshold against the latest sample from now on
+
+        """
+
+        with self._lock:
+            self.reference = self.latest
+            self.exceeded = False
+
+    @property
+    def drift(self):
+        if self.latest is None:
+            return 0.0
+        return self.latest - self.initial
+
+    @property
+    def rmsDrift(self):
+        return math.sqrt(self._sumSquares / self.samples) if self.samples else 0.0
+
+    def take_window(self):
+        """
+        Largest |drift| since the last call (per frame stats), and start a new window
+
+        """
+
+        with self._lock:
+            windowMax = self._windowMax
+            self._windowMax = 0.0
+
+        return windowMax
+
+    def checkpoint(self):
+        """
+        All the stats as a json friendly dict (JacobiMonitor.from_checkpoint makes it again)
+
+        """
+
+        with self._lock:
+            return {key : value for key, value in vars(self).items() if key != "_lock"}
+
+    @classmethod
+    def from_checkpoint(cls, saved):
+        monitor = cls(saved["threshold"])
+        monitor.__dict__.update(saved)
+
+        return monitor
+
+    def summary(self):
+        return {
+            "jacobi" : self.latest,
+            "initial" : self.initial,
+            "drift" : self.drift,
+            "maxDrift" : self.maxDrift,
+            "rmsDrift" : self.rmsDrift,
+            "samples" : self.samples,
+        }
@@ -0,0 +1,170 @@
+#positions of the five lagrange points for any lambda
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+#where the collinear points are, with the bodies at x=l and x=l-1:
+# L1 : between the bodies (l-1 < x < l)
+# L2 : past the body at l-1 (x < l-1)
+# L3 : past the body at l (x > l)
+
+def _axis_force(x, l):
+    """
+    x acceleration of a third body at rest at (x, 0, 0) and its derivative with respect to x.
+    Lagrange points on the x axis are where this is 0
+
+    """
+
+    d1 = x - l
+    d2 = x + 1 - l
+    a1 = np.abs(d1)**3
+    a2 = np.abs(d2)**3
+
+    force = x - (1-l)*d1/a1 - l*d2/a2
+    slope = 1 + 2*(1-l)/a1 + 2*l/a2 #always positive, so there is exactly one root between each pair of singularities
+
+    return force, slope
+
+def collinear_points(l, tolerance=1e-14, maxIterations=100):
+    """
+    x coordinates of L1, L2 and L3 for a float or array of lambdas. Returns an array with a
+    last axis of length 3 (L1, L2, L3). Solved with Newton's method on the force along the x
+    axis, falling back to bisection whenever a Newton step leaves the interval the root is
+    known to be in, all lambdas at once
+
+    """
+
+    l = np.asarray(l, dtype=float)[..., None] #extra axis for the three points
+    if np.any((l <= 0) | (l >= 1)):
+        raise ValueError("lambda must be between 0 and 1")
+
+    gap = 1e-12 #stay off the bodies where the force blows up
+    low = np.concatenate(np.broadcast_arrays(l - 1 + gap, l - 3, l + gap), axis=-1)
+    high = np.concatenate(np.broadcast_arrays(l - gap, l - 1 - gap, l + 2), axis=-1)
+
+    #start from the hill radius of the lighter body for L1, and of each body for L2 and L3 (capped so they stay inside the intervals)
+    hill1 = np.minimum(np.cbrt((1-l)/3), 0.5) #body at l has mass 1-l
+    hill2 = np.minimum(np.cbrt(l/3), 0.5)
+    x = np.concatenate(np.broadcast_arrays(np.where(l > 0.5, l - hill1, l - 1 + hill2), l - 1 - hill2, l + hill1), axis=-1)
+    l = np.broadcast_to(l, x.shape)
+
+    for i in range(maxIterations):
+        force, slope = _axis_force(x, l)
+
+        #shrink the interval around the root (force increases with x)
+        low = np.where(force < 0, x, low)
+        high = np.where(force > 0, x, high)
+
+        step = force / slope
+        new = x - step
+        outside = (new < low) | (new > high)
+        new = np.where(outside, (low + high)/2, new)
+
+        close = tolerance * np.maximum(1, np.abs(x))
+        done = np.all(((np.abs(new - x) <= close) & ~outside) | (high - low <= close))
+        x = new
+        if done:
+            break
+
+    return x
+
+def _compute(l):
+    """
+    All five lagrange points for an array of lambdas, shape (n, 5, 3)
+
+    """
+
+    l = np.asarray(l, dtype=float).ravel()
+    points = np.zeros((len(l), 5, 3))
+    points[:, :3, 0] = collinear_points(l)
+
+    #L4 and L5 make equilateral triangles with the two bodies
+    points[:, 3, 0] = l - 0.5
+    points[:, 3, 1] = math.sqrt(3)/2
+    points[:, 4, 0] = l - 0.5
+    points[:, 4, 1] = -math.sqrt(3)/2
+
+    return points
+
+class _LRUCache:
+    """
+    Lagrange points by lambda, throwing out the least recently used once it is full
+
+    """
+
+    def __init__(self, maxSize=4096):
+        self.maxSize = maxSize
+        self._points = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ls):
+        """
+        (n, 5, 3) array of points for a 1D array of lambdas. Only the lambdas that aren't cached
+        get solved for (together in one pass)
+
+        """
+
+        result = np.empty((len(ls), 5, 3))
+        missing = []
+        for i, l in enumerate(ls):
+            points = self._points.get(l)
+            if points is None:
+                missing.append(i)
+            else:
+                self._points.move_to_end(l)
+                result[i] = points
+
+        self.hits += len(ls) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            result[missing] = _compute(ls[missing])
+            for i in missing:
+                points = result[i].copy()
+                points.flags.writeable = False
+                self._points[ls[i]] = points
+                self._points.move_to_end(ls[i])
+
+            while len(self._points) > self.maxSize:
+                self._points.popitem(last=False)
+
+        return result
+
+    def clear(self):
+        self._points.clear()
+        self.hits = 0
+        self.misses = 0
+
+_cache = _LRUCache()
+
+def lagrange_points(l):
+    """
+    Positions of L1 to L5. For one lambda returns a (5, 3) array (row n-1 is Ln), for an array
+    of lambdas returns an array with two extra axes (..., 5, 3). Results are cached by lambda,
+    so resets and repeated sweeps don't solve for the same points again
+
+    """
+
+    ls = np.asarray(l, dtype=float)
+    points = _cache.get(ls.ravel())
+
+    return points.reshape(ls.shape + (5, 3))
+
+def lagrange_point(number, l):
+    """
+    (x, y, z) of one lagrange point (number is 1 to 5) for a single lambda
+
+    """
+
+    if number not in (1, 2, 3, 4, 5):
+        raise ValueError("lagrange point must be 1, 2, 3, 4, or 5")
+
+    return tuple(float(i) for i in lagrange_points(float(l))[number - 1])
+
+def cache_info():
+    return {"hits" : _cache.hits, "misses" : _cache.misses, "size" : len(_cache._points), "maxSize" : _cache.maxSize}
+
+def clear_cache():
+    _cache.clear()
@@ -1,9 +1,22 @@
 #external library import
-import pygame, sys, random, math
+import pygame, sys, random, math, os, time, argparse, threading
 from pygame.locals import *
-from screeninfo import get_monitors #found in: https://stackoverflow.com/questions/3129322/how-do-i-get-monitor-resolution-in-python
 import numpy as np
 
+from engine import together_step, acceleration_and_jacobi
+from worker import SimulationWorker
+from trail import Trail
+from hud import Hud
+from recorder import Recorder, Replay
+from lagrange import lagrange_point
+from periodic import parse_orbit, orbit_at, family, family_cached
+from jacobi import JacobiMonitor
+from profiler import FrameProfiler
+from events import ImpactWatcher
+from cloud import Cloud
+from ensemble import Ensemble
+from checkpoint import save_checkpoint, load_checkpoint
+
 class InputBox:
     """
     Textbox class because I couldn't find a good library. But I still got
@@ -46,6 +59,10 @@ class InputBox:
                 # Re-render the text.
                 self.txt_surface = self.FONT.render(self.text, True, self.color)
 
+    def set_text(self, text):
+        self.text = text
+        self.txt_surface = self.FONT.render(self.text, True, self.color)
+
     def update(self):
         # Resize the box if the text is too long.
         width = max(self.initial_width, self.txt_surface.get_width()+10)
@@ -53,20 +70,45 @@ class InputBox:
 
     def draw(self, screen):
         # Blit the text.
-        screen.blit(self.txt_surface, (self.rect.x+5, self.rect.y+5))
+        textRect = screen.blit(self.txt_surface, (self.rect.x+5, self.rect.y+5))
         # Blit the rect.
-        pygame.draw.rect(screen, self.color, self.rect, 2)
+        return pygame.draw.rect(screen, self.color, self.rect, 2).union(textRect) #area drawn to
 
 class Sim:
 
-    windowWidth = int(get_monitors()[0].width)
-    windowHeight = int(get_monitors()[0].height)-100
+    #axis update orders for the legacy "random" mode, keyed by the roll of random.randint(1,6). The old branches for 2/5 and 3/6 could never take their "== 1" path, so those always went y, z, x and z, y, x
+    LEGACY_ORDERS = {1: "xyz", 4: "xzy", 2: "yzx", 5: "yzx", 3: "zyx", 6: "zyx"}
+
+    #attributes saved in a checkpoint (along with the random order's rng, the Jacobi stats, the path, the text boxes and the cloud)
+    CHECKPOINT_FIELDS = ("l", "thirdX", "thirdY", "thirdZ", "thirdXvel", "thirdYvel", "thirdZvel", "thirdXacc", "thirdYacc", "thirdZacc", "t", "deltaT", "_baseDeltaT",
+                         "collided", "halted", "jacobi", "updateOrder", "randomSeed", "threaded", "tPerFrame", "jacobiThreshold", "jacobiAction", "bodyRadius", "thirdRadius",
+                         "scale", "cloudMode", "cloudSize", "cloudSpread", "cloudVelocitySpread", "cloudIntegrator", "cloudDeltaT")
+
+    #window size, looked up from the monitor when a Sim is made unless it has been set first (benchmark.py sets it to run without a screen)
+    windowWidth = None
+    windowHeight = None
+
+    def __init__(self, x=0.27, y=0, z=0, xVel=0, yVel=0, zVel=0, l=0.7):
+        if self.windowWidth is None or self.windowHeight is None:
+            from screeninfo import get_monitors #found in: https://stackoverflow.com/questions/3129322/how-do-i-get-monitor-resolution-in-python (only needed to size the window)
+            monitor = get_monitors()[0]
+            self.windowWidth = int(monitor.width)
+            self.windowHeight = int(monitor.height)-100
 
-    def __init__(self):
         self._running = True
         self._display = None
 
-        self.updateOrder = "random" #order in which x, y, and z of body is updated. "together" == all at once; "random" == random order
+        self.updateOrder = "together" #order in which x, y, and z of body is updated. "together" == all at once; "random" == old random order, one axis at a time
+        self.randomSeed = 0 #seed for the "random" update order so runs can be reproduced
+        self.rng = random.Random(self.randomSeed)
+
+        self.threaded = True #run the physics in a background thread so it keeps a steady speed no matter the frame rate (only for the "together" update order)
+        self.worker = None
+        self.fps = 60 #frame rate cap for rendering
+
+        self.dirtyUpdates = True #only push the parts of the screen that were drawn to (this frame or last frame) to the display
+        self._dirty = [] #rects drawn to this frame
+        self._previousDirty = [] #rects drawn to last frame (they have to be updated to erase what was there)
 
         #define "center pixel" coordinates
         self.centerX = int(self.windowWidth/2)
@@ -77,19 +119,29 @@ class Sim:
 
         self.tPerFrame = 1000 #number of delta Ts renders per frame
         self.deltaT = 0.00001 #define standard time increment 
+        self.t = 0.0 #simulated time since the start of the run
+        self._baseDeltaT = self.deltaT #deltaT to go back to on reset (refining can make it smaller during a run)
+
+        #Jacobi constant should stay the same over a run, how much it drifts is how much error has built up
+        self.jacobiThreshold = None #drift that counts as too much (None to only watch it)
+        self.jacobiAction = "stop" #what to do when the drift passes the threshold. "stop" == stop the run; "refine" == halve deltaT and keep going
+        self.jacobiMonitor = JacobiMonitor(self.jacobiThreshold)
+        self.jacobi = None #latest Jacobi constant
+        self.frameDrift = 0.0 #largest drift seen during the last frame
+        self.halted = None #reason the run was stopped early (None if it wasn't)
 
         #set scale from x and y coords to pygame coords
         self.scale = 800
 
-        self.l = 0.7 #define the lambda for the equations. 0 < lambda < 1
+        self.l = l #define the lambda for the equations. 0 < lambda < 1
 
         #set initial conditions for initial x and x velocity and y and y velocity and z and z velocity (x=0.27, y=0 is cool) (x=0.48, y=0.34, l=0.7, scale=1000 is cool) (x=0.26, and then y=1, y=0.9, y=0.8, y=0.6 shows diversity of initial conditions (l=0.7)) (x=0, y=0.4, l=0.7) (x=0.26, y=0.5, l=0.7) (x=0.286, y=0, z=0.5, l=0.7)
-        self.thirdX = 0.27
-        self.thirdXvel = 0
-        self.thirdY = 0
-        self.thirdYvel = 0
-        self.thirdZ = 0
-        self.thirdZvel = 0
+        self.thirdX = x
+        self.thirdXvel = xVel
+        self.thirdY = y
+        self.thirdYvel = yVel
+        self.thirdZ = z
+        self.thirdZvel = zVel
 
         #empty variables for accelerations
         self.thirdXacc = None
@@ -104,18 +156,61 @@ class Sim:
         self.body2X = self.l - 1
 
         self.bodyRadius = 0.02
+        self.impacts = ImpactWatcher(self.l, self.bodyRadius + self.thirdRadius) #exact 3D collisions for the "together" update
 
-        self.thirdPrevious = [] #list of previous locations of third body to make path
         self.pathLength = 1200 #number of saved positions in path
+        self.thirdPrevious = Trail(self.pathLength) #ring buffer of previous locations of third body to make path
+        self.trailWidth = 3 #width of the path in pixels
 
         self.collided = False
 
+        #recording trajectories to disk (F2 starts/stops) and replaying them (F3, then left/right arrows to scrub)
+        self.recordFolder = "recordings"
+        self.recordEvery = 100 #number of steps between saved rows
+        self.recorder = None
+        self.lastRecording = None #path of the most recent recording
+        self._sinceRecord = 0 #steps since the last saved row (when not threaded)
+        self.replay = None
+        self.replayIndex = 0 #row of the replay being shown
+        self.replaySpeed = 10 #rows the replay moves forward each frame
+
+        #timing each stage of the frame (F4 turns it on and shows the overlay, F5 saves a cProfile of the next profileFrames frames, F6 a chrome trace)
+        self.profiler = FrameProfiler(window=300)
+        self.showProfile = False
+        self.profileFolder = "profiles"
+        self.profileFrames = 300
+        self._profileLines = [] #overlay text, refreshed every profileRefresh frames so it can be read
+        self.profileRefresh = 15
+
+        #a cloud of third bodies scattered around the initial conditions instead of one (F7 switches), integrated as arrays
+        self.cloudMode = False
+        self.cloud = None
+        self.cloudSize = 5000 #number of particles
+        self.cloudSpread = (0.01, 0.01, 0.0) #standard deviation of the starting x, y, z around the initial conditions
+        self.cloudVelocitySpread = (0.0, 0.0, 0.0) #same for the velocities
+        self.cloudIntegrator = "yoshida4" #the cloud moves as far per frame as one body does, but in bigger steps
+        self.cloudDeltaT = 0.001
+
+        #the whole run is saved to checkpointPath every checkpointEvery seconds and on quit, python main.py --resume PATH carries on from it (None turns it off)
+        self.checkpointPath = os.path.join("checkpoints", "sim.npz")
+        self.checkpointEvery = 60
+        self._lastCheckpoint = time.perf_counter()
+        self._resumed = None #(text box contents, cloud Ensemble or None) from a checkpoint, used once the window is open
+
+        self.inputError = None #why the last reset didn't happen (text that isn't a number, ...)
+
+        #a periodic orbit family that isn't saved yet is computed in a background thread so the window keeps going, and the sim restarts on the orbit when it is done
+        self.familyThread = None
+        self.familyStatus = None #what is being computed
+        self.familyError = None #set by the thread if it failed
+
     def on_init(self):
         pygame.init()
         self._display = pygame.display.set_mode((self.windowWidth,self.windowHeight), pygame.HWSURFACE, vsync=1)
         pygame.display.set_caption("Third Body Simulation")
 
         self.font = pygame.font.SysFont('Times New Roman', 20) #define font
+        self.hud = Hud(self.font) #caches rendered text so it isn't rendered again every frame
 
         #text input boxes for initial conditions 
         self.initial_l_input = InputBox(self.windowWidth-280, 20, 280, 30, self.font, text=str(self.l))
@@ -132,7 +227,7 @@ class Sim:
 
         self.initial_zVel_input = InputBox(self.windowWidth-202, 200, 202, 30, self.font, text=str(self.thirdZvel))
 
-        self.lagrange_point_input = InputBox(self.windowWidth-260, 230, 260, 30, self.font, text=("none")) #input box to start at a specific lagrange point (only have 4 and 5 currently available)
+        self.lagrange_point_input = InputBox(self.windowWidth-260, 230, 260, 30, self.font, text=("none")) #input box to start at a specific lagrange point (1 to 5), or on a periodic orbit ("halo 1 3.05")
 
         #errors for starting at lagrange point (if you want to look at behavor not quite exactly at point)
         self.lagrange_point_errorX = InputBox(self.windowWidth-195, 260, 195, 30, self.font, text="0")
@@ -141,131 +236,144 @@ class Sim:
 
         self.scale_input = InputBox(self.windowWidth-340, 350, 340, 30, self.font, text=str(self.scale)) #input box for changing scale
 
+        self.clock = pygame.time.Clock()
+
+        if self._resumed is not None: #carry on from a checkpoint instead of starting over
+            inputs, cloudEnsemble = self._resumed
+            for name, text in inputs.items():
+                getattr(self, name).set_text(text)
+            self._start_physics(fresh=False, cloudEnsemble=cloudEnsemble)
+            self._resumed = None
+        else:
+            self._start_physics()
+
     def add_pos(self, x, y):
         """
         add position to list of previous positions for path
         
         """
 
-        self.thirdPrevious.append((x,y)) #append tuple
-        
-        if len(self.thirdPrevious) > self.pathLength: #if list is over a certain length, cut list
-            del self.thirdPrevious[0]
+        self.thirdPrevious.add(x, y) #overwrites the oldest position once the path is full
 
     def reset_sim(self):
+        if self._family_pending(): #restarts once the family is ready
+            return
+
+        try:
+            l, (x, y, z, xVel, yVel, zVel) = self._read_initial_conditions()
+        except ValueError as error: #keep the current run going instead of crashing on a typo
+            self.inputError = str(error)
+            return
+        self.inputError = None
+
         #reset accelerations
         self.thirdXacc = None
         self.thirdYacc = None
         self.thirdZacc = None
 
         self.collided = False #it hasn't collided yet
+        self.t = 0.0
+        self.deltaT = self._baseDeltaT
+        self.jacobi = None
+        self.halted = None
 
-        #three cases for L1, L2, and L3:
-        # L2 : 0 = -x(x-l)^2(x+1-l)^2 - l(x-l)^2 - (1-l)(x+1-l)^2
-        # L1 : 0 = -x(x-l)^2(x+1-l)^2 + l(x-l)^2 - (1-l)(x+1-l)^2
-        # L3 : 0 = -x(x-l)^2(x+1-l)^2 + l(x-l)^2 + (1-l)(x+1-l)^2
+        self.rng = random.Random(self.randomSeed) #same update orders every time the sim is restarted
 
-        #these as coefficients (calculated by wolfram alpha)
-        #L2 : [-1, (4L - 2), (-6L**2 + 6L - 1), (4L**3 - 6L**2 + 2L - 1), (-L**4 + 2L**3 - L**2 + 4L - 2), (-3L**2 + 3L - 1)]
-        #L1 : [-1, (4L - 2), (-6L**2 + 6L - 1), (4L**3 - 6L**2 + 4L - 1), (-L**4 + 2L**3 - 5L**2 + 4L - 1), (2L**3 - 3L**2 + 3L - 1)]
-        #L3 : [-1, (4L - 2), (-6L**2 + 6L - 1), (4L**3 - 6L**2 + 2L + 1), (-L**4 + 2L**3 - L**2 - 4L + 2), (3L**2 - 3L + 1)]
+        self.l = l
+        self.thirdX, self.thirdY, self.thirdZ = x, y, z
+        self.thirdXvel, self.thirdYvel, self.thirdZvel = xVel, yVel, zVel
 
-        if self.lagrange_point_input.text == "4": #if the user specified starting at L4, override other settings and start there
-            self.l = float(self.initial_l_input.text) #only take in other parameter of lambda as it affects lagrange points
-            #reset velocities
-            self.thirdXvel = 0
-            self.thirdYvel = 0
-            self.thirdZvel = 0
+        #reset these after lambda value is changed
+        self.body1X = self.l
+        self.body2X = self.l - 1
+        self.impacts = ImpactWatcher(self.l, self.bodyRadius + self.thirdRadius)
 
-            self.thirdZ = 0 + float(self.lagrange_point_errorZ.text) #just set z to 0 plus the error... This is for Fan Fan
+        self.thirdPrevious.clear() #clear path
 
-            self.thirdX = self.l - 0.5 + float(self.lagrange_point_errorX.text) #defined x coord plus error
-            self.thirdY = (math.sqrt(3)/2) + float(self.lagrange_point_errorY.text) #defined y coord plus error
+        self.replay = None #go back to simulating if a replay was showing
+        self._start_physics() #start the physics over from the new initial conditions
 
-        elif self.lagrange_point_input.text == "5": #if the user specified starting at L5, override other settings and start there
-            self.l = float(self.initial_l_input.text) #only take in other parameter of lambda as it affects lagrange points
-            #reset velocities
-            self.thirdXvel = 0
-            self.thirdYvel = 0
-            self.thirdZvel = 0
+        if self.recorder is not None: #keep recording, but in a new file for the new run
+            self._start_recording()
+
+    def _read_initial_conditions(self):
+        """
+        lambda and the starting state from the text boxes. Raises ValueError (with a message to
+        show) if a box doesn't hold a number, or the orbit or lagrange point can't be found
 
-            self.thirdZ = 0 + float(self.lagrange_point_errorZ.text) #just set z to 0 plus the error... This is for Fan Fan
+        """
 
-            self.thirdX = self.l - 0.5 + float(self.lagrange_point_errorX.text) #defined x coord plus error
-            self.thirdY = -(math.sqrt(3)/2) + float(self.lagrange_point_errorY.text) #defined y coord plus error
+        l = self._read_number(self.initial_l_input, "lambda")
+        orbit = parse_orbit(self.lagrange_point_input.text)
 
-        elif self.lagrange_point_input.text == "2": #looking at second lagrange point
-            self.l = float(self.initial_l_input.text) #only take in other parameter of lambda as it affects lagrange points
-            #calculate roots of coorisponding polynomial
-            lRoots = (np.roots([-1, (4*self.l - 2), (-6*(self.l**2) + 6*self.l - 1), (4*(self.l**3) - 6*(self.l**2) + 2*self.l - 1), (-(self.l**4) + 2*(self.l**3) - self.l**2 + 4*self.l - 2), (-3*(self.l**2) + 3*self.l - 1)]))
+        if orbit is not None: #start on a periodic orbit (kind, lagrange point, Jacobi constant) plus the error
+            kind, point, jacobi = orbit
+            (x, y, z, xVel, yVel, zVel), period = orbit_at(kind, point, l, jacobi) #the family is computed once and saved in families/
 
-            #take only real roots --> this should just return one root. But could not in some cases I don't see? 
-            lRoots = [i.real for i in lRoots if i.imag == 0] #take only real roots
-            print(lRoots)
-            
-            #reset velocities
-            self.thirdXvel = 0
-            self.thirdYvel = 0
-            self.thirdZvel = 0
+            x += self._read_number(self.lagrange_point_errorX, "lagrange point error x")
+            y += self._read_number(self.lagrange_point_errorY, "lagrange point error y")
+            z += self._read_number(self.lagrange_point_errorZ, "lagrange point error z")
 
-            self.thirdZ = 0 + float(self.lagrange_point_errorZ.text) #just set z to 0 plus the error... This is for Fan Fan
+        elif self.lagrange_point_input.text in ("1", "2", "3", "4", "5"): #if the user specified starting at a lagrange point, override other settings and start there
+            pointX, pointY, pointZ = lagrange_point(int(self.lagrange_point_input.text), l) #only take in other parameter of lambda as it affects lagrange points (cached, so restarting at the same point again is free)
 
-            self.thirdX = lRoots[0] + float(self.lagrange_point_errorX.text) #defined x coord plus error
-            self.thirdY = 0 + float(self.lagrange_point_errorY.text) #defined y coord plus error (y is just 0)
-        
-        elif self.lagrange_point_input.text == "3": #looking at second lagrange point
-            self.l = float(self.initial_l_input.text) #only take in other parameter of lambda as it affects lagrange points
-            #calculate roots of coorisponding polynomial
-            lRoots = (np.roots([-1, (4*self.l - 2), (-6*(self.l**2) + 6*self.l - 1), (4*(self.l**3) - 6*(self.l**2) + 2*self.l + 1), (-(self.l**4) + 2*(self.l**3) - self.l**2 - 4*self.l + 2), (3*(self.l**2) - 3*self.l + 1)]))
-
-            #take only real roots --> this should just return one root. But could not in some cases I don't see? 
-            lRoots = [i.real for i in lRoots if i.imag == 0] #take only real roots
-            print(lRoots)
-            
-            #reset velocities
-            self.thirdXvel = 0
-            self.thirdYvel = 0
-            self.thirdZvel = 0
+            #start at the point plus the error, at rest
+            x = pointX + self._read_number(self.lagrange_point_errorX, "lagrange point error x")
+            y = pointY + self._read_number(self.lagrange_point_errorY, "lagrange point error y")
+            z = pointZ + self._read_number(self.lagrange_point_errorZ, "lagrange point error z") #This is for Fan Fan
+            xVel = yVel = zVel = 0
 
-            self.thirdZ = 0 + float(self.lagrange_point_errorZ.text) #just set z to 0 plus the error... This is for Fan Fan
+        else: #if no lagrange point is specified, use defined initial values
+            x = self._read_number(self.initial_x_input, "initial x")
+            y = self._read_number(self.initial_y_input, "initial y")
+            z = self._read_number(self.initial_z_input, "initial z")
+            xVel = self._read_number(self.initial_xVel_input, "initial x velocity")
+            yVel = self._read_number(self.initial_yVel_input, "initial y velocity")
+            zVel = self._read_number(self.initial_zVel_input, "initial z velocity")
 
-            self.thirdX = lRoots[0] + float(self.lagrange_point_errorX.text) #defined x coord plus error
-            self.thirdY = 0 + float(self.lagrange_point_errorY.text) #defined y coord plus error (y is just 0)
+        return l, (x, y, z, xVel, yVel, zVel)
 
-        elif self.lagrange_point_input.text == "1": #looking at second lagrange point
-            self.l = float(self.initial_l_input.text) #only take in other parameter of lambda as it affects lagrange points
-            #calculate roots of coorisponding polynomial
-            lRoots = (np.roots([-1, (4*self.l - 2), (-6*(self.l**2) + 6*self.l - 1), (4*(self.l**3) - 6*(self.l**2) + 4*self.l - 1), (-(self.l**4) + 2*(self.l**3) - 5*(self.l**2) + 4*self.l - 2), (2*(self.l**3) - 3*(self.l**2) + 3*self.l - 1)]))
+    def _family_pending(self):
+        """
+        If the lagrange point box asks for a periodic orbit whose family isn't saved yet, start
+        computing it in a background thread and return True (reset_sim is called again from
+        on_loop once it is done). Also True while a family is still being computed
 
-            #take only real roots --> this should just return one root. But could not in some cases I don't see? 
-            lRoots = [i.real for i in lRoots if i.imag == 0] #take only real roots
-            print(lRoots)
-            
-            #reset velocities
-            self.thirdXvel = 0
-            self.thirdYvel = 0
-            self.thirdZvel = 0
+        """
 
-            self.thirdZ = 0 + float(self.lagrange_point_errorZ.text) #just set z to 0 plus the error... This is for Fan Fan
+        if self.familyThread is not None:
+            return True
 
-            self.thirdX = lRoots[0] + float(self.lagrange_point_errorX.text) #defined x coord plus error
-            self.thirdY = 0 + float(self.lagrange_point_errorY.text) #defined y coord plus error (y is just 0)
+        orbit = parse_orbit(self.lagrange_point_input.text)
+        if orbit is None:
+            return False
+        try:
+            l = self._read_number(self.initial_l_input, "lambda")
+        except ValueError: #reset_sim shows the error
+            return False
 
-        else: #if no lagrange point is specified, use defined initial values
-            #set initial values based on text box
-            self.l = float(self.initial_l_input.text)
-            self.thirdX = float(self.initial_x_input.text)
-            self.thirdXvel = float(self.initial_xVel_input.text)
-            self.thirdY = float(self.initial_y_input.text)
-            self.thirdYvel = float(self.initial_yVel_input.text)
-            self.thirdZ = float(self.initial_z_input.text)
-            self.thirdZvel = float(self.initial_zVel_input.text)
+        kind, point, jacobi = orbit
+        if family_cached(kind, point, l):
+            return False
 
-        #reset these after lambda value is changed
-        self.body1X = self.l
-        self.body2X = self.l - 1
+        self.familyStatus = "computing the {} L{} family for lambda {} (run python periodic.py {} {} --l {} to save it ahead of time)".format(kind, point, l, kind, point, l)
+        self.familyError = None
+        self.familyThread = threading.Thread(target=self._compute_family, args=(kind, point, l), daemon=True)
+        self.familyThread.start()
+
+        return True
+
+    def _compute_family(self, kind, point, l):
+        try:
+            family(kind, point, l) #saved in families/ and kept in memory, so the restart after this gets it straight away
+        except Exception as error: #shown in the window instead of dying quietly in the thread
+            self.familyError = "no {} L{} family for lambda {} ({})".format(kind, point, l, error)
 
-        self.thirdPrevious = [] #clear path
+    def _read_number(self, box, name):
+        try:
+            return float(box.text)
+        except ValueError:
+            raise ValueError("{} has to be a number, not {!r}".format(name, box.text)) from None
 
     def on_event(self, event):
         if event.type == QUIT:
@@ -274,7 +382,38 @@ class Sim:
             if event.key == K_SLASH: #reset simulation with new initial values if user presses forward slash (random key, idk)
                 self.reset_sim()
             if event.key == pygame.K_BACKQUOTE: #set scale if backquote pressed
-                self.scale = int(self.scale_input.text)
+                try:
+                    self.scale = int(self.scale_input.text)
+                    self.inputError = None
+                except ValueError:
+                    self.inputError = "scale has to be a whole number, not {!r}".format(self.scale_input.text)
+            if event.key == pygame.K_F2 and self.cloud is None: #start or stop recording (one body only)
+                if self.recorder is None:
+                    self._start_recording()
+                else:
+                    self._stop_recording()
+            if event.key == pygame.K_F3: #replay the last recording (or stop replaying)
+                if self.replay is None:
+                    self._start_replay()
+                else:
+                    self.reset_sim()
+            if event.key == pygame.K_F4: #timing overlay on/off
+                self.showProfile = not self.showProfile
+                self.profiler.enabled = self.showProfile
+                self.profiler.reset()
+            if event.key in (pygame.K_F5, pygame.K_F6) and not self.profiler.capturing: #profile the next few hundred frames to a file
+                kind = "cprofile" if event.key == pygame.K_F5 else "trace"
+                name = time.strftime("%Y%m%d-%H%M%S") + (".pstats" if kind == "cprofile" else ".trace.json")
+                self.profiler.capture(os.path.join(self.profileFolder, name), self.profileFrames, kind)
+            if event.key == pygame.K_F7: #switch between one third body and a cloud of them (starts over)
+                self.cloudMode = not self.cloudMode
+                self._stop_recording()
+                self.reset_sim()
+                if self.inputError is not None: #couldn't restart, so it is still the old run
+                    self.cloudMode = not self.cloudMode
+            if self.replay is not None and event.key in (pygame.K_LEFT, pygame.K_RIGHT): #scrub through the replay
+                jump = max(1, len(self.replay) // 100) * (1 if event.key == pygame.K_RIGHT else -1)
+                self.replayIndex = min(max(self.replayIndex + jump, 0), len(self.replay) - 1)
 
         #handle all textbox event updates
         self.initial_l_input.handle_event(event)
@@ -292,89 +431,61 @@ class Sim:
 
     def on_loop(self):
 
-        if self.updateOrder == "together" and not self.collided: #don't run if has collided
-            for i in range(self.tPerFrame): #run position updates set number of times
-                #update accelerations for x, y, and z 
-                self._calc_d2dx()
-                self._calc_d2dy()
-                self._calc_d2dz()
-
-                #update positions and velocities 
-                self.thirdX,self.thirdXvel = self._updateX(self.thirdX, self.thirdXvel, self.thirdXacc, t=self.deltaT)
-                self.thirdY,self.thirdYvel = self._updateX(self.thirdY, self.thirdYvel, self.thirdYacc, t=self.deltaT)
-                self.thirdZ,self.thirdZvel = self._updateX(self.thirdZ, self.thirdZvel, self.thirdZacc, t=self.deltaT)
-
-                #run collision detection
-                self._collision_detection(1)
-                self._collision_detection(2)
-
-                if i % 100 == 0: #save position value every 100 calculations
-                    self.add_pos(self.thirdX, self.thirdY)    
-        
-        elif self.updateOrder == "random" and not self.collided: #don't run if has collided
-            for i in range(self.tPerFrame): #run position updates set number of times
-                randomSeed = random.randint(1,6) #6 options for update order
-
-                if randomSeed == 1 or randomSeed == 4:
-                    self._calc_d2dx()
-                    self.thirdX,self.thirdXvel = self._updateX(self.thirdX, self.thirdXvel, self.thirdXacc, t=self.deltaT)
-
-                    if randomSeed == 1:
-                        self._calc_d2dy()
-                        self.thirdY,self.thirdYvel = self._updateX(self.thirdY, self.thirdYvel, self.thirdYacc, t=self.deltaT)
-
-                        self._calc_d2dz()                
-                        self.thirdZ,self.thirdZvel = self._updateX(self.thirdZ, self.thirdZvel, self.thirdZacc, t=self.deltaT)
+        if self.familyThread is not None and not self.familyThread.is_alive(): #background family is done, start on the orbit now
+            self.familyThread = None
+            if self.familyError is not None:
+                self.inputError = self.familyError
+            else:
+                self.reset_sim()
 
-                    else: 
-                        self._calc_d2dz()                
-                        self.thirdZ,self.thirdZvel = self._updateX(self.thirdZ, self.thirdZvel, self.thirdZacc, t=self.deltaT)
+        if self.replay is not None: #showing a recording instead of simulating
+            self._read_replay()
 
-                        self._calc_d2dy()
-                        self.thirdY,self.thirdYvel = self._updateX(self.thirdY, self.thirdYvel, self.thirdYacc, t=self.deltaT)
-                
-                elif randomSeed == 2 or randomSeed == 5:
-                    self._calc_d2dy()
-                    self.thirdY,self.thirdYvel = self._updateX(self.thirdY, self.thirdYvel, self.thirdYacc, t=self.deltaT)
+        elif self.cloud is not None: #the whole cloud moves as far as one body would in a frame
+            self.cloud.advance(self.tPerFrame * self._baseDeltaT)
+            self.t = self.cloud.t
 
-                    if randomSeed == 1:
-                        self._calc_d2dx()
-                        self.thirdX,self.thirdXvel = self._updateX(self.thirdX, self.thirdXvel, self.thirdXacc, t=self.deltaT)
+        elif self.worker is not None: #physics is running in the background, just grab the latest state
+            self._read_worker()
 
-                        self._calc_d2dz()                
-                        self.thirdZ,self.thirdZvel = self._updateX(self.thirdZ, self.thirdZvel, self.thirdZacc, t=self.deltaT)
+        elif not self.collided and self.halted is None: #don't run if has collided (or was stopped for too much drift)
+            for i in range(self.tPerFrame): #run position updates set number of times
+                check = i % 100 == 0 #check the Jacobi constant every 100 steps
 
-                    else: 
-                        self._calc_d2dz()                
-                        self.thirdZ,self.thirdZvel = self._updateX(self.thirdZ, self.thirdZvel, self.thirdZacc, t=self.deltaT)
+                if self.updateOrder == "together":
+                    self.t += self.deltaT * self._step_together(withJacobi=check) #stops right at the surface if it hits a body
+                elif self.updateOrder == "random":
+                    if check: #the legacy update has no kernel call to share, so it costs one extra
+                        self.jacobi = acceleration_and_jacobi(self.thirdX, self.thirdY, self.thirdZ, self.thirdXvel, self.thirdYvel, self.thirdZvel, self.l)[3]
+                    self._step_axes(self.LEGACY_ORDERS[self.rng.randint(1,6)]) #6 options for update order
+                    self.t += self.deltaT
 
-                        self._calc_d2dx()
-                        self.thirdX,self.thirdXvel = self._updateX(self.thirdX, self.thirdXvel, self.thirdXacc, t=self.deltaT)
-                else:
-                    self._calc_d2dz()                
-                    self.thirdZ,self.thirdZvel = self._updateX(self.thirdZ, self.thirdZvel, self.thirdZacc, t=self.deltaT)
+                    #run collision detection (the original check, at the end of the step in the x-y plane)
+                    self._collision_detection(1)
+                    self._collision_detection(2)
 
-                    if randomSeed == 1:
-                        self._calc_d2dx()
-                        self.thirdX,self.thirdXvel = self._updateX(self.thirdX, self.thirdXvel, self.thirdXacc, t=self.deltaT)
+                if check:
+                    self._check_jacobi()
 
-                        self._calc_d2dy()
-                        self.thirdY,self.thirdYvel = self._updateX(self.thirdY, self.thirdYvel, self.thirdYacc, t=self.deltaT)
-
-                    else: 
-                        self._calc_d2dy()
-                        self.thirdY,self.thirdYvel = self._updateX(self.thirdY, self.thirdYvel, self.thirdYacc, t=self.deltaT)
+                if i % 100 == 0: #save position value every 100 calculations
+                    self.add_pos(self.thirdX, self.thirdY)
 
-                        self._calc_d2dx()
-                        self.thirdX,self.thirdXvel = self._updateX(self.thirdX, self.thirdXvel, self.thirdXacc, t=self.deltaT)
+                if self.recorder is not None:
+                    self._sinceRecord += 1
+                    if self._sinceRecord >= self.recorder.decimation:
+                        self.recorder.record(self.t, self.thirdX, self.thirdY, self.thirdZ, self.thirdXvel, self.thirdYvel, self.thirdZvel, self.thirdXacc, self.thirdYacc, self.thirdZacc)
+                        self._sinceRecord = 0
 
-                #run collision detection
-                self._collision_detection(1)
-                self._collision_detection(2)
+                if self.collided and self.updateOrder == "together": #nothing more to do once it has hit
+                    self.add_pos(self.thirdX, self.thirdY)
+                    break
+                if self.halted is not None: #drifted too far (this step was still taken, like in the worker)
+                    break
 
-                if i % 100 == 0: #save position value every 100 calculations
-                    self.add_pos(self.thirdX, self.thirdY) 
+        self.frameDrift = self.jacobiMonitor.take_window()
 
+        if self.checkpointPath is not None and self.replay is None and time.perf_counter() - self._lastCheckpoint >= self.checkpointEvery:
+            self.save_checkpoint() #between frames, so the run carries on from the start of the next one
 
         #update all textboxes
         self.initial_l_input.update()
@@ -395,76 +506,397 @@ class Sim:
     def on_render(self):
         
         self._display.fill((0,0,0))
-        self._display.blit(self.font.render("Best Planet", True, (255, 255, 255)), (20, 20))
+        hud = self.hud
+        dirty = self._dirty = [] #everything drawn this frame
+
+        with self.profiler.section("text"):
+            dirty.append(hud.label(self._display, "Best Planet", (20, 20)))
         
-        #render third body coords 
-        self._display.blit(self.font.render(" x = {}".format(self.thirdX), True, (255, 255, 255)), (20, 50))
-        self._display.blit(self.font.render(" y = {}".format(self.thirdY), True, (255, 255, 255)), (20, 70))
-        self._display.blit(self.font.render(" z = {}".format(self.thirdZ), True, (255, 255, 255)), (20, 90))
+            #render third body coords (only re-rendered when the numbers change)
+            dirty.append(hud.value(self._display, "x", " x = {}".format(self.thirdX), (20, 50)))
+            dirty.append(hud.value(self._display, "y", " y = {}".format(self.thirdY), (20, 70)))
+            dirty.append(hud.value(self._display, "z", " z = {}".format(self.thirdZ), (20, 90)))
+
+            dirty.append(hud.value(self._display, "xVel", " x velocity = {}".format(self.thirdXvel), (20, 110)))
+            dirty.append(hud.value(self._display, "yVel", " y velocity = {}".format(self.thirdYvel), (20, 130)))
+            dirty.append(hud.value(self._display, "zVel", " z velocity = {}".format(self.thirdZvel), (20, 150)))
+
+            dirty.append(hud.value(self._display, "xAcc", " x acceleration = {}".format(self.thirdXacc), (20, 170)))
+            dirty.append(hud.value(self._display, "yAcc", " y acceleration = {}".format(self.thirdYacc), (20, 190)))
+            dirty.append(hud.value(self._display, "zAcc", " z acceleration = {}".format(self.thirdZacc), (20, 210)))
+
+            #how well the Jacobi constant is holding up
+            if self.jacobi is not None and self.replay is None:
+                monitor = self.jacobiMonitor
+                dirty.append(hud.value(self._display, "jacobi", " Jacobi constant = {:.10f}".format(self.jacobi), (20, 230)))
+                dirty.append(hud.value(self._display, "drift", " drift = {:.2e} (this frame {:.2e}, max {:.2e}, rms {:.2e}), deltaT = {:.2e}".format(monitor.drift, self.frameDrift, monitor.maxDrift, monitor.rmsDrift, self.deltaT), (20, 250)))
+
+            #recording/replay status
+            if self.replay is not None:
+                dirty.append(hud.value(self._display, "status", " replay t = {:.3f} ({}/{})   F3 to stop, arrows to scrub".format(self.t, self.replayIndex, len(self.replay)), (20, 280)))
+            elif self.cloud is not None:
+                summary = self.cloud.summary()
+                dirty.append(hud.value(self._display, "status", " cloud t = {:.3f}: {} particles, {} moving, {} hit body 1, {} hit body 2, {} escaped   F7 for one body".format(
+                    self.t, summary["particles"], summary["active"], summary["collided body 1"], summary["collided body 2"], summary["escaped"]), (20, 280)))
+            elif self.familyThread is not None:
+                dirty.append(hud.value(self._display, "status", " {}...".format(self.familyStatus), (20, 280)))
+            elif self.inputError is not None:
+                dirty.append(hud.value(self._display, "status", " couldn't restart: {}".format(self.inputError), (20, 280)))
+            elif self.halted is not None:
+                dirty.append(hud.value(self._display, "status", " stopped: {}".format(self.halted), (20, 280)))
+            elif self.recorder is not None:
+                dirty.append(hud.value(self._display, "status", " recording to {} (F2 to stop)".format(self.recorder.path), (20, 280)))
+
+        if self.cloud is not None: #every particle written straight into the pixels
+            with self.profiler.section("cloud"):
+                cloudRect = self.cloud.draw(self._display, self.centerX, self.centerY, self.scale)
+                if cloudRect is not None:
+                    dirty.append(cloudRect)
+
+        else:
+            #render path of third body (all at once as a fading line)
+            with self.profiler.section("trail"):
+                trailRect = self.thirdPrevious.draw(self._display, self.centerX, self.centerY, self.scale, self.trailWidth)
+                if trailRect is not None:
+                    dirty.append(trailRect)
+
+            #render third body
+            dirty.append(pygame.draw.circle(self._display, self.thirdColor, (self.thirdRenderX, self.thirdRenderY), int(self.thirdRadius * self.scale)))
 
-        self._display.blit(self.font.render(" x velocity = {}".format(self.thirdXvel), True, (255, 255, 255)), (20, 110))
-        self._display.blit(self.font.render(" y velocity = {}".format(self.thirdYvel), True, (255, 255, 255)), (20, 130))
-        self._display.blit(self.font.render(" z velocity = {}".format(self.thirdZvel), True, (255, 255, 255)), (20, 150))
+        #render first and second body 
+        dirty.append(pygame.draw.circle(self._display, (255,0,0), ( self.centerX + self.body1X*self.scale, self.centerY ), int(self.bodyRadius * self.scale) ))
+        dirty.append(pygame.draw.circle(self._display, (255, 0,0), ( self.centerX + self.body2X*self.scale, self.centerY ), int(self.bodyRadius * self.scale)  ))
+
+        with self.profiler.section("inputs"):
+            #render text box labels (rendered once and reused)
+            dirty.append(hud.label(self._display, "lambda value: ", (self.windowWidth-400, 20)))
+            dirty.append(hud.label(self._display, "initial x value: ", (self.windowWidth-400, 50)))
+            dirty.append(hud.label(self._display, "initial y value: ", (self.windowWidth-400, 80)))
+            dirty.append(hud.label(self._display, "initial z value: ", (self.windowWidth-400, 110)))
+            dirty.append(hud.label(self._display, "initial x velocity value: ", (self.windowWidth-400, 140)))
+            dirty.append(hud.label(self._display, "initial y velocity value: ", (self.windowWidth-400, 170)))
+            dirty.append(hud.label(self._display, "initial z velocity value: ", (self.windowWidth-400, 200)))
+            dirty.append(hud.label(self._display, "Lagrange Point: ", (self.windowWidth-400, 230)))
+            dirty.append(hud.label(self._display, "Lagrange Point Error X: ", (self.windowWidth-400, 260)))
+            dirty.append(hud.label(self._display, "Lagrange Point Error Y: ", (self.windowWidth-400, 290)))
+            dirty.append(hud.label(self._display, "Lagrange Point Error Z: ", (self.windowWidth-400, 320)))
+            dirty.append(hud.label(self._display, "Scale: ", (self.windowWidth-400, 350)))
+
+            #draw all text boxes
+            dirty.append(self.initial_l_input.draw(self._display))
+            dirty.append(self.initial_x_input.draw(self._display))
+            dirty.append(self.initial_y_input.draw(self._display))
+            dirty.append(self.initial_z_input.draw(self._display))
+            dirty.append(self.initial_xVel_input.draw(self._display))
+            dirty.append(self.initial_yVel_input.draw(self._display))
+            dirty.append(self.initial_zVel_input.draw(self._display))
+            dirty.append(self.lagrange_point_input.draw(self._display))
+            dirty.append(self.lagrange_point_errorX.draw(self._display))
+            dirty.append(self.lagrange_point_errorY.draw(self._display))
+            dirty.append(self.lagrange_point_errorZ.draw(self._display))
+            dirty.append(self.scale_input.draw(self._display))
+
+        if self.showProfile or self.profiler.capturing:
+            self._render_profile()
+
+    def update_display(self):
+        """
+        Push this frame to the screen. With dirtyUpdates only the areas drawn to this frame and
+        last frame are sent (everything else is still black from both frames)
 
-        self._display.blit(self.font.render(" x acceleration = {}".format(self.thirdXacc), True, (255, 255, 255)), (20, 170))
-        self._display.blit(self.font.render(" y acceleration = {}".format(self.thirdYacc), True, (255, 255, 255)), (20, 190))
-        self._display.blit(self.font.render(" z acceleration = {}".format(self.thirdZacc), True, (255, 255, 255)), (20, 210))
+        """
 
-        #render path of third body 
-        for position, index in zip(self.thirdPrevious, list(range(len(self.thirdPrevious)))): #loop through all previous locations
-            pygame.draw.circle(self._display, (0, 0, int(index * 200/self.pathLength) ), (self.centerX + position[0]*self.scale, self.centerY + position[1]*self.scale*-1), int(self.thirdRadius * self.scale))
+        if self.dirtyUpdates:
+            pygame.display.update(self._previousDirty + self._dirty)
+        else:
+            pygame.display.update()
 
-        #render third body
-        pygame.draw.circle(self._display, self.thirdColor, (self.thirdRenderX, self.thirdRenderY), int(self.thirdRadius * self.scale))
+        self._previousDirty = self._dirty
 
-        #render first and second body 
-        pygame.draw.circle(self._display, (255,0,0), ( self.centerX + self.body1X*self.scale, self.centerY ), int(self.bodyRadius * self.scale) )
-        pygame.draw.circle(self._display, (255, 0,0), ( self.centerX + self.body2X*self.scale, self.centerY ), int(self.bodyRadius * self.scale)  )
-
-        #render text box labels
-        self._display.blit(self.font.render("lambda value: ", True, (255, 255, 255)), (self.windowWidth-400, 20))
-        self._display.blit(self.font.render("initial x value: ", True, (255, 255, 255)), (self.windowWidth-400, 50))
-        self._display.blit(self.font.render("initial y value: ", True, (255, 255, 255)), (self.windowWidth-400, 80))
-        self._display.blit(self.font.render("initial z value: ", True, (255, 255, 255)), (self.windowWidth-400, 110))
-        self._display.blit(self.font.render("initial x velocity value: ", True, (255, 255, 255)), (self.windowWidth-400, 140))
-        self._display.blit(self.font.render("initial y velocity value: ", True, (255, 255, 255)), (self.windowWidth-400, 170))
-        self._display.blit(self.font.render("initial z velocity value: ", True, (255, 255, 255)), (self.windowWidth-400, 200))
-        self._display.blit(self.font.render("Lagrange Point: ", True, (255, 255, 255)), (self.windowWidth-400, 230))
-        self._display.blit(self.font.render("Lagrange Point Error X: ", True, (255, 255, 255)), (self.windowWidth-400, 260))
-        self._display.blit(self.font.render("Lagrange Point Error Y: ", True, (255, 255, 255)), (self.windowWidth-400, 290))
-        self._display.blit(self.font.render("Lagrange Point Error Z: ", True, (255, 255, 255)), (self.windowWidth-400, 320))
-        self._display.blit(self.font.render("Scale: ", True, (255, 255, 255)), (self.windowWidth-400, 350))
-
-        #draw all text boxes
-        self.initial_l_input.draw(self._display)
-        self.initial_x_input.draw(self._display)
-        self.initial_y_input.draw(self._display)
-        self.initial_z_input.draw(self._display)
-        self.initial_xVel_input.draw(self._display)
-        self.initial_yVel_input.draw(self._display)
-        self.initial_zVel_input.draw(self._display)
-        self.lagrange_point_input.draw(self._display)
-        self.lagrange_point_errorX.draw(self._display)
-        self.lagrange_point_errorY.draw(self._display)
-        self.lagrange_point_errorZ.draw(self._display)
-        self.scale_input.draw(self._display)
-
-    def on_quit(self):
+    def on_quit(self, checkpoint=True):
+        if checkpoint and self.checkpointPath is not None and self.replay is None:
+            self.save_checkpoint()
+        if self.worker is not None:
+            self.worker.stop()
+        self._stop_recording()
         pygame.quit()
 
     def on_execute(self):
         if self.on_init() == False:
             self._running = False
         pygame.display.flip()
-        while self._running:
-            events = pygame.event.get() #grab events
-            for event in events: #process all events
-                self.on_event(event)
-            self.on_loop()
-            self.on_render()
-            pygame.display.update()
+        profiler = self.profiler
+        try:
+            while self._running:
+                profiler.begin_frame()
+                profiler.run("on_event", self._handle_events)
+                profiler.run("on_loop", self.on_loop)
+                profiler.run("on_render", self.on_render)
+                profiler.run("display update", self.update_display)
+                profiler.run("tick", self.clock.tick, self.fps) #waiting for the frame rate cap
+                profiler.end_frame()
+        except BaseException:
+            self.on_quit(checkpoint=False) #could have died partway through a frame, so keep the last checkpoint instead
+            raise
         self.on_quit()
 
+    def save_checkpoint(self, path=None):
+        """
+        Save the whole run (to checkpointPath by default) so Sim.resume can carry on with it bit
+        for bit. The physics thread is paused while the state is read, so the position and the
+        Jacobi stats are from the same step, then started again from the same point
+
+        """
+
+        path = self.checkpointPath if path is None else path
+        worker = self.worker
+        if worker is not None:
+            worker.stop()
+            self._read_worker()
+
+        plain = lambda value: value.item() if isinstance(value, np.generic) else value #numpy scalars can't go in json
+        info = {
+            "sim" : {name : plain(getattr(self, name)) for name in self.CHECKPOINT_FIELDS},
+            "rng" : self.rng.getstate(), #where the "random" update order is in its sequence
+            "jacobiMonitor" : self.jacobiMonitor.checkpoint(),
+            "trail" : {"head" : self.thirdPrevious.head, "count" : self.thirdPrevious.count},
+            "inputs" : {name : getattr(self, name).text for name in vars(self) if isinstance(getattr(self, name), InputBox)},
+            "cloud" : None,
+        }
+        arrays = {"trail" : self.thirdPrevious.points}
+        if self.cloud is not None:
+            info["cloud"], cloudArrays = self.cloud.ensemble.checkpoint()
+            arrays.update({"cloud." + name : value for name, value in cloudArrays.items()})
+
+        save_checkpoint(path, info, arrays)
+        self._lastCheckpoint = time.perf_counter()
+
+        if worker is not None:
+            self._start_worker(fresh=False)
+            self.worker.recorder = self.recorder
+
+    @classmethod
+    def resume(cls, path):
+        """
+        A Sim that carries on from a checkpoint from save_checkpoint (and keeps saving to it)
+
+        """
+
+        info, arrays = load_checkpoint(path)
+        if "sim" not in info:
+            raise ValueError("{} isn't a checkpoint from the simulation window (resume runs from simulate.py with python simulate.py --resume)".format(path))
+
+        sim = cls()
+        for name, value in info["sim"].items():
+            setattr(sim, name, value)
+
+        version, internal, gauss = info["rng"]
+        sim.rng.setstate((version, tuple(internal), gauss))
+        sim.jacobiMonitor = JacobiMonitor.from_checkpoint(info["jacobiMonitor"])
+
+        sim.body1X = sim.l
+        sim.body2X = sim.l - 1
+        sim.impacts = ImpactWatcher(sim.l, sim.bodyRadius + sim.thirdRadius)
+
+        if arrays["trail"].shape == sim.thirdPrevious.points.shape:
+            sim.thirdPrevious.points[:] = arrays["trail"]
+            sim.thirdPrevious.head, sim.thirdPrevious.count = info["trail"]["head"], info["trail"]["count"]
+
+        cloudEnsemble = None
+        if info["cloud"] is not None:
+            cloudEnsemble = Ensemble.from_checkpoint(info["cloud"], {name[len("cloud."):] : value for name, value in arrays.items() if name.startswith("cloud.")})
+
+        sim._resumed = (info["inputs"], cloudEnsemble)
+        sim.checkpointPath = path
+
+        return sim
+
+    def _handle_events(self):
+        for event in pygame.event.get(): #process all events
+            self.on_event(event)
+
+    def _render_profile(self):
+        """
+        Draw the timing overlay in the bottom left: 50th, 95th and 99th percentile of each stage
+        over the last few hundred frames
+
+        """
+
+        profiler = self.profiler
+        if profiler.frames % self.profileRefresh == 0 or not self._profileLines:
+            lines = [" {:>15}  {:>8} {:>8} {:>8}  (ms)".format("stage", "p50", "p95", "p99")]
+            for name in ("on_event", "on_loop", "on_render", "text", "trail", "cloud", "inputs", "display update", "tick", "frame"):
+                times = profiler.percentiles(name)
+                if times is not None:
+                    lines.append(" {:>15}  {:8.2f} {:8.2f} {:8.2f}".format(name, *(i*1000 for i in times)))
+
+            physics = profiler.percentiles("on_loop", (50,))
+            if physics is not None and self.cloud is not None:
+                lines.append(" cloud of {} with {} (deltaT = {}), {:.2f} us per particle step".format(len(self.cloud), self.cloudIntegrator, self.cloudDeltaT,
+                                                                                                   physics[0]/(len(self.cloud)*max(1, round(self.tPerFrame*self._baseDeltaT/self.cloudDeltaT)))*1e6))
+            elif physics is not None and self.worker is None and self.replay is None:
+                lines.append(" tPerFrame = {} ({:.2f} us per step), pathLength = {}".format(self.tPerFrame, physics[0]/self.tPerFrame*1e6, self.pathLength))
+            else:
+                lines.append(" tPerFrame = {} (physics in the background thread), pathLength = {}".format(self.tPerFrame, self.pathLength))
+
+            if profiler.capturing:
+                lines.append(" capturing profile...")
+            elif profiler.lastCapture is not None:
+                lines.append(" saved {}".format(profiler.lastCapture))
+
+            self._profileLines = lines
+
+        top = self.windowHeight - 20*len(self._profileLines) - 20
+        for i, line in enumerate(self._profileLines):
+            self._dirty.append(self.hud.value(self._display, "profile {}".format(i), line, (20, top + 20*i)))
+
+    def _start_physics(self, fresh=True, cloudEnsemble=None):
+        """
+        Start simulating from the current initial conditions: a cloud around them in cloud mode,
+        otherwise the one third body (in the background thread if threaded). fresh=False carries
+        on a resumed run instead (keeping its Jacobi stats, and its cloud if cloudEnsemble is set)
+
+        """
+
+        if self.cloudMode:
+            self._start_cloud(fresh, cloudEnsemble)
+        else:
+            self.cloud = None
+            self._start_worker(fresh)
+
+    def _start_cloud(self, fresh=True, ensemble=None):
+        """
+        Scatter a new cloud of cloudSize particles around the current initial conditions (or
+        carry on with ensemble)
+
+        """
+
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+        if fresh:
+            self.jacobiMonitor = JacobiMonitor(self.jacobiThreshold)
+        if ensemble is not None:
+            self.cloud = Cloud(None, self.l, ensemble=ensemble)
+            return
+        self.cloud = Cloud.around((self.thirdX, self.thirdY, self.thirdZ, self.thirdXvel, self.thirdYvel, self.thirdZvel), self.l, count=self.cloudSize, spread=self.cloudSpread,
+                                  velocitySpread=self.cloudVelocitySpread, seed=self.randomSeed, integrator=self.cloudIntegrator, deltaT=self.cloudDeltaT,
+                                  bodyRadius=self.bodyRadius, thirdRadius=self.thirdRadius)
+
+    def _start_worker(self, fresh=True):
+        """
+        (Re)start the background physics thread from the current state of the third body.
+        fresh=False keeps the Jacobi stats (carrying on the same run)
+
+        """
+
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+        if fresh:
+            self.jacobiMonitor = JacobiMonitor(self.jacobiThreshold) #new run, new stats
+
+        if self.threaded and self.updateOrder == "together" and not self.collided and self.halted is None: #nothing to run for a resumed run that had already stopped
+            self.worker = SimulationWorker(self.thirdX, self.thirdY, self.thirdZ, self.thirdXvel, self.thirdYvel, self.thirdZvel, self.l, deltaT=self.deltaT, stepsPerSecond=self.tPerFrame*self.fps, bodyRadius=self.bodyRadius, thirdRadius=self.thirdRadius,
+                                           monitor=self.jacobiMonitor, jacobiAction=self.jacobiAction, minDeltaT=self._baseDeltaT/1024, t=self.t)
+            self.worker.start()
+
+    def _read_worker(self):
+        """
+        Copy the latest snapshot from the physics thread for rendering and pick up new path points
+
+        """
+
+        snapshot = self.worker.snapshot #one read so everything is from the same moment
+
+        self.thirdX, self.thirdY, self.thirdZ = snapshot.x, snapshot.y, snapshot.z
+        self.thirdXvel, self.thirdYvel, self.thirdZvel = snapshot.xVel, snapshot.yVel, snapshot.zVel
+        self.thirdXacc, self.thirdYacc, self.thirdZacc = snapshot.xAcc, snapshot.yAcc, snapshot.zAcc
+        self.collided = snapshot.collided
+        self.t = snapshot.t
+        self.jacobi = snapshot.jacobi
+        self.deltaT = snapshot.deltaT #can be smaller than it started if it was refined
+        self.halted = snapshot.halted
+
+        self.thirdPrevious.extend(self.worker.drain_trail())
+
+    def _start_recording(self):
+        """
+        Start saving the trajectory to a new file in recordFolder (closes any recording that was going)
+
+        """
+
+        self._stop_recording()
+
+        path = os.path.join(self.recordFolder, "run_{}.bin".format(time.strftime("%Y%m%d_%H%M%S")))
+        count = 1
+        while os.path.exists(path): #more than one recording in the same second
+            path = os.path.join(self.recordFolder, "run_{}_{}.bin".format(time.strftime("%Y%m%d_%H%M%S"), count))
+            count += 1
+
+        self.recorder = Recorder(path, self.l, (self.thirdX, self.thirdY, self.thirdZ, self.thirdXvel, self.thirdYvel, self.thirdZvel), deltaT=self.deltaT, decimation=self.recordEvery)
+        self.lastRecording = path
+        self._sinceRecord = 0
+
+        if self.worker is not None:
+            self.worker.recorder = self.recorder
+
+    def _stop_recording(self):
+        if self.recorder is None:
+            return
+
+        if self.worker is not None:
+            self.worker.recorder = None
+        self.recorder.close()
+        self.recorder = None
+
+    def _start_replay(self):
+        """
+        Stop simulating and show the last recording from the start
+
+        """
+
+        if self.lastRecording is None:
+            return
+
+        self._stop_recording()
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+        self.replay = Replay(self.lastRecording)
+        self.replayIndex = 0
+        self.cloud = None
+
+        #bodies go where they were for the recording
+        self.l = self.replay.l
+        self.body1X = self.l
+        self.body2X = self.l - 1
+
+    def _read_replay(self):
+        """
+        Show the current row of the replay and move it forward. The path is rebuilt from just
+        the rows before it (the rest of the file is never read)
+
+        """
+
+        if len(self.replay) == 0:
+            return
+
+        row = self.replay[self.replayIndex]
+        self.t = float(row["t"])
+        self.thirdX, self.thirdY, self.thirdZ = float(row["x"]), float(row["y"]), float(row["z"])
+        self.thirdXvel, self.thirdYvel, self.thirdZvel = float(row["xVel"]), float(row["yVel"]), float(row["zVel"])
+        self.thirdXacc, self.thirdYacc, self.thirdZacc = float(row["xAcc"]), float(row["yAcc"]), float(row["zAcc"])
+
+        stride = max(1, 100 // self.replay.decimation) #path points are 100 steps apart, like when simulating
+        self.thirdPrevious.clear()
+        self.thirdPrevious.extend(self.replay.positions(self.replayIndex - self.pathLength*stride, self.replayIndex + 1, stride))
+
+        self.replayIndex = min(self.replayIndex + self.replaySpeed, len(self.replay) - 1)
+
     def _collision_detection(self, bodyNumber):
         if bodyNumber == 1:
             centerX = self.body1X
@@ -496,6 +928,69 @@ class Sim:
         self.thirdRenderX = self.centerX + self.scale * self.thirdX 
         self.thirdRenderY = self.centerY + self.scale * self.thirdY * -1 
 
+    def _check_jacobi(self):
+        """
+        Give the monitor the Jacobi constant worked out during the last step (from the state at
+        its start) and stop or refine the step if it has drifted too far (when threaded, the
+        worker does this itself)
+
+        """
+
+        if self.jacobiMonitor.update(self.jacobi):
+            if self.jacobiAction == "refine" and self.deltaT/2 >= self._baseDeltaT/1024:
+                self.deltaT /= 2
+                self.jacobiMonitor.rebase()
+            else:
+                self.halted = "Jacobi drift over {}".format(self.jacobiThreshold)
+
+    def _step_together(self, withJacobi=False):
+        """
+        Update x, y, and z all at once from the same state (accelerations share the distance
+        calculations). With withJacobi the Jacobi constant of the state before the step comes
+        out of the same kernel call and goes in self.jacobi, like the worker does. If the body
+        touches a primary during the step (in 3D, even if it would have come back out by the
+        end) it is stopped at the surface. Returns the fraction of the step that was taken
+
+        """
+
+        before = (self.thirdX, self.thirdY, self.thirdZ, self.thirdXvel, self.thirdYvel, self.thirdZvel)
+
+        after = together_step(*before, self.l, self.deltaT, withJacobi=withJacobi)
+        if withJacobi:
+            self.jacobi = after[-1]
+
+        (self.thirdX, self.thirdY, self.thirdZ,
+         self.thirdXvel, self.thirdYvel, self.thirdZvel,
+         self.thirdXacc, self.thirdYacc, self.thirdZacc) = after[:9]
+
+        hit = self.impacts.check(before, (self.thirdX, self.thirdY, self.thirdZ, self.thirdXvel, self.thirdYvel, self.thirdZvel), (self.thirdXacc, self.thirdYacc, self.thirdZacc), self.deltaT)
+        if hit is None:
+            return 1.0
+
+        body, fraction, (self.thirdX, self.thirdY, self.thirdZ, xVel, yVel, zVel) = hit
+        self.thirdXvel = self.thirdYvel = self.thirdZvel = 0
+        self.collided = True #set true for collision
+
+        return fraction
+
+    def _step_axes(self, order):
+        """
+        Legacy update: one axis at a time in the given order (like "xzy"), each reading the
+        axes that were already updated this step
+
+        """
+
+        for axis in order:
+            if axis == "x":
+                self._calc_d2dx()
+                self.thirdX,self.thirdXvel = self._updateX(self.thirdX, self.thirdXvel, self.thirdXacc, t=self.deltaT)
+            elif axis == "y":
+                self._calc_d2dy()
+                self.thirdY,self.thirdYvel = self._updateX(self.thirdY, self.thirdYvel, self.thirdYacc, t=self.deltaT)
+            else:
+                self._calc_d2dz()
+                self.thirdZ,self.thirdZvel = self._updateX(self.thirdZ, self.thirdZvel, self.thirdZacc, t=self.deltaT)
+
     def _updateX(self, x, xVel, xAcc, t=0.0001):
         """
         Calculate new x and xVel using kinematics. This can be used for x, y, and z
@@ -555,4 +1050,9 @@ class Sim:
         #update z acceleration
         self.thirdZacc = ( -(( (1-l)*z )/(( (x - l)**2 + y**2 + z**2 )**(3/2)) ) - ( (l*z)/(( (x + 1 - l)**2 + y**2 + z**2 )**(3/2)) ) )
 
-Sim().on_execute()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Third body simulation window")
+    parser.add_argument("--resume", default=None, metavar="CHECKPOINT", help="carry on the run saved in CHECKPOINT (the window saves one to checkpoints/sim.npz every minute and when it closes)")
+    args = parser.parse_args()
+
+    (Sim.resume(args.resume) if args.resume else Sim()).on_execute()
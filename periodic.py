@@ -0,0 +1,481 @@
+#periodic orbits around L1, L2 and L3: planar lyapunov, halo and vertical families, found by differential correction and followed with pseudo-arclength continuation
+#run with: python periodic.py halo 1 --l 0.7 (the family is saved to families/ so loading it again is instant)
+import argparse, os
+
+import numpy as np
+
+from engine import acceleration, calc_jacobi, calc_potential_acceleration, calc_potential_jacobian
+from integrators import RK45
+from lagrange import lagrange_point
+from checkpoint import save_npz
+
+FAMILY_FOLDER = "families"
+
+#every family here is symmetric, so only half an orbit has to be integrated: it starts on a plane of symmetry and comes back
+#to it perpendicularly half a period later. For each kind: which parts of the starting state (x, y, z, xVel, yVel, zVel)
+#are free (the half period is always free too), which parts of the state half a period later have to be 0, and the
+#symmetry (state -> symmetry*state with time reversed maps the orbit onto itself)
+KINDS = {
+    "lyapunov" : ((0, 4), (1, 3), np.array((1, -1, 1, -1, 1, -1.0))), #planar, crosses y=0 with no x velocity
+    "halo" : ((0, 2, 4), (1, 3, 5), np.array((1, -1, 1, -1, 1, -1.0))), #same xz plane symmetry, but with z
+    "vertical" : ((0, 4, 5), (1, 2, 3), np.array((1, -1, -1, -1, 1, 1.0))), #figure eights, symmetric about the x axis
+}
+
+def _unpack(X, kind):
+    """
+    Starting state and half period from a vector of the free variables
+
+    """
+
+    state = np.zeros(6)
+    state[list(KINDS[kind][0])] = X[:-1]
+
+    return state, X[-1]
+
+def _derivative(y, l):
+    """
+    Time derivative of one third body's state and state transition matrix packed into a
+    vector of 42 (the state, then the matrix row by row). Same equations as ftle._derivative,
+    but for a single orbit with plain floats, where numpy's per call overhead would be most
+    of the time
+
+    """
+
+    x, yPos, z, xVel, yVel, zVel = y[:6]
+    stm = y[6:].reshape(6, 6)
+
+    matrix = np.zeros((6, 6)) #A = [[0, I], [jacobian, coriolis]]
+    matrix[:3, 3:] = np.eye(3)
+    matrix[3:, :3] = calc_potential_jacobian(y[:3], l)
+    matrix[3, 4] = 2
+    matrix[4, 3] = -2
+
+    derivative = np.empty(42)
+    derivative[:3] = y[3:6]
+    derivative[3:6] = acceleration(x, yPos, z, xVel, yVel, zVel, l)
+    derivative[6:] = (matrix @ stm).ravel()
+
+    return derivative
+
+def _propagate(state, duration, l, rtol, atol=1e-13, radius=0.03): #radius is bodyRadius + thirdRadius like everywhere else
+    """
+    Integrate one third body and its state transition matrix for duration with adaptive
+    Dormand-Prince steps (the integrators.RK45 tableau on the variational equations, with the
+    error measured on the state). Periodic orbits spend most of their time far from the bodies,
+    so this takes far fewer steps than fixed RK4 at the same accuracy. Returns the state, the
+    matrix and the state's derivative at the end. Raises ValueError if it comes within radius
+    of a body
+
+    """
+
+    y = np.concatenate((state, np.eye(6).ravel()))
+    centers = (l, l - 1)
+    stages = np.empty((len(RK45.A), 42))
+    A = [np.array(a) for a in RK45.A]
+    E = np.array(RK45.E)
+
+    t = 0.0
+    h = min(0.01, duration)
+    stages[0] = _derivative(y, l)
+    while duration - t > 1e-14:
+        h = min(h, duration - t) #end exactly at duration
+
+        for i in range(1, len(A)):
+            stages[i] = _derivative(y + h*(A[i] @ stages[:i]), l)
+        new = y + h*(A[-1] @ stages[:-1]) #the last stage was evaluated here
+
+        error = h*(E @ stages[:, :6])
+        scale = atol + rtol*np.maximum(np.abs(y[:6]), np.abs(new[:6]))
+        err = np.sqrt(np.mean((error/scale)**2))
+
+        if err <= 1:
+            t += h
+            y = new
+            stages[0] = stages[-1] #first same as last
+
+            for centerX in centers:
+                if (y[0] - centerX)**2 + y[1]**2 + y[2]**2 < radius*radius:
+                    raise ValueError("orbit runs into a body")
+
+        h *= 5 if err == 0 else min(5, max(0.2, 0.9 * err**(-1/5)))
+
+    return y[:6], y[6:].reshape(6, 6), stages[0][:6]
+
+def _half_orbit(X, kind, l, rtol):
+    """
+    Integrate half a period from the state in X. Returns the state at the end, the state
+    transition matrix over the half period, the constraints (should all be 0) and their
+    derivatives with respect to X
+
+    """
+
+    free, constrained, symmetry = KINDS[kind]
+    state, halfPeriod = _unpack(X, kind)
+    if halfPeriod <= 0:
+        raise ValueError("period went negative")
+
+    end, stm, derivative = _propagate(state, halfPeriod, l, rtol) #derivative is how the end moves with the half period
+
+    constraints = end[list(constrained)]
+    jacobian = np.column_stack((stm[np.ix_(constrained, free)], derivative[list(constrained)]))
+
+    return end, stm, constraints, jacobian
+
+def _jacobi_gradient(X, kind, l):
+    """
+    Jacobi constant of the starting state in X and its derivatives with respect to X
+
+    """
+
+    state, halfPeriod = _unpack(X, kind)
+    gradient = np.concatenate((2*calc_potential_acceleration(state[:3, None], l)[:, 0], -2*state[3:]))
+
+    return float(calc_jacobi(state[:, None], l)[0]), np.append(gradient[list(KINDS[kind][0])], 0.0)
+
+def correct(X, kind, l, fixed=None, jacobi=None, tangent=None, predicted=None, rtol=1e-11, tolerance=1e-10, maxIterations=15):
+    """
+    Differential correction: Newton's method on the free variables X (the free parts of the
+    starting state, then the half period) until the orbit closes. One extra condition can
+    pick which orbit of the family: fixed keeps X[fixed] where it is, jacobi asks for that
+    Jacobi constant, and tangent/predicted is the pseudo-arclength condition (stay on the plane
+    through predicted at right angles to tangent). With none of them the smallest correction
+    is used. Returns the corrected X, the state transition matrix over half a period, the
+    jacobian of the constraints there and the number of iterations. Raises ValueError if it
+    doesn't converge
+
+    """
+
+    X = np.array(X, dtype=float)
+    start = X.copy()
+
+    for i in range(maxIterations):
+        end, stm, residual, jacobian = _half_orbit(X, kind, l, rtol)
+
+        rows = [jacobian]
+        values = [residual]
+        if fixed is not None:
+            row = np.zeros(len(X))
+            row[fixed] = 1
+            rows.append(row[None])
+            values.append([X[fixed] - start[fixed]])
+        if jacobi is not None:
+            value, gradient = _jacobi_gradient(X, kind, l)
+            rows.append(gradient[None])
+            values.append([value - jacobi])
+        if tangent is not None:
+            rows.append(tangent[None])
+            values.append([np.dot(X - predicted, tangent)])
+
+        matrix = np.concatenate(rows)
+        values = np.concatenate(values)
+        if np.max(np.abs(values)) < tolerance:
+            return X, stm, jacobian, i
+
+        if matrix.shape[0] == matrix.shape[1]:
+            change = np.linalg.solve(matrix, values)
+        else:
+            change = np.linalg.lstsq(matrix, values, rcond=None)[0] #smallest change that fixes it
+        X = X - change
+
+        if not np.all(np.isfinite(X)):
+            break
+
+    raise ValueError("differential correction didn't converge")
+
+def monodromy(stm, kind):
+    """
+    State transition matrix over a whole period, from the one over half of it (the second
+    half is the first one run backwards through the symmetry)
+
+    """
+
+    symmetry = KINDS[kind][2]
+
+    return symmetry[:, None] * np.linalg.inv(stm) * symmetry[None, :] @ stm
+
+def linear_guess(kind, point, l, amplitude=1e-3):
+    """
+    Free variables of a small orbit of the linearized motion around a collinear lagrange point
+    (1, 2 or 3). lyapunov is the in-plane oscillation with x amplitude amplitude, vertical is
+    the out-of-plane one with z velocity amplitude times its frequency. Halo orbits don't have
+    a linear guess, they branch off the lyapunov family (see halo_start)
+
+    """
+
+    if point not in (1, 2, 3):
+        raise ValueError("periodic orbits are only followed around L1, L2 and L3")
+
+    pointX = lagrange_point(point, l)[0]
+    jacobian = calc_potential_jacobian(np.array((pointX, 0.0, 0.0)), l)
+
+    if kind == "lyapunov":
+        #linearized planar motion: positions, then velocities with the Coriolis terms
+        matrix = np.array((
+            (0, 0, 1, 0),
+            (0, 0, 0, 1),
+            (jacobian[0, 0], jacobian[0, 1], 0, 2),
+            (jacobian[1, 0], jacobian[1, 1], -2, 0),
+        ))
+        values, vectors = np.linalg.eig(matrix)
+        oscillating = np.argmax(values.imag) #one pair is real (the unstable direction), the other imaginary
+        frequency = values[oscillating].imag
+        vector = vectors[:, oscillating] / vectors[0, oscillating] #x real, so y and x velocity start at 0
+
+        return np.array((pointX + amplitude, amplitude*vector[3].real, np.pi/frequency))
+
+    if kind == "vertical":
+        frequency = np.sqrt(-jacobian[2, 2])
+        return np.array((pointX, 0.0, amplitude*frequency, np.pi/frequency))
+
+    raise ValueError("no linear guess for {} orbits".format(kind))
+
+class Family:
+    """
+    One family of periodic orbits, in the order they were found along it. states is (n, 6)
+    starting states, periods, jacobi and stability are (n,) (stability is the largest
+    |eigenvalue| of the monodromy matrix, 1 for a stable orbit) and monodromy is (n, 6, 6)
+
+    """
+
+    def __init__(self, kind, point, l, states, periods, monodromies):
+        self.kind = kind
+        self.point = point
+        self.l = float(l)
+        self.states = np.asarray(states, dtype=float).reshape(-1, 6)
+        self.periods = np.asarray(periods, dtype=float)
+        self.monodromy = np.asarray(monodromies, dtype=float).reshape(-1, 6, 6)
+
+        self.jacobi = calc_jacobi(self.states.T, self.l) if len(self.states) else np.zeros(0)
+        self.stability = np.array([np.abs(np.linalg.eigvals(m)).max() for m in self.monodromy])
+
+    def __len__(self):
+        return len(self.states)
+
+    def free(self, i):
+        """
+        Free variables of member i (for correct)
+
+        """
+
+        return np.append(self.states[i][list(KINDS[self.kind][0])], self.periods[i]/2)
+
+    def orbit_at(self, jacobi, rtol=1e-11):
+        """
+        (state, period) of the member with exactly this Jacobi constant, corrected from the
+        closest member found. Raises ValueError if the family never gets near it
+
+        """
+
+        crossings = np.flatnonzero(np.diff(np.sign(self.jacobi - jacobi)) != 0)
+        if len(crossings):
+            i = crossings[0] + (abs(self.jacobi[crossings[0] + 1] - jacobi) < abs(self.jacobi[crossings[0]] - jacobi))
+        else:
+            i = int(np.argmin(np.abs(self.jacobi - jacobi)))
+            if abs(self.jacobi[i] - jacobi) > np.ptp(self.jacobi)/max(len(self) - 1, 1):
+                raise ValueError("{} L{} family for lambda {} goes from Jacobi constant {:.6f} to {:.6f}".format(self.kind, self.point, self.l, self.jacobi.min(), self.jacobi.max()))
+
+        X, stm, jacobian, iterations = correct(self.free(i), self.kind, self.l, jacobi=jacobi, rtol=rtol)
+        state, halfPeriod = _unpack(X, self.kind)
+
+        return state, 2*halfPeriod
+
+    def save(self, path):
+        save_npz(path, kind=self.kind, point=self.point, l=self.l, states=self.states, periods=self.periods, monodromy=self.monodromy)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data["kind"]), int(data["point"]), float(data["l"]), data["states"], data["periods"], data["monodromy"])
+
+def continue_family(X, kind, l, direction, members=100, step=0.01, minStep=1e-5, maxStep=0.05, rtol=1e-11, progress=False):
+    """
+    Follow a family from the corrected orbit X with pseudo-arclength continuation: step along
+    the direction the family goes (the null direction of the correction's jacobian, pointed
+    the same way as direction for the first step), then correct at right angles to it. The
+    step grows when corrections are easy and shrinks when they fail. Stops after members
+    orbits or when the step can't get any smaller (usually the family runs into a body).
+    Returns lists of X and half period state transition matrices
+
+    """
+
+    X, stm, jacobian, iterations = correct(X, kind, l, rtol=rtol)
+    found = [X]
+    stms = [stm]
+    previous = np.asarray(direction, dtype=float)
+
+    while len(found) < members and step >= minStep:
+        tangent = np.linalg.svd(jacobian)[2][-1]
+        if np.dot(tangent, previous) < 0:
+            tangent = -tangent
+
+        predicted = X + step*tangent
+        try:
+            new, newStm, newJacobian, iterations = correct(predicted, kind, l, tangent=tangent, predicted=predicted, rtol=rtol)
+        except ValueError:
+            step /= 2
+            continue
+
+        found.append(new)
+        stms.append(newStm)
+        previous = tangent
+        X, jacobian = new, newJacobian
+        if iterations <= 3:
+            step = min(step*1.5, maxStep)
+
+        if progress:
+            print("{} {}/{}, Jacobi constant {:.6f}, period {:.4f}".format(kind, len(found), members, _jacobi_gradient(X, kind, l)[0], 2*X[-1]))
+
+    return found, stms
+
+def _make_family(kind, point, l, found, stms):
+    states = []
+    for X in found:
+        states.append(_unpack(X, kind)[0])
+
+    return Family(kind, point, l, states, [2*X[-1] for X in found], [monodromy(stm, kind) for stm in stms])
+
+def halo_start(lyapunov, north=True, amplitude=1e-3, rtol=1e-11, tolerance=1e-9):
+    """
+    Free variables of a small halo orbit, branching off a planar lyapunov family where its
+    out-of-plane motion turns neutral (a monodromy eigenvalue pair goes through 1, found by
+    bisection along the family). north starts it above the plane (z > 0)
+
+    """
+
+    trace = lyapunov.monodromy[:, 2, 2] + lyapunov.monodromy[:, 5, 5] - 2 #out-of-plane block, planar orbits keep it separate
+    crossings = np.flatnonzero(np.sign(trace[:-1]) != np.sign(trace[1:]))
+    if len(crossings) == 0:
+        raise ValueError("lyapunov family never branches into halo orbits, follow it further")
+
+    i = crossings[0]
+    low, high = lyapunov.free(i), lyapunov.free(i + 1)
+    traceLow = trace[i]
+
+    #bisect on x along the family, correcting at fixed x
+    while abs(high[0] - low[0]) > tolerance:
+        middle, stm, jacobian, iterations = correct((low + high)/2, "lyapunov", lyapunov.l, fixed=0, rtol=rtol)
+        M = monodromy(stm, "lyapunov")
+        traceMiddle = M[2, 2] + M[5, 5] - 2
+        if np.sign(traceMiddle) == np.sign(traceLow):
+            low, traceLow = middle, traceMiddle
+        else:
+            high = middle
+
+    x, yVel, halfPeriod = low
+
+    return np.array((x, amplitude if north else -amplitude, yVel, halfPeriod))
+
+def compute_family(kind, point, l, members=100, step=0.01, north=True, rtol=1e-11, folder=FAMILY_FOLDER, progress=False):
+    """
+    Find a family of periodic orbits (kind is "lyapunov", "halo" or "vertical") around L1, L2
+    or L3 from scratch. Halo families need the lyapunov family first (family() caches it in
+    folder)
+
+    """
+
+    if kind not in KINDS:
+        raise ValueError("kind must be one of: {}".format(", ".join(KINDS)))
+
+    if kind == "halo":
+        start = correct(halo_start(family("lyapunov", point, l, folder=folder, rtol=rtol), north=north, rtol=rtol), "halo", l, fixed=1, rtol=rtol)[0]
+        direction = np.array((0, 1 if north else -1, 0, 0)) #away from the plane
+    else:
+        guess = linear_guess(kind, point, l)
+        start = correct(guess, kind, l, fixed=0 if kind == "lyapunov" else 2, rtol=rtol)[0]
+        direction = start - np.append(lagrange_point(point, l)[0], np.zeros(len(start) - 1)) #away from the lagrange point
+        direction[-1] = 0
+
+    found, stms = continue_family(start, kind, l, direction, members=members, step=step, rtol=rtol, progress=progress)
+
+    return _make_family(kind, point, l, found, stms)
+
+_families = {} #(kind, point, lambda, north) -> Family, so a family is only read from disk once
+
+def family_path(kind, point, l, north=True, folder=FAMILY_FOLDER):
+    name = "{}_L{}_{}".format(kind, point, repr(float(l)))
+    if kind == "halo" and not north:
+        name += "_south"
+
+    return os.path.join(folder, name + ".npz")
+
+def family(kind, point, l, north=True, folder=FAMILY_FOLDER, refresh=False, **options):
+    """
+    A Family by kind, lagrange point and lambda, computed once (options go to compute_family)
+    and then kept in memory and in folder, so later runs get it straight away. refresh
+    computes it again
+
+    """
+
+    key = (kind, point, float(l), north, folder)
+    path = family_path(kind, point, l, north, folder)
+
+    if not refresh:
+        if key in _families:
+            return _families[key]
+        if os.path.exists(path):
+            _families[key] = Family.load(path)
+            return _families[key]
+
+    result = compute_family(kind, point, l, north=north, folder=folder, **options)
+    result.save(path)
+    _families[key] = result
+
+    return result
+
+def family_cached(kind, point, l, north=True, folder=FAMILY_FOLDER):
+    """
+    True if family() can give this family straight away (it is in memory or saved in folder)
+    instead of computing it, which can take half a minute
+
+    """
+
+    return (kind, point, float(l), north, folder) in _families or os.path.exists(family_path(kind, point, l, north, folder))
+
+def orbit_at(kind, point, l, jacobi, north=True, folder=FAMILY_FOLDER):
+    """
+    (state, period) of the orbit of a family with the given Jacobi constant, for starting a
+    simulation on it
+
+    """
+
+    return family(kind, point, l, north=north, folder=folder).orbit_at(jacobi)
+
+def parse_orbit(text):
+    """
+    (kind, point, jacobi) from text like "halo 1 3.05" (kind, lagrange point, Jacobi constant),
+    None if text isn't like that
+
+    """
+
+    parts = text.lower().split()
+    if len(parts) != 3 or parts[0] not in KINDS or parts[1] not in ("1", "2", "3"):
+        return None
+    try:
+        return parts[0], int(parts[1]), float(parts[2])
+    except ValueError:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find a family of periodic orbits around L1, L2 or L3 and save it for the simulation")
+    parser.add_argument("kind", choices=list(KINDS), help="orbit family")
+    parser.add_argument("point", type=int, choices=(1, 2, 3), help="lagrange point")
+    parser.add_argument("--l", type=float, default=0.7, help="lambda (0 < lambda < 1)")
+    parser.add_argument("--members", type=int, default=100, help="number of orbits to follow the family for")
+    parser.add_argument("--step", type=float, default=0.01, help="starting continuation step")
+    parser.add_argument("--south", action="store_true", help="halo orbits below the plane instead of above")
+    parser.add_argument("--rtol", type=float, default=1e-11, help="relative error allowed per integration step")
+    parser.add_argument("--folder", default=FAMILY_FOLDER, help="where families are saved")
+    parser.add_argument("--refresh", action="store_true", help="compute the family again even if it is saved")
+    args = parser.parse_args(argv)
+
+    result = family(args.kind, args.point, args.l, north=not args.south, folder=args.folder, refresh=args.refresh,
+                    members=args.members, step=args.step, rtol=args.rtol, progress=True)
+
+    print("{:>5} {:>12} {:>10} {:>12}   x, z, y velocity, z velocity".format("orbit", "jacobi", "period", "stability"))
+    for i in range(len(result)):
+        x, y, z, xVel, yVel, zVel = result.states[i]
+        print("{:5d} {:12.8f} {:10.6f} {:12.4g}   {:.8f}, {:.8f}, {:.8f}, {:.8f}".format(i, result.jacobi[i], result.periods[i], result.stability[i], x, z, yVel, zVel))
+    print("saved {}".format(family_path(args.kind, args.point, args.l, not args.south, args.folder)))
+
+if __name__ == "__main__":
+    main()
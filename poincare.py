@@ -0,0 +1,254 @@
+#poincare sections: where orbits with the same Jacobi constant cross y=0, for lots of orbits at once
+#run with: python poincare.py OUTPUT_FOLDER --jacobi 3.5 --l 0.7 --seeds 400 --time 500
+import argparse, glob, os, sys, time
+from multiprocessing import Pool
+
+import numpy as np
+
+from engine import make_state, calc_jacobi
+from ensemble import Ensemble
+from events import PlaneCrossing
+from chaos_map import check_settings, save_image
+from checkpoint import save_engine, load_engine
+
+#one row per crossing: which orbit (index of its seed), when, where and how fast, and the Jacobi constant there (to check the drift)
+SECTION_DTYPE = np.dtype([("orbit", "<i4"), ("t", "<f8"), ("x", "<f8"), ("xVel", "<f8"), ("yVel", "<f8"), ("jacobi", "<f8")])
+
+def section_speed(x, xVel, jacobi, l):
+    """
+    y velocity squared of a planar third body at (x, 0) moving with xVel along the axis that
+    has the given Jacobi constant (negative where that is impossible)
+
+    """
+
+    r1 = np.abs(x - l)
+    r2 = np.abs(x + 1 - l)
+
+    return x*x + 2*(1 - l)/r1 + 2*l/r2 - xVel*xVel - jacobi
+
+def seed_section(jacobi, l=0.7, xRange=(-1.5, 1.5), nX=200, xVelRange=(0.0, 0.0), nXVel=1, direction=1):
+    """
+    Planar initial conditions on y=0 with the given Jacobi constant: a grid of x and x velocity
+    values, with the y velocity (sign from direction) that makes the Jacobi constant come out
+    right. Points where no velocity can do that (inside the forbidden region) are left out.
+    Returns a (6, N) state array
+
+    """
+
+    x, xVel = np.meshgrid(np.linspace(xRange[0], xRange[1], nX), np.linspace(xVelRange[0], xVelRange[1], nXVel))
+    x, xVel = x.ravel(), xVel.ravel()
+
+    with np.errstate(divide="ignore"):
+        speed2 = section_speed(x, xVel, jacobi, l)
+    allowed = np.isfinite(speed2) & (speed2 > 0)
+
+    x, xVel = x[allowed], xVel[allowed]
+    yVel = direction * np.sqrt(speed2[allowed])
+
+    return make_state(x, 0.0, 0.0, xVel, yVel)
+
+def _run_batch(task):
+    """
+    Work for one pool process: integrate a batch of seeds and append their crossings to the
+    batch's file after every segment, so points reach the disk as they are found and memory
+    use stays the same however long the run is. The ensemble is checkpointed after every
+    segment too, so a batch that was killed carries on from its last segment (bit for bit)
+    instead of starting over. The file is renamed to its final name once the whole batch is
+    done
+
+    """
+
+    path, firstOrbit, states, settings = task
+    l = settings["l"]
+    duration = settings["duration"]
+    segment = settings["segment"]
+
+    partial = path + ".part"
+    checkpoint = path + ".checkpoint.npz"
+
+    if os.path.exists(checkpoint) and os.path.exists(partial):
+        ensemble, extra = load_engine(checkpoint)
+        done, count = extra["segments"], extra["count"]
+        f = open(partial, "r+b")
+        f.truncate(count * SECTION_DTYPE.itemsize) #drop anything written after the checkpoint
+        f.seek(0, os.SEEK_END)
+
+    else:
+        ensemble = Ensemble(states, l=l, deltaT=settings["deltaT"], integrator=settings["integrator"], escapeRadius=settings["escapeRadius"],
+                            events=[PlaneCrossing(axis=1, value=0.0, direction=settings["direction"])])
+        done = 0
+
+        f = open(partial, "wb")
+        #the seeds themselves are on the section
+        start = np.empty(states.shape[1], dtype=SECTION_DTYPE)
+        start["orbit"] = firstOrbit + np.arange(states.shape[1])
+        start["t"] = 0.0
+        start["x"], start["xVel"], start["yVel"] = states[0], states[3], states[4]
+        start["jacobi"] = calc_jacobi(states, l)
+        f.write(start.tobytes())
+        count = len(start)
+
+    with f:
+        starts = np.arange(0, duration, segment)
+        for index in range(done, len(starts)):
+            if not ensemble.active.any():
+                break
+            ensemble.run(min(segment, duration - starts[index]))
+
+            records = ensemble.eventLog.of(0) #the log has the impacts in it too
+            rows = np.empty(len(records), dtype=SECTION_DTYPE)
+            rows["orbit"] = firstOrbit + records["particle"]
+            rows["t"] = records["t"]
+            rows["x"], rows["xVel"], rows["yVel"] = records["x"], records["xVel"], records["yVel"]
+            rows["jacobi"] = calc_jacobi(np.stack([records[name] for name in ("x", "y", "z", "xVel", "yVel", "zVel")]), l)
+            f.write(rows.tobytes())
+            f.flush()
+            os.fsync(f.fileno()) #the rows have to be on disk before a checkpoint says they are
+
+            count += len(rows)
+            ensemble.eventLog.clear()
+            save_engine(checkpoint, ensemble, {"segments" : index + 1, "count" : count})
+
+    os.replace(partial, path) #only shows up as done once it is complete
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    return path, count
+
+def compute_section(folder, jacobi, l=0.7, xRange=(-1.5, 1.5), nX=200, xVelRange=(0.0, 0.0), nXVel=1, direction=1, duration=500.0, segment=20.0,
+                    integrator="rk45", deltaT=0.001, escapeRadius=10.0, batchSize=64, workers=None, progress=True):
+    """
+    Seed orbits on y=0 at the given Jacobi constant (see seed_section), integrate them in
+    batches of batchSize over a process pool and save every crossing of y=0 in the chosen
+    direction to folder/batches. Running again with the same settings only does the batches
+    that didn't finish, each from its last checkpoint. Returns the total number of points
+    (go through them with section_batches)
+
+    """
+
+    settings = {"jacobi" : jacobi, "l" : l, "xRange" : list(xRange), "nX" : nX, "xVelRange" : list(xVelRange), "nXVel" : nXVel, "direction" : direction,
+                "duration" : duration, "segment" : segment, "integrator" : integrator, "deltaT" : deltaT, "escapeRadius" : escapeRadius, "batchSize" : batchSize}
+
+    batchFolder = os.path.join(folder, "batches")
+    os.makedirs(batchFolder, exist_ok=True)
+    check_settings(folder, settings)
+
+    seeds = seed_section(jacobi, l, xRange, nX, xVelRange, nXVel, direction)
+    if seeds.shape[1] == 0:
+        raise ValueError("no orbits with Jacobi constant {} start on y=0 in that range".format(jacobi))
+
+    tasks = []
+    for index, start in enumerate(range(0, seeds.shape[1], batchSize)):
+        path = os.path.join(batchFolder, "batch_{:05d}.bin".format(index))
+        if not os.path.exists(path):
+            tasks.append((path, start, seeds[:, start:start + batchSize], settings))
+
+    if tasks:
+        started = time.perf_counter()
+        points = 0
+        with Pool(workers) as pool:
+            for done, (path, count) in enumerate(pool.imap_unordered(_run_batch, tasks), 1):
+                points += count
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    print("batch {}/{} done ({} points so far), {:.0f}s elapsed, ~{:.0f}s left".format(done, len(tasks), points, elapsed, elapsed/done*(len(tasks) - done)), file=sys.stderr)
+
+    return section_size(folder)
+
+def _batch_paths(folder):
+    return sorted(glob.glob(os.path.join(folder, "batches", "batch_*.bin")))
+
+def section_size(folder):
+    """
+    Number of points in a section run so far (finished batches only), from the file sizes
+
+    """
+
+    return sum(os.path.getsize(path) // SECTION_DTYPE.itemsize for path in _batch_paths(folder))
+
+def section_batches(folder):
+    """
+    The finished batches of a section run as a list of memory mapped SECTION_DTYPE arrays.
+    Nothing is read from disk until it is used, so a section too big for memory can be gone
+    through one batch at a time
+
+    """
+
+    batches = []
+    for path in _batch_paths(folder):
+        rows = os.path.getsize(path) // SECTION_DTYPE.itemsize
+        if rows:
+            batches.append(np.memmap(path, dtype=SECTION_DTYPE, mode="r", shape=(rows,)))
+
+    return batches
+
+def load_section(folder):
+    """
+    All the points of a section run so far (finished batches only) as one SECTION_DTYPE array.
+    This copies the whole section into memory, so big runs are better gone through with
+    section_batches
+
+    """
+
+    batches = section_batches(folder)
+
+    return np.concatenate(batches) if batches else np.empty(0, dtype=SECTION_DTYPE)
+
+def section_colors(batches, xRange, xVelRange, resolution=1024, maxDrift=None):
+    """
+    (resolution, resolution, 3) image of a section from a list of SECTION_DTYPE arrays (like
+    section_batches, or [points] for one array), counted one array at a time: x across, x
+    velocity up, brightness is the log of the number of points in each pixel. With maxDrift,
+    points whose Jacobi constant has moved further than that from the target are left out
+
+    """
+
+    if maxDrift is not None:
+        seeds = np.concatenate([np.empty(0)] + [points["jacobi"][points["t"] == 0] for points in batches]) #every batch starts with its seeds, which are on target
+        if len(seeds) == 0:
+            seeds = np.concatenate([np.empty(0)] + [points["jacobi"] for points in batches])
+        target = np.median(seeds) if len(seeds) else 0.0
+
+    xVelRange = (xVelRange[0], xVelRange[1]) if xVelRange[0] != xVelRange[1] else (-2.0, 2.0) #seeds all had the same x velocity, but crossings won't
+    counts = np.zeros((resolution, resolution))
+    for points in batches:
+        if maxDrift is not None:
+            points = points[np.abs(points["jacobi"] - target) <= maxDrift]
+        counts += np.histogram2d(points["x"], points["xVel"], bins=resolution, range=(xRange, xVelRange))[0]
+
+    density = np.log1p(counts.T[::-1]) #rows go down in x velocity
+    density = (255 * density / max(density.max(), 1e-12)).astype(np.uint8)
+
+    return np.repeat(density[..., None], 3, axis=-1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poincare section (crossings of y=0) for many orbits with the same Jacobi constant, integrated in parallel")
+    parser.add_argument("folder", help="folder for the results (batches and section.png). Running again on the same folder resumes")
+    parser.add_argument("--jacobi", type=float, required=True, help="Jacobi constant of every orbit")
+    parser.add_argument("--l", type=float, default=0.7, help="lambda (0 < lambda < 1)")
+    parser.add_argument("--x", type=float, nargs=2, default=(-1.5, 1.5), metavar=("MIN", "MAX"), help="range of starting x values")
+    parser.add_argument("--seeds", type=int, default=200, help="number of starting x values")
+    parser.add_argument("--xvel", type=float, nargs=2, default=(0.0, 0.0), metavar=("MIN", "MAX"), help="range of starting x velocities")
+    parser.add_argument("--xvel-seeds", type=int, default=1, help="number of starting x velocities")
+    parser.add_argument("--direction", type=int, choices=(1, -1), default=1, help="only keep crossings with y velocity of this sign")
+    parser.add_argument("--time", type=float, default=500.0, help="how long to integrate each orbit for")
+    parser.add_argument("--segment", type=float, default=20.0, help="simulated time between writes to disk")
+    parser.add_argument("--integrator", default="rk45", help="integrator name (see integrators.py). The adaptive default keeps close passes accurate")
+    parser.add_argument("--deltaT", type=float, default=0.001, help="time step (starting step for adaptive integrators)")
+    parser.add_argument("--batch-size", type=int, default=64, help="orbits integrated together in one process")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+    parser.add_argument("--resolution", type=int, default=1024, help="image is resolution x resolution")
+    parser.add_argument("--image-xvel", type=float, nargs=2, default=(-2.0, 2.0), metavar=("MIN", "MAX"), help="x velocity range of the image")
+    parser.add_argument("--max-drift", type=float, default=None, help="leave points whose Jacobi constant drifted more than this out of the image")
+    args = parser.parse_args(argv)
+
+    total = compute_section(args.folder, args.jacobi, l=args.l, xRange=args.x, nX=args.seeds, xVelRange=args.xvel, nXVel=args.xvel_seeds,
+                            direction=args.direction, duration=args.time, segment=args.segment, integrator=args.integrator, deltaT=args.deltaT,
+                            batchSize=args.batch_size, workers=args.workers)
+
+    imagePath = os.path.join(args.folder, "section.png")
+    save_image(imagePath, section_colors(section_batches(args.folder), args.x, args.image_xvel, args.resolution, args.max_drift))
+    print("{} points, saved {}".format(total, imagePath))
+
+if __name__ == "__main__":
+    main()
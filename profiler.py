@@ -0,0 +1,188 @@
+#timing each stage of a frame (events, physics, rendering, display update) while the simulation runs
+import cProfile, json, os, threading, time
+from collections import deque
+
+import numpy as np
+
+class _NoSection:
+    """
+    Stand in for FrameProfiler.section when profiling is off (does nothing)
+
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SECTION = _NoSection()
+
+class _Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._add(self.name, self.start, time.perf_counter())
+        return False
+
+class FrameProfiler:
+    """
+    Keeps the last window frames of timings for each named stage, so percentiles are always
+    of recent frames. run() times a call, section() is a with block for parts of a stage
+    (the trail or the text inside on_render). Both cost nothing beyond a flag check while
+    enabled is False
+
+    capture() records the next few frames either with cProfile (a pstats file, open it with
+    python -m pstats or snakeviz) or as a chrome trace (a json file for chrome://tracing or
+    ui.perfetto.dev showing every stage of every frame on a timeline)
+
+    """
+
+    KINDS = ("cprofile", "trace")
+
+    def __init__(self, window=300, enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self.stages = {} #name -> deque of the last window durations in seconds
+        self.frames = 0
+
+        self._frameStart = None
+        self._capture = None #(kind, path, frames left) while capturing
+        self._profile = None #cProfile.Profile during a cprofile capture
+        self._events = None #chrome trace events during a trace capture
+        self._origin = time.perf_counter() #trace timestamps are from here
+        self._wasEnabled = enabled #put back after a capture
+        self.lastCapture = None #path of the last finished capture
+
+    def _add(self, name, start, end):
+        durations = self.stages.get(name)
+        if durations is None:
+            durations = self.stages[name] = deque(maxlen=self.window)
+        durations.append(end - start)
+
+        if self._events is not None:
+            self._events.append({"name" : name, "ph" : "X", "ts" : (start - self._origin)*1e6, "dur" : (end - start)*1e6, "pid" : os.getpid(), "tid" : threading.get_ident()})
+
+    def run(self, name, func, *args):
+        """
+        Call func(*args), timing it as stage name if profiling is on. Returns what func returns
+
+        """
+
+        if not self.enabled:
+            return func(*args)
+
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self._add(name, start, time.perf_counter())
+
+    def section(self, name):
+        """
+        Context manager timing the code inside it as stage name
+
+        """
+
+        return _Section(self, name) if self.enabled else _NO_SECTION
+
+    def begin_frame(self):
+        if self._capture is not None and self._profile is None and self._events is None: #capture starts with this frame
+            if self._capture[0] == "cprofile":
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+            else:
+                self._events = []
+
+        if self.enabled:
+            self._frameStart = time.perf_counter()
+
+    def end_frame(self):
+        if self.enabled and self._frameStart is not None:
+            self._add("frame", self._frameStart, time.perf_counter())
+            self._frameStart = None
+            self.frames += 1
+
+        if self._capture is not None:
+            kind, path, left = self._capture
+            left -= 1
+            if left > 0:
+                self._capture = (kind, path, left)
+            else:
+                self._finish_capture()
+
+    def capture(self, path, frames=300, kind="cprofile"):
+        """
+        Record the next frames frames and save them to path when done (turns profiling on so
+        the stages show up in a trace)
+
+        """
+
+        if kind not in self.KINDS:
+            raise ValueError("kind must be one of: {}".format(", ".join(self.KINDS)))
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        if self._capture is None:
+            self._wasEnabled = self.enabled
+        self.enabled = True
+        self._capture = (kind, path, frames)
+
+    @property
+    def capturing(self):
+        return self._capture is not None
+
+    def _finish_capture(self):
+        kind, path, left = self._capture
+        self._capture = None
+        self.enabled = self._wasEnabled
+
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(path)
+            self._profile = None
+
+        elif self._events is not None:
+            with open(path, "w") as f:
+                json.dump({"traceEvents" : self._events, "displayTimeUnit" : "ms"}, f)
+            self._events = None
+
+        self.lastCapture = path
+
+    def percentiles(self, name, q=(50, 95, 99)):
+        """
+        Percentiles (in seconds) of the recent timings of stage name, None if it has none
+
+        """
+
+        durations = self.stages.get(name)
+        if not durations:
+            return None
+
+        return tuple(float(i) for i in np.percentile(durations, q))
+
+    def summary(self):
+        """
+        p50, p95, p99 and max in seconds for every stage over the window
+
+        """
+
+        result = {}
+        for name, durations in self.stages.items():
+            if durations:
+                p50, p95, p99 = self.percentiles(name)
+                result[name] = {"p50" : p50, "p95" : p95, "p99" : p99, "max" : max(durations), "samples" : len(durations)}
+
+        return result
+
+    def reset(self):
+        self.stages.clear()
+        self.frames = 0
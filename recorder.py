@@ -0,0 +1,178 @@
+#saving trajectories to disk and replaying them without loading the whole file
+import json, os, threading
+
+import numpy as np
+
+#one row of a recording
+RECORD_DTYPE = np.dtype([(name, "<f8") for name in ("t", "x", "y", "z", "xVel", "yVel", "zVel", "xAcc", "yAcc", "zAcc")])
+
+FORMAT_VERSION = 1
+
+def header_path(path):
+    return path + ".json"
+
+class Recorder:
+    """
+    Streams the state of a third body to an append-only binary file of RECORD_DTYPE rows
+    (t, position, velocity, acceleration). Rows are buffered and written a chunk at a time.
+    Things that don't change over the run (lambda, the initial conditions, deltaT and how many
+    steps there are between rows) go in a json header next to it (path + ".json")
+
+    record() can be called from the physics thread while another thread calls close()
+
+    """
+
+    def __init__(self, path, l, initial, deltaT=None, decimation=100, chunkSize=4096, append=False):
+        self.path = path
+        self.decimation = decimation #number of steps between saved rows
+        self.chunkSize = chunkSize
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.header = {
+            "version" : FORMAT_VERSION,
+            "fields" : list(RECORD_DTYPE.names),
+            "l" : float(l),
+            "initial" : [float(i) for i in initial], #x, y, z, x velocity, y velocity, z velocity
+            "deltaT" : deltaT,
+            "decimation" : decimation,
+        }
+        if not append:
+            with open(header_path(path), "w") as f:
+                json.dump(self.header, f, indent=4)
+
+        self._file = open(path, "ab" if append else "wb")
+        self._buffer = np.empty(chunkSize, dtype=RECORD_DTYPE)
+        self._count = 0 #rows waiting in the buffer
+        self._lock = threading.Lock()
+        self.written = 0 #rows written to the file so far
+
+    def record(self, t, x, y, z, xVel, yVel, zVel, xAcc=None, yAcc=None, zAcc=None):
+        """
+        Add one row (accelerations can be None before the first step)
+
+        """
+
+        with self._lock:
+            if self._file is None: #already closed
+                return
+
+            self._buffer[self._count] = (t, x, y, z, xVel, yVel, zVel,
+                                         np.nan if xAcc is None else xAcc, np.nan if yAcc is None else yAcc, np.nan if zAcc is None else zAcc)
+            self._count += 1
+
+            if self._count == self.chunkSize:
+                self._write()
+
+    def record_many(self, rows):
+        """
+        Add an array of RECORD_DTYPE rows (or anything that converts to it)
+
+        """
+
+        with self._lock:
+            if self._file is None:
+                return
+
+            self._write()
+            rows = np.asarray(rows, dtype=RECORD_DTYPE)
+            self._file.write(rows.tobytes())
+            self.written += len(rows)
+
+    def _write(self):
+        if self._count:
+            self._file.write(self._buffer[:self._count].tobytes())
+            self.written += self._count
+            self._count = 0
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._write()
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._write()
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Replay:
+    """
+    Read only view of a recording. The rows are memory mapped, so a file of any size opens
+    instantly and only the parts that are looked at get read from disk. A row that was only
+    partly written (if the program died mid write) is ignored
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(header_path(path)) as f:
+            self.header = json.load(f)
+
+        self.l = self.header["l"]
+        self.initial = self.header["initial"]
+        self.deltaT = self.header["deltaT"]
+        self.decimation = self.header["decimation"]
+
+        rows = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        if rows:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(rows,))
+        else:
+            self.records = np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    @property
+    def duration(self):
+        return float(self.records["t"][-1]) if len(self) else 0.0
+
+    def index_at(self, t):
+        """
+        Index of the first row at or after time t (the t column is sorted)
+
+        """
+
+        return min(int(np.searchsorted(self.records["t"], t)), len(self) - 1)
+
+    def positions(self, start, stop, stride=1):
+        """
+        x and y of every stride-th row from start to stop as an (n, 2) array (for drawing a path)
+
+        """
+
+        rows = self.records[max(start, 0):stop:stride]
+
+        return np.stack((rows["x"], rows["y"]), axis=-1)
+
+def record_engine(engine, path, nSteps, decimation=100):
+    """
+    Run a single body Engine for nSteps and save a row every decimation steps. Returns the
+    number of rows written
+
+    """
+
+    if engine.state.ndim != 1:
+        raise ValueError("only a single third body can be recorded (state must have shape (6,))")
+
+    with Recorder(path, engine.l, engine.state, deltaT=engine.deltaT, decimation=decimation) as recorder:
+        recorder.record(engine.t, *engine.state, *engine.acc)
+
+        for done in range(0, nSteps, decimation):
+            engine.step(min(decimation, nSteps - done))
+            recorder.record(engine.t, *engine.state, *engine.acc)
+
+    return recorder.written
@@ -0,0 +1,219 @@
+#command line entry point: run one third body headless (no pygame, no screen) and save the trajectory, or open the window with the same initial conditions
+#run with: python simulate.py --x 0.27 --l 0.7 --integrator rk45 --time 20 --output runs/x027.bin (add --window to watch it instead, --checkpoint runs/x027.npz to be able to --resume it)
+import argparse, os, time
+
+import numpy as np
+
+from engine import make_state, calc_jacobi
+from ensemble import Ensemble
+from integrators import INTEGRATORS
+from recorder import Recorder, RECORD_DTYPE
+from checkpoint import save_engine, load_engine
+
+def initial_state(x=0.27, y=0.0, z=0.0, xVel=0.0, yVel=0.0, zVel=0.0, l=0.7, lagrange=None, orbit=None, error=(0.0, 0.0, 0.0)):
+    """
+    Starting state the same way the window picks it: at lagrange point lagrange (1 to 5) at rest,
+    on a periodic orbit (orbit is text like "halo 1 3.5"), or at the given position and velocity.
+    error is added to the position for the first two, like the window's error boxes
+
+    """
+
+    if orbit is not None:
+        from periodic import parse_orbit, orbit_at #only needed for orbits (and might have to compute the family)
+
+        parsed = parse_orbit(orbit)
+        if parsed is None:
+            raise ValueError("orbit should look like \"halo 1 3.5\" (lyapunov, halo or vertical, lagrange point 1 to 3, Jacobi constant)")
+        state, period = orbit_at(parsed[0], parsed[1], l, parsed[2])
+        state = state.copy()
+        state[:3] += error
+
+    elif lagrange is not None:
+        from lagrange import lagrange_point
+
+        state = np.zeros(6)
+        state[:3] = np.array(lagrange_point(lagrange, l)) + error
+
+    else:
+        state = np.array((x, y, z, xVel, yVel, zVel), dtype=float)
+
+    return state
+
+def run(state, l=0.7, duration=10.0, integrator="rk45", deltaT=0.001, output=None, every=100, bodyRadius=0.02, thirdRadius=0.01, escapeRadius=10.0,
+        checkpoint=None, checkpointEvery=60.0, **options):
+    """
+    Integrate one third body for duration (stopping early if it hits a body or escapes) with
+    the same collision and escape handling as an Ensemble. If output is set, a row is saved
+    every every steps with a recorder.Recorder (open it with recorder.Replay, or F3 in the
+    window after copying it to the recordings folder). If checkpoint is set, the whole run is
+    saved there every checkpointEvery seconds (of real time) and at the end, and resume() can
+    carry it on. Returns a dict summary of the run
+
+    """
+
+    ensemble = Ensemble(make_state(*state), l=l, deltaT=deltaT, integrator=integrator, bodyRadius=bodyRadius, thirdRadius=thirdRadius, escapeRadius=escapeRadius, **options)
+    recorder = Recorder(output, l, tuple(state), deltaT=deltaT, decimation=every) if output else None
+    if recorder is not None:
+        recorder.record(ensemble.t, *ensemble.state[:, 0], *ensemble.acc[:, 0])
+
+    return _integrate(ensemble, duration, every, recorder, checkpoint, checkpointEvery)
+
+def resume(path, duration=None):
+    """
+    Carry on a run from its checkpoint, bit for bit the same as if it had never stopped. Rows
+    the output got after the checkpoint was saved are dropped and made again. duration is the
+    total time to run to (defaults to what the run was started with)
+
+    """
+
+    ensemble, extra = load_engine(path)
+
+    recorder = None
+    if extra["output"]:
+        size = extra["rows"] * RECORD_DTYPE.itemsize
+        if os.path.getsize(extra["output"]) < size:
+            raise ValueError("{} has fewer rows than when {} was saved".format(extra["output"], path))
+        with open(extra["output"], "r+b") as f: #anything past the checkpoint gets written again
+            f.truncate(size)
+        recorder = Recorder(extra["output"], float(ensemble.l), ensemble.state[:, 0], deltaT=ensemble.deltaT, decimation=extra["every"], append=True)
+        recorder.written = extra["rows"]
+
+    return _integrate(ensemble, extra["duration"] if duration is None else duration, extra["every"], recorder, path, extra["checkpointEvery"], extra["steps"])
+
+def _integrate(ensemble, duration, every, recorder, checkpoint, checkpointEvery, steps=0):
+    """
+    The stepping loop for run and resume: every steps at a time, then a row and (if it is time)
+    a checkpoint, so a checkpoint is always taken at the same point in the loop
+
+    """
+
+    adaptive = ensemble.integrator.adaptive
+
+    def save():
+        if recorder is not None:
+            recorder.flush() #the checkpoint says how many rows are safely in the file
+        save_engine(checkpoint, ensemble, {"duration" : duration, "every" : every, "steps" : steps, "output" : recorder.path if recorder is not None else None,
+                                           "rows" : recorder.written if recorder is not None else 0, "checkpointEvery" : checkpointEvery})
+
+    started = lastCheckpoint = time.perf_counter()
+    try:
+        while duration - ensemble.t > 1e-12 and ensemble.active[0]:
+            if adaptive: #steps are different lengths, don't go past the end
+                for i in range(every):
+                    ensemble.deltaT = min(ensemble.deltaT, duration - ensemble.t)
+                    ensemble.step()
+                    steps += 1
+                    if duration - ensemble.t <= 1e-12 or not ensemble.active[0]:
+                        break
+            else:
+                count = min(every, int(round((duration - ensemble.t) / ensemble.deltaT)))
+                if count <= 0:
+                    break
+                ensemble.step(count)
+                steps += count
+
+            if recorder is not None:
+                recorder.record(ensemble.t, *ensemble.state[:, 0], *ensemble.acc[:, 0])
+            if checkpoint and time.perf_counter() - lastCheckpoint >= checkpointEvery:
+                save()
+                lastCheckpoint = time.perf_counter()
+
+        if checkpoint: #so a finished run can be carried on further with a longer duration
+            save()
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+    final = ensemble.state[:, 0]
+    return {
+        "t" : ensemble.t,
+        "steps" : steps,
+        "seconds" : time.perf_counter() - started,
+        "final" : [float(i) for i in final],
+        "collidedWith" : int(ensemble.collidedWith[0]),
+        "escaped" : bool(ensemble.escaped[0]),
+        "jacobiDrift" : None if not ensemble.active[0] else float(abs(calc_jacobi(ensemble.state, ensemble.l)[0] - ensemble.jacobi0[0])), #meaningless once it has stopped
+        "output" : recorder.path if recorder is not None else None,
+        "rows" : recorder.written if recorder is not None else 0,
+        "checkpoint" : checkpoint,
+    }
+
+def open_window(state, l):
+    """
+    Open the simulation window starting from state (this is the only place pygame gets imported)
+
+    """
+
+    from main import Sim
+
+    x, y, z, xVel, yVel, zVel = (float(i) for i in state)
+    Sim(x, y, z, xVel, yVel, zVel, l=l).on_execute()
+
+def report(summary):
+    """
+    Print what happened in a run from its summary
+
+    """
+
+    if summary["collidedWith"]:
+        ending = "hit body {}".format(summary["collidedWith"])
+    elif summary["escaped"]:
+        ending = "escaped"
+    else:
+        ending = "Jacobi drift {:.3g}".format(summary["jacobiDrift"])
+    print("t = {:.6f} after {} steps ({:.2f}s), {}".format(summary["t"], summary["steps"], summary["seconds"], ending))
+    print("final state: {}".format(", ".join("{:.10f}".format(i) for i in summary["final"])))
+    if summary["output"]:
+        print("saved {} rows to {}".format(summary["rows"], summary["output"]))
+    if summary["checkpoint"]:
+        print("checkpoint in {} (carry on with --resume {})".format(summary["checkpoint"], summary["checkpoint"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one third body without a window and save its trajectory (or open the window with --window)")
+    parser.add_argument("--x", type=float, default=0.27, help="initial x")
+    parser.add_argument("--y", type=float, default=0.0, help="initial y")
+    parser.add_argument("--z", type=float, default=0.0, help="initial z")
+    parser.add_argument("--xvel", type=float, default=0.0, help="initial x velocity")
+    parser.add_argument("--yvel", type=float, default=0.0, help="initial y velocity")
+    parser.add_argument("--zvel", type=float, default=0.0, help="initial z velocity")
+    parser.add_argument("--l", type=float, default=0.7, help="lambda (0 < lambda < 1)")
+    parser.add_argument("--lagrange", type=int, choices=(1, 2, 3, 4, 5), default=None, help="start at rest at this lagrange point instead")
+    parser.add_argument("--orbit", default=None, help="start on a periodic orbit instead, like \"halo 1 3.5\" (see periodic.py)")
+    parser.add_argument("--error", type=float, nargs=3, default=(0.0, 0.0, 0.0), metavar=("X", "Y", "Z"), help="added to the position for --lagrange and --orbit")
+    parser.add_argument("--integrator", default="rk45", choices=list(INTEGRATORS), help="integrator (see integrators.py)")
+    parser.add_argument("--deltaT", type=float, default=0.001, help="time step (starting step for adaptive integrators)")
+    parser.add_argument("--time", type=float, default=None, help="how long to integrate for (default 10, or what the run was started with for --resume)")
+    parser.add_argument("--output", default=None, help="save the trajectory to this file (a recorder.Recorder .bin with a .json header next to it)")
+    parser.add_argument("--every", type=int, default=100, help="steps between saved rows")
+    parser.add_argument("--window", action="store_true", help="open the simulation window with these initial conditions instead")
+    parser.add_argument("--checkpoint", default=None, help="save the whole run to this file every so often (and at the end) so it can be resumed")
+    parser.add_argument("--checkpoint-every", type=float, default=60.0, help="seconds (real time) between checkpoints")
+    parser.add_argument("--resume", default=None, metavar="CHECKPOINT", help="carry on the run saved in CHECKPOINT (initial conditions and settings come from it)")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        try:
+            report(resume(args.resume, args.time))
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+        return
+
+    try:
+        state = initial_state(args.x, args.y, args.z, args.xvel, args.yvel, args.zvel, l=args.l, lagrange=args.lagrange, orbit=args.orbit, error=np.array(args.error))
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.window:
+        open_window(state, args.l)
+        return
+
+    if args.output:
+        folder = os.path.dirname(args.output)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    report(run(state, l=args.l, duration=10.0 if args.time is None else args.time, integrator=args.integrator, deltaT=args.deltaT, output=args.output, every=args.every,
+               checkpoint=args.checkpoint, checkpointEvery=args.checkpoint_every))
+
+if __name__ == "__main__":
+    main()
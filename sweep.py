@@ -0,0 +1,270 @@
+#parameter studies: lots of runs over ranges of lambda and initial conditions, with every result cached on disk by what went into it
+#run with: python sweep.py SPEC.json --output results.npz (see README for the spec)
+import argparse, hashlib, json, os, sys, time
+from itertools import product
+from multiprocessing import Pool
+
+import numpy as np
+
+import engine
+from engine import calc_jacobi
+from ensemble import Ensemble
+from chaos_map import bound_to
+from integrators import INTEGRATORS
+from checkpoint import save_json, save_npz
+
+CACHE_FOLDER = "sweep_cache"
+
+#anything that can change a result. Editing one of these makes every cached result stale (they just get computed again)
+CODE_FILES = ("engine.py", "integrators.py", "events.py", "ensemble.py", "chaos_map.py", "sweep.py")
+
+STATE_NAMES = ("x", "y", "z", "xVel", "yVel", "zVel")
+
+#settings every run has, and their defaults
+DEFAULTS = {"duration" : 10.0, "integrator" : "rk4", "deltaT" : 0.001, "integratorOptions" : {}, "escapeRadius" : 10.0,
+            "bodyRadius" : 0.02, "thirdRadius" : 0.01, "samples" : 100}
+
+def code_version():
+    """
+    Hash of the source of everything the results depend on (and whether the kernel is
+    compiled, which can change the last bits)
+
+    """
+
+    digest = hashlib.sha256()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        with open(os.path.join(folder, name), "rb") as f:
+            digest.update(name.encode() + b"\0" + f.read() + b"\0")
+    digest.update(b"jit" if engine.JIT else b"nojit")
+
+    return digest.hexdigest()
+
+def expand(value):
+    """
+    List of floats from a spec value: a number, a list of numbers, {"start", "stop", "num"}
+    (like np.linspace) or {"start", "stop", "step"}. With step, every value is start + i*step,
+    so making stop bigger later keeps all the old values exactly the same (and cached)
+
+    """
+
+    if isinstance(value, dict):
+        start, stop = float(value["start"]), float(value["stop"])
+        if "step" in value:
+            step = float(value["step"])
+            count = int(np.floor((stop - start)/step + 1e-9)) + 1
+            return [start + i*step for i in range(count)]
+        return [float(i) for i in np.linspace(start, stop, int(value["num"]))]
+
+    if isinstance(value, (list, tuple)):
+        return [float(i) for i in value]
+
+    return [float(value)]
+
+def load_spec(spec):
+    """
+    Lists of lambdas and initial states (every combination of the values given) and the run
+    settings from a spec (a dict or the path to a json file of one)
+
+    """
+
+    if not isinstance(spec, dict):
+        with open(spec) as f:
+            spec = json.load(f)
+
+    unknown = set(spec) - set(DEFAULTS) - set(STATE_NAMES) - {"l"}
+    if unknown:
+        raise ValueError("unknown spec entries: {}".format(", ".join(sorted(unknown))))
+
+    ls = expand(spec.get("l", 0.7))
+    states = list(product(*(expand(spec.get(name, 0.0)) for name in STATE_NAMES)))
+    settings = {name : spec.get(name, default) for name, default in DEFAULTS.items()}
+    if settings["integrator"] not in INTEGRATORS:
+        raise ValueError("unknown integrator {!r}, options are: {}".format(settings["integrator"], ", ".join(INTEGRATORS)))
+
+    return ls, states, settings
+
+def run_key(l, state, settings, version):
+    """
+    Content address of one run: hash of lambda, the initial state, the settings and the code
+    version. Floats go in with repr, so only exactly the same numbers give the same key
+
+    """
+
+    content = json.dumps({"l" : repr(float(l)), "state" : [repr(float(i)) for i in state], "settings" : settings, "code" : version}, sort_keys=True)
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+class ResultCache:
+    """
+    One small json file per run in folder, named by its key (in subfolders by the first two
+    characters so no folder gets huge). Files are written whole with checkpoint.save_json, so several
+    processes can add to the same cache and a crash never leaves a broken entry
+
+    """
+
+    def __init__(self, folder=CACHE_FOLDER):
+        self.folder = folder
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError): #missing (or from a run that was killed mid write on a filesystem without atomic renames)
+            return None
+
+    def put(self, key, result):
+        save_json(self.path(key), result)
+
+def run_batch(l, states, settings):
+    """
+    Integrate a (6, N) array of initial states with one lambda and summarize each run: when it
+    collided and with what, when it escaped, the largest Jacobi drift while it was still moving
+    (sampled samples times over the run), the final state and the body it ends up bound to
+
+    """
+
+    ensemble = Ensemble(states, l=l, deltaT=settings["deltaT"], integrator=settings["integrator"], escapeRadius=settings["escapeRadius"],
+                        bodyRadius=settings["bodyRadius"], thirdRadius=settings["thirdRadius"], **settings["integratorOptions"])
+    start = calc_jacobi(ensemble.state, l)
+    maxDrift = np.zeros(ensemble.state.shape[1])
+
+    for i in range(settings["samples"]):
+        moving = ensemble.active
+        if not moving.any():
+            break
+        ensemble.run(settings["duration"]/settings["samples"])
+
+        still = moving & ensemble.active #collided or escaped particles are stopped, so their Jacobi constant means nothing after that
+        maxDrift[still] = np.maximum(maxDrift[still], np.abs(calc_jacobi(ensemble.state[:, still], l) - start[still]))
+
+    bound = np.where(ensemble.active, bound_to(ensemble.state, l), 0)
+
+    results = []
+    for i in range(ensemble.state.shape[1]):
+        results.append({
+            "collisionTime" : None if np.isnan(ensemble.collisionTime[i]) else float(ensemble.collisionTime[i]),
+            "collidedWith" : int(ensemble.collidedWith[i]),
+            "escapeTime" : None if np.isnan(ensemble.escapeTime[i]) else float(ensemble.escapeTime[i]),
+            "jacobiDrift" : float(maxDrift[i]),
+            "final" : [float(j) for j in ensemble.state[:, i]],
+            "boundTo" : int(bound[i]),
+        })
+
+    return results
+
+def _run_task(task):
+    """
+    Work for one pool process: run a batch and put every result in the cache as soon as the
+    batch is done
+
+    """
+
+    folder, l, states, keys, settings = task
+    cache = ResultCache(folder)
+    results = run_batch(l, np.array(states).T, settings)
+    for key, result in zip(keys, results):
+        cache.put(key, result)
+
+    return len(keys)
+
+def run_sweep(spec, folder=CACHE_FOLDER, workers=None, batchSize=256, progress=True):
+    """
+    Run every combination of lambda and initial state in spec (see load_spec) that isn't in
+    the cache yet, over a process pool, and return all the results as arrays with a first axis
+    over lambda and a second over initial states. Runs with an adaptive integrator are done one
+    at a time, since particles in an ensemble share its steps and a result could otherwise
+    depend on what else was in the batch
+
+    """
+
+    ls, states, settings = load_spec(spec)
+    version = code_version()
+    cache = ResultCache(folder)
+    size = 1 if INTEGRATORS[settings["integrator"]].adaptive else batchSize
+
+    keys = [[run_key(l, state, settings, version) for state in states] for l in ls]
+
+    tasks = []
+    for l, row in zip(ls, keys):
+        missing = [i for i, key in enumerate(row) if cache.get(key) is None]
+        for start in range(0, len(missing), size):
+            batch = missing[start:start + size]
+            tasks.append((folder, l, [states[i] for i in batch], [row[i] for i in batch], settings))
+
+    total = len(ls)*len(states)
+    computed = sum(len(task[3]) for task in tasks)
+    if progress:
+        print("{} runs, {} cached, {} to compute".format(total, total - computed, computed), file=sys.stderr)
+
+    if tasks:
+        started = time.perf_counter()
+        done = 0
+        with Pool(workers) as pool:
+            for count in pool.imap_unordered(_run_task, tasks):
+                done += count
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    print("{}/{} runs done, {:.0f}s elapsed, ~{:.0f}s left".format(done, computed, elapsed, elapsed/done*(computed - done)), file=sys.stderr)
+
+    return collect(ls, states, keys, cache, computed)
+
+def collect(ls, states, keys, cache, computed=0):
+    """
+    Arrays of results for a grid of keys (one row per lambda)
+
+    """
+
+    shape = (len(ls), len(states))
+    results = {
+        "l" : np.array(ls),
+        "initial" : np.array(states).reshape(-1, 6),
+        "collisionTime" : np.full(shape, np.nan),
+        "collidedWith" : np.zeros(shape, dtype=np.int8),
+        "escapeTime" : np.full(shape, np.nan),
+        "jacobiDrift" : np.full(shape, np.nan),
+        "final" : np.full(shape + (6,), np.nan),
+        "boundTo" : np.zeros(shape, dtype=np.int8),
+        "computed" : computed,
+    }
+
+    for i, row in enumerate(keys):
+        for j, key in enumerate(row):
+            result = cache.get(key)
+            if result is None:
+                continue
+            for name in ("collisionTime", "escapeTime"):
+                if result[name] is not None:
+                    results[name][i, j] = result[name]
+            results["collidedWith"][i, j] = result["collidedWith"]
+            results["jacobiDrift"][i, j] = result["jacobiDrift"]
+            results["final"][i, j] = result["final"]
+            results["boundTo"][i, j] = result["boundTo"]
+
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run every combination of lambda and initial conditions in a spec over all cores, reusing cached results")
+    parser.add_argument("spec", help="json file with the ranges and settings (see README)")
+    parser.add_argument("--output", default=None, help="save all the results to this npz file")
+    parser.add_argument("--cache", default=CACHE_FOLDER, help="folder for cached results")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=256, help="runs integrated together in one process")
+    args = parser.parse_args(argv)
+
+    results = run_sweep(args.spec, args.cache, workers=args.workers, batchSize=args.batch_size)
+
+    collided = np.isfinite(results["collisionTime"])
+    escaped = np.isfinite(results["escapeTime"])
+    print("{} runs ({} computed): {} collided, {} escaped, largest Jacobi drift {:.3g}".format(
+        collided.size, results["computed"], int(collided.sum()), int(escaped.sum()), np.nanmax(results["jacobiDrift"])))
+
+    if args.output:
+        save_npz(args.output, **results)
+        print("saved {}".format(args.output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#checks that the headless physics still agrees with the window's original formulas and that runs resume exactly
+#run with: python -m pytest
+import math
+
+import numpy as np
+import pytest
+
+import engine
+from engine import Engine, make_state, calc_jacobi
+from ensemble import Ensemble
+from events import PlaneCrossing
+from lagrange import collinear_points, lagrange_point
+from checkpoint import save_engine, load_engine, run_checkpointed
+
+LAMBDAS = (0.05, 0.3, 0.5, 0.7, 0.95)
+
+STATES = [
+    (0.5, 0.2, 0.0, 0.1, -0.3, 0.0),
+    (-1.2, 0.4, 0.3, 0.0, 0.2, -0.1),
+    (0.1, -0.8, -0.2, 0.5, 0.0, 0.4),
+]
+
+def sim_acceleration(x, y, z, xVel, yVel, zVel, l):
+    """
+    Sim's _calc_d2dx, _calc_d2dy and _calc_d2dz run on a Sim that is made but never opened
+
+    """
+
+    pytest.importorskip("pygame")
+    import main
+
+    main.Sim.windowWidth = 1280 #skips looking up the monitor
+    main.Sim.windowHeight = 800
+
+    sim = main.Sim(x, y, z, xVel, yVel, zVel, l=l)
+    sim._calc_d2dx()
+    sim._calc_d2dy()
+    sim._calc_d2dz()
+
+    return sim.thirdXacc, sim.thirdYacc, sim.thirdZacc
+
+def old_jacobi(x, y, z, xVel, yVel, zVel, l):
+    #written out the long way, with body 1 (mass 1-l) at x=l and body 2 (mass l) at x=l-1
+    r1 = math.sqrt((x - l)**2 + y**2 + z**2)
+    r2 = math.sqrt((x + 1 - l)**2 + y**2 + z**2)
+
+    return x**2 + y**2 + 2*(1-l)/r1 + 2*l/r2 - (xVel**2 + yVel**2 + zVel**2)
+
+def old_collinear_roots(l):
+    """
+    Real roots of the polynomials the window used to find L1, L2 and L3 with np.roots
+
+    """
+
+    polynomials = [
+        [-1, (4*l - 2), (-6*(l**2) + 6*l - 1), (4*(l**3) - 6*(l**2) + 4*l - 1), (-(l**4) + 2*(l**3) - 5*(l**2) + 4*l - 2), (2*(l**3) - 3*(l**2) + 3*l - 1)], #L1
+        [-1, (4*l - 2), (-6*(l**2) + 6*l - 1), (4*(l**3) - 6*(l**2) + 2*l - 1), (-(l**4) + 2*(l**3) - l**2 + 4*l - 2), (-3*(l**2) + 3*l - 1)], #L2
+        [-1, (4*l - 2), (-6*(l**2) + 6*l - 1), (4*(l**3) - 6*(l**2) + 2*l + 1), (-(l**4) + 2*(l**3) - l**2 - 4*l + 2), (3*(l**2) - 3*l + 1)], #L3
+    ]
+
+    return [[i.real for i in np.roots(coefficients) if abs(i.imag) < 1e-9] for coefficients in polynomials]
+
+@pytest.mark.parametrize("l", LAMBDAS)
+@pytest.mark.parametrize("state", STATES)
+def test_acceleration_matches_sim(state, l):
+    fused = engine.acceleration(*state, l)
+    assert np.allclose(fused, sim_acceleration(*state, l), rtol=1e-12, atol=1e-12)
+
+@pytest.mark.parametrize("l", LAMBDAS)
+@pytest.mark.parametrize("state", STATES)
+def test_jacobi_matches_formula(state, l):
+    accelerations = engine.acceleration_and_jacobi(*state, l)
+    assert np.allclose(accelerations[:3], engine.acceleration(*state, l), rtol=1e-12, atol=1e-12)
+    assert accelerations[3] == pytest.approx(old_jacobi(*state, l), rel=1e-12)
+    assert calc_jacobi(make_state(*state), l) == pytest.approx(old_jacobi(*state, l), rel=1e-12)
+
+def test_acceleration_arrays_match_scalars():
+    states = np.array(STATES).T
+    fused = np.array(engine.acceleration(*states, 0.7))
+    for i, state in enumerate(STATES):
+        assert np.allclose(fused[:, i], engine.acceleration(*state, 0.7), rtol=1e-12, atol=1e-15)
+
+@pytest.mark.parametrize("l", LAMBDAS)
+def test_collinear_points_match_np_roots(l):
+    points = collinear_points(l)
+    for number, (x, roots) in enumerate(zip(points, old_collinear_roots(l)), 1):
+        assert min(abs(x - root) for root in roots) < 1e-8, "L{} for lambda {}".format(number, l)
+        assert lagrange_point(number, l) == pytest.approx((x, 0.0, 0.0))
+
+    #and they really are equilibria
+    for number in (1, 2, 3, 4, 5):
+        assert np.allclose(engine.acceleration(*lagrange_point(number, l), 0, 0, 0, l), 0, atol=1e-10)
+
+@pytest.mark.parametrize("integrator", ["kinematic", "rk4", "rk45", "leapfrog"])
+def test_engine_resume_is_exact(tmp_path, integrator):
+    path = str(tmp_path / "engine.npz")
+
+    full = Engine.from_initial(*STATES[0], l=0.7, deltaT=0.001, integrator=integrator)
+    full.step(200)
+
+    stopped = Engine.from_initial(*STATES[0], l=0.7, deltaT=0.001, integrator=integrator)
+    stopped.step(100)
+    save_engine(path, stopped, {"steps" : 100})
+    resumed, extra = load_engine(path)
+    resumed.step(200 - extra["steps"])
+
+    assert resumed.t == full.t
+    assert np.array_equal(resumed.state, full.state)
+
+def make_ensemble():
+    states = np.array(STATES + [(0.69, 0.0, 0.0, 0.0, 0.0, 0.0)]).T #the last one starts next to body 1 and hits it
+    return Ensemble(states, l=0.7, deltaT=0.001, integrator="rk45", events=[PlaneCrossing(axis=1, value=0.0)])
+
+def test_run_checkpointed_resume_is_exact(tmp_path):
+    full = run_checkpointed(make_ensemble, 4.0, str(tmp_path / "full.npz"), 1.0)
+
+    #stopped after two segments
+    path = str(tmp_path / "stopped.npz")
+    stopped = make_ensemble()
+    stopped.run(1.0)
+    stopped.run(1.0)
+    save_engine(path, stopped, {"segments" : 2})
+
+    def fail():
+        raise AssertionError("should have carried on from the checkpoint")
+
+    resumed = run_checkpointed(fail, 4.0, path, 1.0)
+
+    assert resumed.t == full.t
+    assert np.array_equal(resumed.state, full.state)
+    assert np.array_equal(resumed.collided, full.collided)
+    assert np.array_equal(resumed.collisionTime, full.collisionTime, equal_nan=True)
+    assert np.array_equal(resumed.eventLog.records, full.eventLog.records)
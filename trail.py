@@ -0,0 +1,141 @@
+#path of previous positions kept in a fixed size numpy ring buffer
+import numpy as np
+
+class Trail:
+    """
+    Ring buffer of (x, y) positions. Adding a point overwrites the oldest one once the buffer
+    is full, so adding is O(1) no matter how long the trail is. Drawing converts the whole
+    trail to screen coordinates at once. Short trails are drawn as a handful of polylines
+    (one per color band), long ones (pixelThreshold points or more) are written straight into
+    the surface's pixels since they are dense enough to look like a line anyway
+
+    """
+
+    def __init__(self, capacity=1200, bands=32, pixelThreshold=20000):
+        self.capacity = capacity
+        self.bands = bands #number of color steps in the fade from old to new
+        self.pixelThreshold = pixelThreshold
+        self._gradient = None #(surface masks and color it was made for, mapped pixel values) for drawing straight to pixels
+        self.points = np.empty((capacity, 2)) #storage, oldest point is at self.head once full
+        self.head = 0 #where the next point goes
+        self.count = 0 #number of points stored
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def add(self, x, y):
+        """
+        Add one position to the end of the trail
+
+        """
+
+        self.points[self.head] = (x, y)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def extend(self, points):
+        """
+        Add an (n, 2) array (or list of (x, y)) of positions in order
+
+        """
+
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) >= self.capacity: #only the newest ones fit
+            self.points[:] = points[-self.capacity:]
+            self.head = 0
+            self.count = self.capacity
+            return
+
+        end = self.head + len(points)
+        if end <= self.capacity:
+            self.points[self.head:end] = points
+        else: #wrap around
+            split = self.capacity - self.head
+            self.points[self.head:] = points[:split]
+            self.points[:end - self.capacity] = points[split:]
+
+        self.head = end % self.capacity
+        self.count = min(self.count + len(points), self.capacity)
+
+    def ordered(self):
+        """
+        Stored positions from oldest to newest as an (n, 2) array
+
+        """
+
+        if self.count < self.capacity:
+            return self.points[:self.count]
+
+        return np.concatenate((self.points[self.head:], self.points[:self.head]))
+
+    def to_screen(self, centerX, centerY, scale):
+        """
+        Pixel coordinates of the whole trail (y flipped so increasing y is up)
+
+        """
+
+        screen = self.ordered() * (scale, -scale) + (centerX, centerY)
+
+        return np.clip(screen, -1e6, 1e6).astype(np.int32) #keep far away points from overflowing pygame's ints
+
+    def draw(self, surface, centerX, centerY, scale, width, color=(0, 0, 200)):
+        """
+        Draw the trail fading in from black (oldest) to color (newest). Brightness is based on
+        the position in the full buffer, like the old per point circles, so a short trail
+        is still dark. Returns the Rect that was drawn to (None if nothing was drawn)
+
+        """
+
+        import pygame #only needed for drawing
+
+        if self.count < 2:
+            return None
+
+        screen = self.to_screen(centerX, centerY, scale)
+        offset = self.capacity - self.count #index in a full trail of the oldest point stored
+
+        if self.count >= self.pixelThreshold and surface.get_bytesize() == 4:
+            return self._draw_pixels(surface, screen, offset, color)
+
+        edges = np.linspace(0, self.count, min(self.bands, self.count - 1) + 1).astype(int)
+
+        rects = []
+        for start, end in zip(edges[:-1], edges[1:]):
+            brightness = (offset + (start + end)/2) / self.capacity
+            bandColor = tuple(int(c * brightness) for c in color)
+            rects.append(pygame.draw.lines(surface, bandColor, False, screen[start:end + 1], max(1, width))) #+1 so neighbouring bands join up
+
+        return rects[0].unionall(rects[1:])
+
+    def _draw_pixels(self, surface, screen, offset, color, levels=256):
+        """
+        Write each point as a single pixel, colored from a gradient that is only mapped to the
+        surface's pixel format once
+
+        """
+
+        import pygame
+
+        key = (surface.get_masks(), color)
+        if self._gradient is None or self._gradient[0] != key:
+            shades = [tuple(int(c * i/(levels - 1)) for c in color) for i in range(levels)]
+            self._gradient = (key, np.array([surface.map_rgb(shade) for shade in shades], dtype=np.uint32))
+
+        shade = (np.arange(offset, offset + self.count) * (levels - 1)) // self.capacity #gradient level of each point
+
+        pixels = pygame.surfarray.pixels2d(surface) #locks the surface until it is deleted
+        width, height = pixels.shape
+        x, y = screen[:, 0], screen[:, 1]
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        pixels[x[inside], y[inside]] = self._gradient[1][shade[inside]] #later (brighter) points win where they overlap
+        del pixels
+
+        if not inside.any():
+            return None
+
+        left, top = x[inside].min(), y[inside].min()
+        return pygame.Rect(int(left), int(top), int(x[inside].max() - left) + 1, int(y[inside].max() - top) + 1)
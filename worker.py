@@ -0,0 +1,128 @@
+#runs the physics in a background thread so it doesn't have to wait on rendering
+import threading, queue, time
+from collections import namedtuple
+
+from engine import together_step
+from jacobi import JacobiMonitor
+from events import ImpactWatcher
+
+#everything the render loop needs from the worker at one point in time (jacobi is from the start of the last chunk, halted is why the worker stopped early, if it did)
+Snapshot = namedtuple("Snapshot", ["t", "steps", "x", "y", "z", "xVel", "yVel", "zVel", "xAcc", "yAcc", "zAcc", "collided", "jacobi", "deltaT", "halted"])
+
+class SimulationWorker(threading.Thread):
+    """
+    Steps one third body with the "together" update in its own thread. After every chunk of
+    steps it publishes a new Snapshot by swapping the snapshot attribute. The old snapshot
+    is never changed, so whoever reads worker.snapshot always gets a complete state without
+    any locking. Trail positions (one every trailEvery steps) go into the trail queue for
+    the render loop to pick up
+
+    stepsPerSecond keeps the simulation going at a steady speed no matter the frame rate
+    (None runs it as fast as it can). If recorder is set to a recorder.Recorder, a row is
+    saved every recorder.decimation steps
+
+    The Jacobi constant is worked out on the first step of every chunk (sharing the distance
+    calculations with the accelerations) and fed to monitor. If the monitor has a threshold and
+    the drift passes it, jacobiAction says what to do: "stop" halts the run, "refine" halves
+    deltaT (down to minDeltaT) and carries on
+
+    """
+
+    def __init__(self, x, y, z, xVel, yVel, zVel, l, deltaT=0.00001, stepsPerSecond=60000, trailEvery=100, bodyRadius=0.02, thirdRadius=0.01, monitor=None, jacobiAction="stop", minDeltaT=1e-9, t=0.0):
+        super().__init__(daemon=True) #don't keep python alive if the window closes
+        self.l = l
+        self.deltaT = deltaT
+        self.stepsPerSecond = stepsPerSecond
+        self.trailEvery = trailEvery
+
+        self.impacts = ImpactWatcher(l, bodyRadius + thirdRadius) #same 3D collisions as Sim._step_together
+
+        self.trail = queue.SimpleQueue() #(x, y) positions for the path
+        self.snapshot = Snapshot(t, 0, x, y, z, xVel, yVel, zVel, None, None, None, False, None, deltaT, None) #t is where a resumed run got to
+
+        self.monitor = JacobiMonitor() if monitor is None else monitor
+        self.jacobiAction = jacobiAction
+        self.minDeltaT = minDeltaT
+
+        self.recorder = None #can be set or unset while the thread is running
+
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        t, steps, x, y, z, xVel, yVel, zVel, xAcc, yAcc, zAcc, collided, jacobi, deltaT, halted = self.snapshot
+        l = self.l
+        monitor = self.monitor
+        impacts = self.impacts
+        start = time.perf_counter()
+        sinceRecord = 0 #steps since the last recorded row
+
+        while not collided and halted is None and not self._stopEvent.is_set():
+            self.trail.put((x, y))
+
+            taken = 0.0 #steps done this chunk (the last one can be partial if it hits a body)
+            for i in range(self.trailEvery):
+                before = (x, y, z, xVel, yVel, zVel)
+                if i == 0: #Jacobi constant once per chunk, so it costs next to nothing
+                    x, y, z, xVel, yVel, zVel, xAcc, yAcc, zAcc, jacobi = together_step(x, y, z, xVel, yVel, zVel, l, deltaT, withJacobi=True)
+                else:
+                    x, y, z, xVel, yVel, zVel, xAcc, yAcc, zAcc = together_step(x, y, z, xVel, yVel, zVel, l, deltaT)
+
+                hit = impacts.check(before, (x, y, z, xVel, yVel, zVel), (xAcc, yAcc, zAcc), deltaT)
+                if hit is not None: #stop at the surface
+                    body, fraction, (x, y, z, xVel, yVel, zVel) = hit
+                    xVel = yVel = zVel = 0
+                    collided = True
+                    taken += fraction
+                else:
+                    taken += 1
+
+                recorder = self.recorder
+                if recorder is not None:
+                    sinceRecord += 1
+                    if sinceRecord >= recorder.decimation or collided:
+                        recorder.record(t + taken*deltaT, x, y, z, xVel, yVel, zVel, xAcc, yAcc, zAcc)
+                        sinceRecord = 0
+
+                if collided:
+                    self.trail.put((x, y))
+                    break
+
+            steps += i + 1
+            t += taken * deltaT
+
+            if monitor.update(jacobi): #drift is over the threshold
+                if self.jacobiAction == "refine" and deltaT/2 >= self.minDeltaT:
+                    deltaT /= 2
+                    monitor.rebase()
+                else:
+                    halted = "Jacobi drift over {}".format(monitor.threshold)
+
+            self.snapshot = Snapshot(t, steps, x, y, z, xVel, yVel, zVel, xAcc, yAcc, zAcc, collided, jacobi, deltaT, halted) #swapping the reference is atomic
+
+            if self.stepsPerSecond is not None: #wait if we are ahead of where we should be
+                ahead = steps/self.stepsPerSecond - (time.perf_counter() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def stop(self):
+        """
+        Stop the thread and wait for it to finish
+
+        """
+
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join()
+
+    def drain_trail(self):
+        """
+        All trail positions produced since the last call
+
+        """
+
+        points = []
+        while True:
+            try:
+                points.append(self.trail.get_nowait())
+            except queue.Empty:
+                return points